@@ -0,0 +1,67 @@
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks import harness
+
+"""
+Runs the offline benchmarks: python -m benchmarks [--filter chat] [--check]
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline Termify benchmarks.")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, help="Repetitions per benchmark (default: per benchmark)")
+    parser.add_argument(
+        "--latency-scale", type=float, default=1.0,
+        help="Multiplier for the injected Snowflake latency; 0 measures local overhead only",
+    )
+    parser.add_argument("--history", default=harness.DEFAULT_HISTORY, help="JSONL file the results are appended to")
+    parser.add_argument("--no-save", action="store_true", help="Don't append this run to the history")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown that counts as a regression (0.2 = 20%%)")
+    parser.add_argument("--window", type=int, default=5, help="Number of earlier runs the baseline is taken from")
+    parser.add_argument(
+        "--baseline", default=harness.DEFAULT_BASELINE,
+        help="Committed baseline used for benchmarks without earlier runs in the history",
+    )
+    parser.add_argument("--update-baseline", action="store_true", help="Write this run's medians to the baseline")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 when a benchmark regressed or failed")
+    parser.add_argument("--record", action="store_true", help="Re-record the fixtures from the live Snowflake account")
+    return parser.parse_args(argv)
+
+
+def record():
+    sys.path.append(os.path.join(harness.ROOT, "snowflake"))
+    from snowflake.main import RAG
+    from utils.sessions import get_connector
+    from benchmarks.fakes import Fixtures, record_fixtures
+
+    queries = list(Fixtures.load().search)
+    path = record_fixtures(RAG(None, None, connector=get_connector()), queries)
+    print(f"Recorded {len(queries)} queries to {path}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.record:
+        record()
+        return 0
+    harness.OPTIONS["latency_scale"] = args.latency_scale
+    _, regressions, failures = harness.run(
+        pattern=args.filter,
+        repeat=args.repeat,
+        history_path=args.history,
+        save=not args.no_save,
+        threshold=args.threshold,
+        window=args.window,
+        baseline_path=args.baseline,
+        update_baseline=args.update_baseline,
+    )
+    return 1 if args.check and (regressions or failures) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import asyncio
+from benchmarks.fakes import Fixtures, FakeConnector, fake_complete, fake_summarize
+from benchmarks.harness import benchmark, latency_profile, ROOT
+
+sys.path.append(os.path.join(ROOT, "snowflake"))
+
+"""
+Chat-turn latency: full `RAG.query` turns (retrieval, prompt, streamed completion and the
+background history summary) against the fakes. Per-turn latencies are reported as percentiles.
+"""
+
+TURNS = 4
+
+
+def make_rag():
+    from snowflake.main import RAG
+    from utils.cache import retrieval_cache
+
+    retrieval_cache.invalidate()
+    fixtures = Fixtures.load()
+    latency = latency_profile()
+    return RAG(
+        None,
+        None,
+        connector=FakeConnector(fixtures, latency),
+        completion_fn=fake_complete(fixtures, latency),
+        summarize_fn=fake_summarize(latency),
+    )
+
+
+def _turns(run_turn):
+    queries = list(Fixtures.load().search)[:TURNS]
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        run_turn(query)
+        samples.append(time.perf_counter() - started)
+    return {"items": len(queries), "samples": samples}
+
+
+@benchmark(repeat=3, setup=make_rag, unit="turns")
+def chat_turn(rag):
+    return _turns(lambda query: rag.query(query, False))
+
+
+@benchmark(repeat=3, setup=make_rag, unit="turns")
+def chat_turn_first_token(rag):
+    """Time until the first streamed token, what the user waits for."""
+    samples = []
+    for query in list(Fixtures.load().search)[:TURNS]:
+        started = time.perf_counter()
+        stream = rag.stream_query(query, False)
+        next(stream)
+        samples.append(time.perf_counter() - started)
+        for _ in stream:
+            pass
+    return {"items": len(samples), "samples": samples}
+
+
+@benchmark(repeat=3, setup=make_rag, unit="turns")
+def chat_turn_with_user_service(rag):
+    """Shared and user service searched concurrently (`RAG.aquery`)."""
+    return _turns(lambda query: asyncio.run(rag.aquery(query, "BENCH_USER", "BENCH_SERVICE")))
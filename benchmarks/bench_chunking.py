@@ -0,0 +1,46 @@
+import asyncio
+from functools import lru_cache
+from utils.doc_utils import DocumentProcessor
+from benchmarks.fakes import Fixtures, make_pdf
+from benchmarks.harness import benchmark
+
+"""
+Chunking throughput: the text splitter and cleaner, and PDF parsing plus chunking.
+"""
+
+
+@lru_cache(maxsize=None)
+def policy_text(size=1_000_000):
+    """About `size` characters of policy text built from the recorded chunks."""
+    corpus = Fixtures.load().corpus
+    parts, length, i = [], 0, 0
+    while length < size:
+        chunk = corpus[i % len(corpus)]
+        parts.append(f"Section {i}. {chunk}")
+        length += len(parts[-1]) + 2
+        i += 1
+    return "\n\n".join(parts)
+
+
+@lru_cache(maxsize=None)
+def policy_pdf(pages=50):
+    text = policy_text()
+    page_size = 3000
+    return make_pdf([text[i * page_size:(i + 1) * page_size] for i in range(pages)])
+
+
+@benchmark(repeat=5, unit="chunks")
+def chunk_text():
+    processor = DocumentProcessor(chunk_size=700, overlap=50)
+    return sum(1 for _ in processor.iter_text_chunks(policy_text()))
+
+
+@benchmark(repeat=3, unit="chunks")
+def chunk_pdf():
+    processor = DocumentProcessor(chunk_size=700, overlap=50)
+    pdf = policy_pdf()
+
+    async def collect():
+        return [chunk async for chunk in processor.iter_chunks(pdf)]
+
+    return len(asyncio.run(collect()))
@@ -0,0 +1,129 @@
+import os
+import sys
+import subprocess
+from benchmarks.harness import benchmark, ROOT
+
+"""
+Cold-start import cost: each import set runs in a fresh interpreter under `python -X importtime`,
+the way a new container (or Streamlit's first script run) loads it. A set fails when it imports a
+module that should only load on first use, or when its import time exceeds the budget.
+
+Third-party modules a set needs anyway (its `prelude`, e.g. streamlit) are imported before the
+measurement starts, so the budget covers what this repository pulls in. `IMPORT_BUDGET_SCALE`
+multiplies all budgets for slower machines.
+"""
+
+_MARKER = "-- termify import start --"
+
+# Heavy stacks that must stay out of a cold start: Snowflake clients, PDF/dataframe/arrow
+# libraries, evaluation and ingestion-only modules.
+HEAVY = (
+    "snowflake.cortex",
+    "snowflake.core",
+    "snowflake.snowpark",
+    "snowflake.connector",
+    "pyarrow",
+    "pypdf",
+    "pandas",
+    "numpy",
+    "langchain",
+    "langchain_community",
+    "trulens",
+    "tqdm",
+    "dbCreator",
+    "utils.datasets",
+)
+
+IMPORT_SETS = {
+    # what streamlit/app.py imports before rendering the first page
+    "app": {
+        "prelude": ["streamlit", "dotenv"],
+        "modules": [
+            "utils.sessions",
+            "snowflake.main",
+            "utils.answer_cache",
+            "utils.service_pool",
+            "utils.retrieval",
+            "utils.companies",
+            "utils.hybrid",
+        ],
+        "forbidden": HEAVY + ("utils.Custom_cortex", "utils.doc_utils", "utils.bulk_loader"),
+        "budget_ms": 250,
+    },
+    # the upload stack, loaded with the first upload
+    "upload": {
+        "prelude": ["streamlit", "dotenv"],
+        "modules": ["utils.Custom_cortex"],
+        "forbidden": HEAVY,
+        "budget_ms": 150,
+    },
+    # run.py only parses the command line before handing over to a subcommand
+    "run": {
+        "prelude": [],
+        "modules": ["run"],
+        "forbidden": HEAVY + ("streamlit", "utils", "snowflake", "benchmarks"),
+        "budget_ms": 50,
+    },
+}
+
+
+def import_profile(modules, prelude=()):
+    """Imports `modules` in a fresh interpreter; returns ({module: cumulative seconds}, total seconds)."""
+    code = "import sys\n"
+    code += "".join(f"import {name}\n" for name in prelude)
+    code += f"sys.stderr.write({_MARKER!r} + '\\n')\n"
+    code += "".join(f"import {name}\n" for name in modules)
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=120,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "import failed")
+
+    lines = completed.stderr.splitlines()
+    lines = lines[lines.index(_MARKER) + 1:] if _MARKER in lines else lines
+    profile, total = {}, 0.0
+    for line in lines:
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        profile[name.strip()] = int(cumulative) / 1e6
+        # Nested imports are indented; top-level lines add up to the time of the whole set.
+        if not name[1:].startswith(" "):
+            total += int(cumulative) / 1e6
+    return profile, total
+
+
+def check_imports(set_name):
+    spec = IMPORT_SETS[set_name]
+    profile, seconds = import_profile(spec["modules"], spec["prelude"])
+
+    loaded = [
+        name for name in profile
+        if any(name == heavy or name.startswith(heavy + ".") for heavy in spec["forbidden"])
+    ]
+    if loaded:
+        raise AssertionError(f"imports {', '.join(sorted(loaded))} at start-up")
+
+    budget = spec["budget_ms"] * float(os.environ.get("IMPORT_BUDGET_SCALE", 1.0)) / 1000
+    if seconds > budget:
+        raise AssertionError(f"import takes {seconds * 1000:.0f} ms, budget {budget * 1000:.0f} ms")
+    return {"items": 1, "samples": [seconds]}
+
+
+@benchmark(repeat=3, unit="imports")
+def import_app():
+    return check_imports("app")
+
+
+@benchmark(repeat=3, unit="imports")
+def import_upload():
+    return check_imports("upload")
+
+
+@benchmark(repeat=3, unit="imports")
+def import_run():
+    return check_imports("run")
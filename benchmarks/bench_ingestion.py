@@ -0,0 +1,69 @@
+import os
+import json
+import asyncio
+import tempfile
+from functools import lru_cache
+from utils.datasets import FileProcessor
+from utils.bulk_loader import StageLoader
+from benchmarks.fakes import Fixtures, FakeConnector, FakeSession, make_pdf
+from benchmarks.harness import benchmark, latency_profile
+from benchmarks.bench_chunking import policy_text
+
+"""
+Ingestion end to end against the fake session: the dataset load (`FileProcessor` with dedup into
+a `StageLoader`) and a user upload (`customCortex.Create_service`).
+"""
+
+COMPANIES = 40
+FILES_PER_COMPANY = 3
+
+
+@lru_cache(maxsize=None)
+def dataset_dir():
+    """A dataset folder of JSON policies. Companies share clauses, as real policies do."""
+    directory = tempfile.mkdtemp(prefix="termify_bench_dataset_")
+    corpus = Fixtures.load().corpus
+    for company in range(COMPANIES):
+        folder = os.path.join(directory, f"Company{company:03d}")
+        os.makedirs(folder)
+        for n in range(FILES_PER_COMPANY):
+            clauses = [corpus[(company * 7 + n * 3 + i) % len(corpus)] for i in range(12)]
+            clauses.append(f"Company{company:03d} policy {n} was last updated on day {company + n}.")
+            with open(os.path.join(folder, f"policy_{n}.json"), "w", encoding="utf-8") as f:
+                json.dump({"policy": clauses}, f)
+    return directory
+
+
+class _Rows:
+    def __init__(self):
+        self.rows = 0
+
+    def writerow(self, row):
+        self.rows += 1
+
+
+@benchmark(repeat=3, unit="files")
+def ingest_dataset():
+    session = FakeSession(latency_profile())
+    processor = FileProcessor(dataset_dir(), None, chunksize=800, overlap=50, workers=1, dedup=True)
+    loader = StageLoader(session, "BENCH.PUBLIC.DATA", {"NAME": "VARCHAR", "DATA": "VARCHAR", "SOURCE": "VARCHAR",
+                                                       "PAGE": "NUMBER", "CHUNK_ID": "VARCHAR", "SIMHASH": "VARCHAR"})
+    with loader:
+        summary = asyncio.run(processor.process(writer=loader, names_writer=_Rows()))
+    return summary["files"]
+
+
+@benchmark(repeat=3, unit="chunks")
+def ingest_upload():
+    from utils.Custom_cortex import customCortex
+
+    text = policy_text()
+    pdf = make_pdf([text[i * 3000:(i + 1) * 3000] for i in range(20)])
+    connector = FakeConnector(Fixtures.load(), latency_profile())
+    cortex = customCortex(None, None, "BENCH_USER", "BENCH_SERVICE", connector=connector)
+    messages = []
+    if not asyncio.run(cortex.Create_service(pdf, progress=lambda message, fraction: messages.append(message))):
+        raise RuntimeError(f"Create_service failed: {messages[-1] if messages else ''}")
+    # "_store_data" reports "Saved <n> chunks" once the load is committed.
+    saved = [message for message in messages if message.startswith("Saved ")]
+    return int(saved[-1].split()[1]) if saved else None
@@ -0,0 +1,69 @@
+import os
+import sys
+from functools import lru_cache
+from benchmarks.fakes import Fixtures, FakeConnector
+from benchmarks.harness import benchmark, latency_profile, ROOT
+
+sys.path.append(os.path.join(ROOT, "snowflake"))
+
+"""
+Retrieval and prompt assembly: `RAG.retrieve_context` against the fake search service (cold and
+cached) followed by `create_prompt`, and the in-process `LocalVectorIndex`.
+"""
+
+
+@lru_cache(maxsize=None)
+def queries():
+    return list(Fixtures.load().search)
+
+
+def make_rag():
+    from snowflake.main import RAG
+    from utils.cache import retrieval_cache
+
+    retrieval_cache.invalidate()
+    return RAG(None, None, connector=FakeConnector(Fixtures.load(), latency_profile()))
+
+
+def _retrieve_and_prompt(rag):
+    for query in queries():
+        rag.create_prompt(query, rag.retrieve_context(query, False))
+    return len(queries())
+
+
+@benchmark(repeat=3, setup=make_rag, unit="queries")
+def retrieve_and_prompt(rag):
+    return _retrieve_and_prompt(rag)
+
+
+def make_warm_rag():
+    rag = make_rag()
+    _retrieve_and_prompt(rag)
+    return rag
+
+
+@benchmark(repeat=5, setup=make_warm_rag, unit="queries")
+def retrieve_cached_and_prompt(rag):
+    return _retrieve_and_prompt(rag)
+
+
+@lru_cache(maxsize=None)
+def local_index(chunks=20000):
+    import tempfile
+    from utils.retrieval import LocalIndexWriter, LocalVectorIndex
+
+    corpus = Fixtures.load().corpus
+    path = tempfile.mkdtemp(prefix="termify_bench_index_")
+    with LocalIndexWriter(path) as writer:
+        for i in range(chunks):
+            writer.writerow({"name": f"Company{i % 200}", "data": f"{corpus[i % len(corpus)]} Clause {i}.",
+                             "chunk_id": str(i)})
+    return LocalVectorIndex.open(path)
+
+
+@benchmark(repeat=5, unit="queries")
+def local_index_search():
+    index = local_index()
+    for query in queries():
+        index.search(query=query, columns=["DATA"], limit=5)
+    return len(queries())
@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+"""
+Snowflake stand-ins for the benchmarks
+
+Local fakes of what the app calls on Snowflake, so `DocumentProcessor`, `FileProcessor`, `RAG`
+and `customCortex` can be timed without credentials:
+
+    FakeSession: `sql(...).collect()` and `file.put(...)`. Statements are recorded.
+    FakeRoot: `databases[db].schemas[schema].cortex_search_services[name]` and `.drop()`.
+    FakeSearchService: `search(query, columns, limit, filter=None)` answered from fixtures.
+    FakeConnector: `lease()` / `root_for()` / `get_session()` like `utils.sessions.SnowflakeConnector`.
+    fake_complete / fake_summarize: drop-in `completion_fn` / `summarize_fn` for `RAG`.
+
+Every remote call sleeps for a latency drawn from a `LatencyProfile`. The default profile uses
+typical round trips (tens of ms for SQL and search, first token after ~0.3s). `scale` multiplies
+all of them, and `LatencyProfile.none()` turns them off to measure local overhead only.
+
+Search results and completions come from recorded fixtures (`fixtures/recorded.json`):
+`search` maps a normalized query to its chunks, `completions` holds the answers. Queries
+without a recording get chunks picked deterministically from the recorded corpus.
+`record_fixtures` refreshes the file from a live account.
+"""
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "recorded.json")
+
+
+class LatencyProfile:
+    DEFAULTS = {
+        "sql": 0.03,
+        "put": 0.05,
+        "search": 0.08,
+        "first_token": 0.3,
+        "token": 0.01,
+        "summarize": 0.4,
+    }
+
+    def __init__(self, scale=1.0, jitter=0.2, seed=0, **overrides):
+        self.scale = scale
+        self.jitter = jitter
+        self.means = {**self.DEFAULTS, **overrides}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def none(cls):
+        return cls(scale=0.0)
+
+    def delay(self, kind):
+        mean = self.means.get(kind, 0.0) * self.scale
+        if mean <= 0:
+            return 0.0
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        return mean * factor
+
+    def sleep(self, kind):
+        seconds = self.delay(kind)
+        if seconds:
+            time.sleep(seconds)
+
+
+def _normalize(query):
+    return " ".join(query.lower().split())
+
+
+class Fixtures:
+    def __init__(self, search=None, completions=None, corpus=None):
+        self.search = {_normalize(query): results for query, results in (search or {}).items()}
+        self.completions = completions or ["I don't have the information."]
+        self.corpus = corpus or [chunk for results in self.search.values() for chunk in results]
+
+    @classmethod
+    def load(cls, path=FIXTURES_PATH):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("search"), data.get("completions"), data.get("corpus"))
+
+    def results_for(self, query, limit):
+        recorded = self.search.get(_normalize(query))
+        if recorded is not None:
+            return recorded[:limit]
+        if not self.corpus:
+            return []
+        start = sum(map(ord, _normalize(query))) % len(self.corpus)
+        return [self.corpus[(start + i) % len(self.corpus)] for i in range(min(limit, len(self.corpus)))]
+
+    def completion_for(self, prompt):
+        return self.completions[sum(map(ord, prompt[-64:])) % len(self.completions)]
+
+
+class _Collectable:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def collect(self):
+        return self.rows
+
+    def to_local_iterator(self):
+        return iter(self.rows)
+
+
+class _FakeFileOperation:
+    def __init__(self, session):
+        self.session = session
+
+    def put(self, local_file_name, stage_location, **options):
+        size = os.path.getsize(local_file_name) if os.path.exists(local_file_name) else 0
+        self.session.put_bytes += size
+        self.session.latency.sleep("put")
+        return [_Collectable()]
+
+
+class FakeSession:
+    def __init__(self, latency=None):
+        self.latency = latency or LatencyProfile()
+        self.statements = []
+        self.put_bytes = 0
+        self.file = _FakeFileOperation(self)
+        self._lock = threading.Lock()
+
+    def sql(self, statement, params=None):
+        with self._lock:
+            self.statements.append(" ".join(statement.split()))
+        self.latency.sleep("sql")
+        return _Collectable()
+
+    def close(self):
+        pass
+
+
+class _SearchResponse:
+    def __init__(self, results):
+        self.results = results
+
+
+class FakeSearchService:
+    def __init__(self, fixtures, latency=None):
+        self.fixtures = fixtures
+        self.latency = latency or LatencyProfile()
+        self.calls = 0
+
+    def search(self, query, columns, limit, filter=None, **options):
+        self.calls += 1
+        self.latency.sleep("search")
+        return _SearchResponse([
+            {column: chunk for column in columns} for chunk in self.fixtures.results_for(query, limit)
+        ])
+
+
+class _Registry(dict):
+    """`root.databases[...]`-style lookups that create the child on first access."""
+
+    def __init__(self, factory):
+        super().__init__()
+        self._factory = factory
+
+    def __missing__(self, key):
+        value = self[key] = self._factory(key)
+        return value
+
+
+class _Resource:
+    def __init__(self, name):
+        self.name = name
+        self.dropped = False
+
+    def drop(self, *args, **kwargs):
+        self.dropped = True
+
+
+class FakeRoot:
+    def __init__(self, fixtures, latency=None):
+        self.latency = latency or LatencyProfile()
+        self.services = []
+
+        def service(name):
+            handle = FakeSearchService(fixtures, self.latency)
+            self.services.append(handle)
+            return handle
+
+        def schema(name):
+            resource = _Resource(name)
+            resource.cortex_search_services = _Registry(service)
+            return resource
+
+        def database(name):
+            resource = _Resource(name)
+            resource.schemas = _Registry(schema)
+            return resource
+
+        self.databases = _Registry(database)
+
+
+class FakeConnector:
+    def __init__(self, fixtures, latency=None):
+        self.latency = latency or LatencyProfile()
+        self.session = FakeSession(self.latency)
+        self.root = FakeRoot(fixtures, self.latency)
+
+    @contextmanager
+    def lease(self, timeout=None):
+        yield self.session
+
+    def root_for(self, session):
+        return self.root
+
+    def get_session(self):
+        return self.session
+
+    def metrics(self):
+        return {}
+
+
+def fake_complete(fixtures, latency=None, token_chars=16):
+    """Returns a `completion_fn(prompt, session)` that streams a recorded answer."""
+    latency = latency or LatencyProfile()
+
+    def complete(prompt, session):
+        answer = fixtures.completion_for(prompt)
+        latency.sleep("first_token")
+        for i in range(0, len(answer), token_chars):
+            if i:
+                latency.sleep("token")
+            yield answer[i:i + token_chars]
+
+    return complete
+
+
+def fake_summarize(latency=None, max_chars=400):
+    latency = latency or LatencyProfile()
+
+    def summarize(text, session):
+        latency.sleep("summarize")
+        return text[-max_chars:]
+
+    return summarize
+
+
+def make_pdf(pages):
+    """Returns the bytes of a minimal PDF with one page per text, readable by pypdf."""
+
+    def escape(line):
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = [text[i:i + 90] for i in range(0, len(text), 90)] or [""]
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1", "replace")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def record_fixtures(rag, queries, path=FIXTURES_PATH):
+    """Runs `queries` through a live `RAG` and saves its search results and answers as fixtures."""
+    search, completions = {}, []
+    for query in queries:
+        contexts = rag.retrieve_context(query, False)
+        search[query] = contexts
+        completions.append(rag.generate_completion(query, contexts))
+        rag.data = ""
+    corpus = sorted({chunk for results in search.values() for chunk in results})
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"search": search, "completions": completions, "corpus": corpus}, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+__all__ = [
+    "LatencyProfile",
+    "Fixtures",
+    "FakeSession",
+    "FakeRoot",
+    "FakeSearchService",
+    "FakeConnector",
+    "fake_complete",
+    "fake_summarize",
+    "make_pdf",
+    "record_fixtures",
+    "FIXTURES_PATH",
+]
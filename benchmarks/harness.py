@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import platform
+import importlib
+import statistics
+import subprocess
+
+"""
+Benchmark harness
+
+Benchmarks are plain functions in `benchmarks/bench_*.py`, registered with `@benchmark`:
+
+    @benchmark(repeat=5, setup=make_corpus)
+    def chunk_text(corpus):
+        return len(list(processor.iter_text_chunks(corpus)))
+
+`setup` runs untimed before every repetition and its result is passed in. A benchmark returns
+the number of items it processed (for throughput), or a dict with `items` and per-item
+`samples` in seconds (e.g. one latency per chat turn) so their percentiles are reported too.
+
+A benchmark that raises counts as failed, e.g. when an import-time budget is exceeded. So does
+every benchmark of a module that fails to import, reported as `<module>.*`.
+
+Results of every run are appended to a JSONL history file together with the git commit. A
+benchmark counts as regressed when its median is more than `threshold` above the median of the
+last `window` runs in the history. The history is local to a machine; a benchmark without
+comparable runs in it is compared against the committed `baseline.json` instead, which
+`--update-baseline` rewrites from the current run.
+"""
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_HISTORY = os.path.join(os.path.dirname(__file__), "history.jsonl")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Set by the command line; benchmarks read it through `latency_profile()`.
+OPTIONS = {"latency_scale": 1.0}
+
+_registry = []
+
+
+def latency_profile(**overrides):
+    from benchmarks.fakes import LatencyProfile
+
+    return LatencyProfile(scale=OPTIONS["latency_scale"], **overrides)
+
+
+class Benchmark:
+    def __init__(self, name, fn, setup=None, repeat=5, warmup=1, unit="items"):
+        self.name = name
+        self.fn = fn
+        self.setup = setup
+        self.repeat = repeat
+        self.warmup = warmup
+        self.unit = unit
+
+
+def benchmark(repeat=5, warmup=1, setup=None, unit="items"):
+    def register(fn):
+        module = fn.__module__.rsplit(".", 1)[-1].removeprefix("bench_")
+        _registry.append(Benchmark(f"{module}.{fn.__name__}", fn, setup, repeat, warmup, unit))
+        return fn
+
+    return register
+
+
+def discover(pattern=None, failures=None):
+    """
+    Imports every benchmarks/bench_*.py module and returns the matching benchmarks.
+
+    A module that fails to import is recorded in `failures` as `<module>.*` when it matches
+    `pattern`, and the other modules still run.
+    """
+    for file_name in sorted(os.listdir(os.path.dirname(__file__))):
+        if file_name.startswith("bench_") and file_name.endswith(".py"):
+            try:
+                importlib.import_module(f"benchmarks.{file_name[:-3]}")
+            except Exception as err:
+                name = f"{file_name[6:-3]}.*"
+                if failures is not None and (not pattern or pattern in name):
+                    failures[name] = f"import failed: {err!r}"
+    return [bench for bench in _registry if not pattern or pattern in bench.name]
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def measure(bench, repeat=None):
+    repeat = repeat or bench.repeat
+    timings, samples, items = [], [], None
+    for i in range(bench.warmup + repeat):
+        state = bench.setup() if bench.setup else None
+        started = time.perf_counter()
+        outcome = bench.fn(state) if bench.setup else bench.fn()
+        elapsed = time.perf_counter() - started
+        if i < bench.warmup:
+            continue
+        timings.append(elapsed)
+        if isinstance(outcome, dict):
+            items = outcome.get("items", items)
+            samples.extend(outcome.get("samples", ()))
+        elif outcome is not None:
+            items = outcome
+
+    median = statistics.median(timings)
+    result = {
+        "median": median,
+        "min": min(timings),
+        "p95": _percentile(timings, 0.95),
+        "repeat": repeat,
+        "unit": bench.unit,
+    }
+    if items:
+        result["items"] = items
+        result["throughput"] = items / median if median else None
+    if samples:
+        result["sample_p50"] = _percentile(samples, 0.5)
+        result["sample_p95"] = _percentile(samples, 0.95)
+    return result
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    runs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue
+    return runs
+
+
+def append_history(path, results):
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "latency_scale": OPTIONS["latency_scale"],
+        "results": results,
+    }
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run) + "\n")
+    return run
+
+
+def load_baseline(path):
+    """Returns {name: median} from a baseline file, empty if it is missing or for another latency."""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError) as err:
+        print(f"Ignoring baseline {path}: {err}")
+        return {}
+    if saved.get("latency_scale") != OPTIONS["latency_scale"]:
+        return {}
+    return {name: result["median"] for name, result in saved.get("results", {}).items()}
+
+
+def save_baseline(path, results):
+    baseline = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "latency_scale": OPTIONS["latency_scale"],
+        "results": {name: {"median": result["median"]} for name, result in sorted(results.items())},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+    return baseline
+
+
+def regressions(results, history, threshold=0.2, window=5, committed=None):
+    """
+    Returns (name, baseline, current, change) for benchmarks slower than their baseline.
+
+    The baseline is the median of the last `window` comparable runs in `history`, or the
+    `committed` median ({name: seconds}) for benchmarks that have none.
+    """
+    # Only runs with the same injected latency are comparable.
+    comparable = [run for run in history if run.get("latency_scale") == OPTIONS["latency_scale"]][-window:]
+    found = []
+    for name, result in results.items():
+        previous = [run["results"][name]["median"] for run in comparable if name in run.get("results", {})]
+        if previous:
+            baseline = statistics.median(previous)
+        elif committed and name in committed:
+            baseline = committed[name]
+        else:
+            continue
+        change = (result["median"] - baseline) / baseline if baseline else 0.0
+        if change > threshold:
+            found.append((name, baseline, result["median"], change))
+    return found
+
+
+def format_result(name, result):
+    line = f"{name:<36} median {result['median'] * 1000:9.1f} ms   p95 {result['p95'] * 1000:9.1f} ms"
+    if result.get("throughput"):
+        line += f"   {result['throughput']:10.1f} {result['unit']}/s"
+    if result.get("sample_p50") is not None:
+        line += f"   per {result['unit'].rstrip('s')} p50 {result['sample_p50'] * 1000:.1f} ms p95 {result['sample_p95'] * 1000:.1f} ms"
+    return line
+
+
+def run(
+    pattern=None, repeat=None, history_path=DEFAULT_HISTORY, save=True, threshold=0.2, window=5,
+    baseline_path=DEFAULT_BASELINE, update_baseline=False,
+):
+    """Runs the benchmarks and returns (results, regressions, failures)."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    history = load_history(history_path)
+    results, failures = {}, {}
+    benches = discover(pattern, failures)
+    for name, err in failures.items():
+        print(f"{name:<36} failed: {err}", flush=True)
+    for bench in benches:
+        try:
+            results[bench.name] = measure(bench, repeat)
+            print(format_result(bench.name, results[bench.name]), flush=True)
+        except Exception as err:
+            failures[bench.name] = str(err)
+            print(f"{bench.name:<36} failed: {err}", flush=True)
+    found = regressions(results, history, threshold, window, load_baseline(baseline_path))
+    for name, baseline, current, change in found:
+        print(f"REGRESSION {name}: {baseline * 1000:.1f} ms -> {current * 1000:.1f} ms (+{change:.0%})")
+    if save and results:
+        append_history(history_path, results)
+    if update_baseline and results:
+        save_baseline(baseline_path, results)
+        print(f"Baseline written to {baseline_path}")
+    return results, found, failures
+
+
+__all__ = [
+    "benchmark", "latency_profile", "measure", "discover", "run", "regressions",
+    "load_baseline", "save_baseline", "OPTIONS",
+]
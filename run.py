@@ -1,31 +1,57 @@
-import subprocess
 import sys
+import runpy
 import argparse
 from pathlib import Path
 
-current_dir = Path.cwd()
+project_dir = Path(__file__).resolve().parent
+
+# Subcommands run in this interpreter instead of a new one, so the command starts without a
+# second interpreter start-up and each one only imports what it needs.
+
+def run_script(path, extra_args=()):
+    """Runs a project script like `python <path> <extra_args>` would"""
+    script = str(project_dir / path)
+    sys.argv = [script, *extra_args]
+    sys.path.insert(0, str(Path(script).parent))
+    runpy.run_path(script, run_name="__main__")
 
 def run_streamlit():
     """Function to run Streamlit app"""
     print("Starting Streamlit...")
+    from streamlit.web import cli as streamlit_cli
+
+    sys.argv = ["streamlit", "run", str(project_dir / "streamlit" / "app.py")]
     try:
-        subprocess.run([sys.executable, "-m", "streamlit", "run", "streamlit/app.py"])
+        streamlit_cli.main()
     except KeyboardInterrupt:
         print("\nStreamlit stopped gracefully.")
 
-def run_snowflake():
+def run_snowflake(extra_args=()):
     """Function to run snowflake/main.py script"""
     print("Running snowflake main.py...")
     try:
-        subprocess.run([sys.executable, "snowflake/main.py"])
+        run_script("snowflake/main.py", extra_args)
     except KeyboardInterrupt:
         print("\nKeyboardInterrupted Execution stopped.")
     
-def run_trulens():
+def run_trulens(extra_args=()):
     """Function to run trulens/main.py script"""
     print("Running trulens main.py...")
+    # evaluation progress should show up as it happens, like `python -u`
+    sys.stdout.reconfigure(line_buffering=True)
     try:
-        subprocess.run([sys.executable, "-u", f"{current_dir}/snowflake/trulens_eval.py"])
+        run_script("snowflake/trulens_eval.py", extra_args)
+    except KeyboardInterrupt:
+        print("\nKeyboardInterrupted Execution stopped.")
+
+
+def run_benchmarks(extra_args=()):
+    """Function to run the offline benchmarks"""
+    print("Running benchmarks...")
+    sys.argv = ["benchmarks", *extra_args]
+    sys.path.insert(0, str(project_dir))
+    try:
+        runpy.run_module("benchmarks", run_name="__main__", alter_sys=True)
     except KeyboardInterrupt:
         print("\nKeyboardInterrupted Execution stopped.")
 
@@ -38,20 +64,49 @@ def main():
     subparsers.add_parser('app:streamlit', help="Run Streamlit app")
 
     # Subcommand for running Snowflake main script
-    subparsers.add_parser('app:main', help="Run snowflake main.py")
+    main_parser = subparsers.add_parser('app:main', help="Run snowflake main.py")
+    main_parser.add_argument('--incremental', action='store_true', help="Only update new or changed files")
+    main_parser.add_argument('--local-index', metavar='DIR', help="Build a local vector index instead of loading into Snowflake")
     
     # Subcommand for running Trulens main script
-    subparsers.add_parser('app:trulens', help="Run trulens main.py")
+    trulens_parser = subparsers.add_parser('app:trulens', help="Run trulens main.py")
+    trulens_parser.add_argument('--queries', help="JSONL or CSV query set")
+    trulens_parser.add_argument('--concurrency', help="Queries evaluated at the same time")
+    trulens_parser.add_argument('--rate', help="Maximum queries started per second")
+    trulens_parser.add_argument('--results', help="JSON file for the answers, scores and summary")
+    trulens_parser.add_argument('--resume', action='store_true', help="Continue an interrupted evaluation")
+    trulens_parser.add_argument('--headless', action='store_true', help="No confirmation prompt and no dashboard")
+
+    # Subcommand for running the offline benchmarks
+    bench_parser = subparsers.add_parser('app:bench', help="Run the offline benchmarks")
+    bench_parser.add_argument('--filter', help="Only run benchmarks whose name contains this text")
+    bench_parser.add_argument('--latency-scale', help="Multiplier for the injected Snowflake latency")
+    bench_parser.add_argument('--check', action='store_true', help="Fail when a benchmark regressed or failed")
 
     args = parser.parse_args()
     if args.command == 'app:streamlit':
         run_streamlit()
     elif args.command == 'app:main':
-        run_snowflake()
+        extra_args = ["--incremental"] if args.incremental else []
+        if args.local_index:
+            extra_args += ["--local-index", args.local_index]
+        run_snowflake(extra_args)
     elif args.command == 'app:trulens':
-        run_trulens()
+        extra_args = []
+        for option in ('queries', 'concurrency', 'rate', 'results'):
+            if getattr(args, option) is not None:
+                extra_args += [f"--{option}", getattr(args, option)]
+        extra_args += [f"--{flag}" for flag in ('resume', 'headless') if getattr(args, flag)]
+        run_trulens(extra_args)
+    elif args.command == 'app:bench':
+        extra_args = ["--check"] if args.check else []
+        if args.filter:
+            extra_args += ["--filter", args.filter]
+        if args.latency_scale:
+            extra_args += ["--latency-scale", args.latency_scale]
+        run_benchmarks(extra_args)
     else:
-        print("Invalid command. Use 'app:streamlit' or 'app:main' or 'app:trulens'.")
+        print("Invalid command. Use 'app:streamlit' or 'app:main' or 'app:trulens' or 'app:bench'.")
 
 if __name__ == "__main__":
     main()
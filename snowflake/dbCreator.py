@@ -6,7 +6,10 @@ from utils.doc_utils import DocumentProcessor
 from snowflake.core import Root, CreateMode
 from snowflake.core.database import Database
 from snowflake.core.schema import Schema
-from utils.secret_loader import get_secret
+from utils.secret_loader import get_settings
+from utils.bulk_loader import StageLoader
+from utils.cache import mark_published
+from utils.dedup import DedupIndex
 
 
 """
@@ -31,12 +34,20 @@ Usage:
    cortex_search = CortexSearchModule(connector, pdf_path)
 """
 
-CORTEX_SERVICE_NAME = get_secret("SNOWFLAKE_CORTEX_SEARCH_SERVICE")
-WAREHOUSE = get_secret("SNOWFLAKE_WAREHOUSE")
-DATABASE = get_secret("SNOWFLAKE_DATABASE")
-SCHEMA = get_secret("SNOWFLAKE_SCHEMA")
-USER_DATABASE = get_secret("USER_DATABASE")
-CORTEX_SEARCH_TABLE_NAME = get_secret("CORTEX_SEARCH_TABLE_NAME")
+_settings = get_settings()
+CORTEX_SERVICE_NAME = _settings.snowflake_cortex_search_service
+WAREHOUSE = _settings.snowflake_warehouse
+DATABASE = _settings.snowflake_database
+SCHEMA = _settings.snowflake_schema
+USER_DATABASE = _settings.user_database
+CORTEX_SEARCH_TABLE_NAME = _settings.cortex_search_table_name
+TABLE_COLUMNS = {
+    "NAME": "VARCHAR", "DATA": "VARCHAR", "SOURCE": "VARCHAR", "PAGE": "NUMBER",
+    "CHUNK_ID": "VARCHAR", "SIMHASH": "VARCHAR",
+}
+# Deduplicated chunks are stored once; this table maps each CHUNK_ID to every NAME/SOURCE it came from.
+CHUNK_NAMES_TABLE_NAME = f"{CORTEX_SEARCH_TABLE_NAME}_NAMES"
+CHUNK_NAMES_COLUMNS = {"CHUNK_ID": "VARCHAR", "NAME": "VARCHAR", "SOURCE": "VARCHAR"}
 
 class CortexSearchModule:
     def __init__(self, connector: SnowflakeConnector, pdf_path: str = None):
@@ -44,21 +55,22 @@ class CortexSearchModule:
         self.pdf_path = pdf_path
         self.session = self.connector.get_session()
 
-    def create_database_and_schema(self):
-        """Creates or replaces the Snowflake database and schema."""
+    def create_database_and_schema(self, replace=True):
+        """Creates the Snowflake database and schema, replacing them unless `replace` is False."""
         root = Root(self.session)
+        mode = CreateMode.or_replace if replace else CreateMode.if_not_exists
         try:
             database = root.databases.create(
-                Database(name=DATABASE), mode=CreateMode.or_replace
+                Database(name=DATABASE), mode=mode
             )
             root.databases.create(
-                Database(name=USER_DATABASE), mode=CreateMode.or_replace
+                Database(name=USER_DATABASE), mode=mode
             )
             print("Created databases Successfully")
 
             database.schemas.create(
                 Schema(name=SCHEMA),
-                mode=CreateMode.or_replace,
+                mode=mode,
             )
             print("Created schemas Successfully")
         except Exception as err:
@@ -81,22 +93,92 @@ class CortexSearchModule:
         resultsdf = self.session.create_dataframe(results_df)
         resultsdf.write.save_as_table(CORTEX_SEARCH_TABLE_NAME, mode="append")
 
-    def create_cortex_search_service(self):
-        """Creates or replaces the Cortex Search Service in Snowflake."""
+    def bulk_loader(self, batch_size=50000, retries=3):
+        """Returns a StageLoader that bulk-loads Parquet batches into the search table."""
+        return StageLoader(
+            self.session,
+            f"{DATABASE}.{SCHEMA}.{CORTEX_SEARCH_TABLE_NAME}",
+            TABLE_COLUMNS,
+            batch_size=batch_size,
+            retries=retries,
+        )
+
+    def names_loader(self, batch_size=50000, retries=3):
+        """Returns a StageLoader for the CHUNK_ID -> NAME/SOURCE mapping table."""
+        return StageLoader(
+            self.session,
+            f"{DATABASE}.{SCHEMA}.{CHUNK_NAMES_TABLE_NAME}",
+            CHUNK_NAMES_COLUMNS,
+            batch_size=batch_size,
+            retries=retries,
+        )
+
+    def create_tables(self):
+        for table_name, columns in (
+            (CORTEX_SEARCH_TABLE_NAME, TABLE_COLUMNS),
+            (CHUNK_NAMES_TABLE_NAME, CHUNK_NAMES_COLUMNS),
+        ):
+            column_defs = ", ".join(f"{name} {sql_type}" for name, sql_type in columns.items())
+            self.session.sql(f"CREATE TABLE IF NOT EXISTS {DATABASE}.{SCHEMA}.{table_name} ({column_defs})").collect()
+
+    def existing_chunks(self):
+        """Yields (CHUNK_ID, SIMHASH) of the stored chunks, to seed deduplication."""
+        rows = self.session.sql(
+            f"SELECT CHUNK_ID, SIMHASH FROM {DATABASE}.{SCHEMA}.{CORTEX_SEARCH_TABLE_NAME} WHERE CHUNK_ID IS NOT NULL"
+        ).to_local_iterator()
+        for row in rows:
+            yield row[0], row[1]
+
+    def delete_sources(self, sources, batch_size=500):
+        """
+        Deletes the rows of the given source files from the search table.
+
+        A deduplicated chunk is only deleted once no other source maps to it.
+        """
+        sources = list(sources)
+        for start in range(0, len(sources), batch_size):
+            batch = sources[start:start + batch_size]
+            placeholders = ", ".join("?" for _ in batch)
+            self.session.sql(
+                f"DELETE FROM {DATABASE}.{SCHEMA}.{CHUNK_NAMES_TABLE_NAME} WHERE SOURCE IN ({placeholders})",
+                params=batch,
+            ).collect()
+            self.session.sql(
+                f"""
+                DELETE FROM {DATABASE}.{SCHEMA}.{CORTEX_SEARCH_TABLE_NAME}
+                WHERE SOURCE IN ({placeholders})
+                  AND (CHUNK_ID IS NULL OR CHUNK_ID NOT IN (
+                      SELECT CHUNK_ID FROM {DATABASE}.{SCHEMA}.{CHUNK_NAMES_TABLE_NAME}
+                  ))
+                """,
+                params=batch,
+            ).collect()
+        if sources:
+            print(f"Deleted rows of {len(sources)} stale source file(s)")
+
+    def create_cortex_search_service(self, replace=True):
+        """Creates the Cortex Search Service in Snowflake, replacing it unless `replace` is False."""
+        create = "CREATE OR REPLACE" if replace else "CREATE"
+        if_not_exists = "" if replace else "IF NOT EXISTS "
         try:
             self.session.sql(f"USE DATABASE {DATABASE}").collect()
             self.session.sql(f"USE SCHEMA {SCHEMA}").collect()
             cmd =f"""
-            CREATE OR REPLACE CORTEX SEARCH SERVICE {CORTEX_SERVICE_NAME}
+            {create} CORTEX SEARCH SERVICE {if_not_exists}{CORTEX_SERVICE_NAME}
               ON DATA
-              ATTRIBUTES NAME
+              ATTRIBUTES NAME, NAMES
               WAREHOUSE = {WAREHOUSE}
               TARGET_LAG = '1 hour'
               EMBEDDING_MODEL = 'snowflake-arctic-embed-l-v2.0'
             AS (
               SELECT
-                   DATA, NAME
-              FROM {CORTEX_SEARCH_TABLE_NAME}
+                   d.DATA, d.NAME, COALESCE(n.NAMES, ARRAY_CONSTRUCT(d.NAME)) AS NAMES
+              FROM {CORTEX_SEARCH_TABLE_NAME} d
+              LEFT JOIN (
+                  SELECT CHUNK_ID, ARRAY_UNIQUE_AGG(NAME) AS NAMES
+                  FROM {CHUNK_NAMES_TABLE_NAME}
+                  GROUP BY CHUNK_ID
+              ) n ON n.CHUNK_ID = d.CHUNK_ID
             );
             """
             self.session.sql(cmd).collect()
@@ -104,14 +186,56 @@ class CortexSearchModule:
         except Exception as err:
             print(f"Something happen while creating cortex search service {CORTEX_SERVICE_NAME} in database {DATABASE} and schema {SCHEMA} \n")
             print(err)
+            # Re-raised so the caller doesn't save the manifest or publish a service that doesn't exist.
+            raise
 
-    async def run(self, df):
-        """Executes the full workflow: database/schema setup, chunking, storing results, and creating the search service."""
+    def refresh_cortex_search_service(self):
+        """Refreshes the Cortex Search Service now, so it serves the rows just loaded."""
+        try:
+            self.session.sql(f"ALTER CORTEX SEARCH SERVICE {DATABASE}.{SCHEMA}.{CORTEX_SERVICE_NAME} REFRESH").collect()
+            print(f"Cortex Search service '{CORTEX_SERVICE_NAME}' refreshed.")
+        except Exception as err:
+            print(f"Something happen while refreshing cortex search service {CORTEX_SERVICE_NAME} \n")
+            print(err)
+            # Re-raised so the caller doesn't publish results the service doesn't serve yet.
+            raise
+
+    async def run(self, processor, incremental=False, stale_sources=()):
+        """
+        Executes the full workflow: database/schema setup, chunking, storing results, and creating the search service.
+
+        The chunks of `processor` (a `FileProcessor`) are streamed straight into a
+        `StageLoader`, so nothing is written to or read back from a CSV.
+
+        With `incremental` the existing database is kept, rows of `stale_sources` are
+        deleted and only the new rows are loaded.
+
+        The service is refreshed explicitly and only then published, so running apps never
+        drop their caches for a service that failed or still serves the old rows.
+        """
         # creating cortex search service after creating a new databse
-        self.create_database_and_schema()
-        self.store_results_in_snowflake(df)
-        print("Initializing Cortex Search Service... This might take a few moments.")
-        self.create_cortex_search_service()
+        self.create_database_and_schema(replace=not incremental)
+        self.create_tables()
+        dedup_index = None
+        if incremental:
+            self.delete_sources(stale_sources)
+            if processor.dedup:
+                # New chunks that duplicate stored ones only add a mapping row.
+                dedup_index = DedupIndex()
+                for chunk_id, fingerprint in self.existing_chunks():
+                    dedup_index.seed(chunk_id, fingerprint)
+
+        with self.bulk_loader() as loader, self.names_loader() as names_loader:
+            summary = await processor.process(writer=loader, names_writer=names_loader, dedup_index=dedup_index)
+        print(f"Loaded {loader.rows_written} rows from {loader.files_staged} staged file(s)")
+
+        if not incremental:
+            print("Initializing Cortex Search Service... This might take a few moments.")
+        self.create_cortex_search_service(replace=not incremental)
+        self.refresh_cortex_search_service()
+        # Tells running apps to drop retrieval results cached before this publish.
+        mark_published(CORTEX_SERVICE_NAME)
+        return summary
 
 
 __all__ = ["CortexSearchModule"]
@@ -1,19 +1,85 @@
 import sys
 import os
 import asyncio
-import pandas as pd
+import json
+import time
+import argparse
+import weakref
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 # Add the parent dir to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from utils.sessions import SnowflakeConnector
-from dbCreator import CortexSearchModule
-from utils.secret_loader import get_secret
-from utils.datasets import FileProcessor
-from snowflake.cortex import Summarize
+from utils.secret_loader import get_secret, get_settings
+from utils.prompt import get_prompt_builder
+from utils.companies import company_filter
+from utils.tracing import get_tracer
+from utils.prompt import estimate_tokens, NO_CONTEXT
+from utils.cache import retrieval_cache, normalize_query, published_at, PUBLISH_POLL_INTERVAL
 
+MODEL = 'mistral-large2'
+
+# Conversation summaries are refreshed here, after the answer has been delivered.
+_summary_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-summary")
+# Blocking search/complete calls of the async API run here rather than in the loop's default
+# executor, so a timed-out call doesn't hold up asyncio.run() while it finishes.
+_io_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="rag-io")
+# Cortex search service handles per Root, shared by every RAG in the process. A Root belongs to
+# one pooled session, so its handles are dropped together with that session.
+_service_handles = weakref.WeakKeyDictionary()
+_service_handles_lock = threading.Lock()
+
+
+
+def _summarize(text, session):
+    # snowflake.cortex is imported on first use, so importing RAG stays cheap.
+    from snowflake.cortex import Summarize
+
+    return Summarize(text, session=session)
 
 
 if __name__ == "__main__":
+    # The ingestion stack is only needed when this file runs as a script.
+    from utils.sessions import SnowflakeConnector
+    from dbCreator import CortexSearchModule
+    from utils.datasets import FileProcessor
+    from utils.retrieval import LocalIndexWriter
+
+    _parser = argparse.ArgumentParser(description="Process the dataset folder and load it into Snowflake.")
+    _parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only re-chunk new or changed files and update their rows instead of rebuilding everything.",
+    )
+    _parser.add_argument(
+        "--local-index",
+        metavar="DIR",
+        help="Build a local vector index in DIR (see LOCAL_INDEX_PATH) instead of loading into Snowflake.",
+    )
+    _parser.add_argument(
+        "--near-dedup",
+        action="store_true",
+        help="Also drop near-duplicate chunks. Off by default: it can merge clauses that differ in one word, e.g. 'may not'.",
+    )
+    _args = _parser.parse_args()
+    if _args.local_index:
+        processor = FileProcessor(
+            folder_path=get_secret("USER_DATASET_FOLDER"),
+            output_csv_path=None,
+            chunksize=800,
+            overlap=50,
+            workers=os.cpu_count(),
+            dedup=True,
+            near_dedup=_args.near_dedup,
+            companies_path=os.path.join(_args.local_index, "companies.json"),
+        )
+        with LocalIndexWriter(_args.local_index) as index:
+            asyncio.run(processor.process(writer=index, names_writer=index.names_writer))
+        processor.save_manifest()
+        print(f"Local index with {index.rows_written} chunks written to {_args.local_index}")
+        sys.exit(0)
     _connector = SnowflakeConnector()
     _cortex_search = CortexSearchModule(_connector)
     try:
@@ -27,86 +93,349 @@ if __name__ == "__main__":
                     folder_path=folder_path,
                     output_csv_path=output_csv_path,
                     chunksize=800,
-                    overlap=50
+                    overlap=50,
+                    workers=os.cpu_count(),
+                    manifest_path=f"{output_csv_path}.manifest.json",
+                    incremental=_args.incremental,
+                    dedup=True,
+                    near_dedup=_args.near_dedup,
+                    companies_path=f"{output_csv_path}.companies.json",
                 )
-                asyncio.run(processor.process())
-                df = pd.read_csv(output_csv_path, names=['NAME', 'DATA'])
-                asyncio.run(_cortex_search.run(df))
+                plan = processor.plan()
+                incremental = not plan["full_rebuild"]
+                if incremental and not plan["jobs"] and not plan["stale_sources"]:
+                    print("Dataset is up to date, nothing to upload.")
+                else:
+                    asyncio.run(_cortex_search.run(processor, incremental, plan["stale_sources"]))
+                processor.save_manifest()
     except Exception as err:
         print(f"Some error occurred: {err}")
 
 
 class RAG:
-    def __init__(self, root, session, limit_to_retirve=5):
+    def __init__(self, root, session, limit_to_retirve=5, answer_cache=None, completion_fn=None,
+                 summarize_fn=None, history_token_budget=1000, retrieval_timeout=5.0, generation_timeout=60.0,
+                 connector=None, retrieval_backend=None, hybrid=None, prompt_budget_tokens=4096, answer_tokens=1024,
+                 company_index=None, tracer=None):
         self.root = root
         self.session = session
+        # With a connector, every call leases a pooled session instead of holding `session`.
+        self.connector = connector
         self._limit_to_retirve = limit_to_retirve
+        self.answer_cache = answer_cache
+        # Optional callable(prompt, session) yielding completion tokens; defaults to Cortex Complete.
+        self.completion_fn = completion_fn
+        # Optional callable(text, session) returning a summary; defaults to Cortex Summarize.
+        self.summarize_fn = summarize_fn or _summarize
+        # Rough budget (~4 characters per token) for the history carried between turns.
+        self.history_token_budget = history_token_budget
+        # Prompt size is capped at `prompt_budget_tokens`, `answer_tokens` of which are kept for the answer.
+        # Builders hold no per-request state, so sessions with the same budget share one.
+        self.prompt_builder = get_prompt_builder(prompt_budget_tokens, answer_tokens, history_token_budget)
+        self.last_prompt_stats = {}
+        # Per-stage timeouts, in seconds, for the async API.
+        self.retrieval_timeout = retrieval_timeout
+        self.generation_timeout = generation_timeout
         self.data = ""
+        self._summary_future = None
+        settings = get_settings()
+        self._database = settings.snowflake_database
+        self._schema = settings.snowflake_schema
+        self._service_name = settings.snowflake_cortex_search_service
+        self._user_database = settings.user_database
+        # Optional RetrievalBackend (e.g. utils.retrieval.LocalVectorIndex) used instead of the
+        # shared Cortex search service.
+        self.retrieval_backend = retrieval_backend
+        # Optional utils.hybrid.HybridRetriever fusing BM25 with the shared service's results.
+        self.hybrid = hybrid
+        self.last_retrieval_stats = {}
+        # Optional utils.companies.CompanyIndex; detected companies restrict the shared service search.
+        self.company_index = company_index
+        self.last_companies = []
+        # utils.tracing.Tracer for per-stage spans; the process-wide one (off unless TRACING is set) by default.
+        self.tracer = tracer or get_tracer()
+        self.last_request_id = None
 
+    def _is_connected(self):
+        return self.connector is not None or bool(self.root and self.session) or self.retrieval_backend is not None
 
-    def retrieve_context(self, query: str, user_data: bool, user_schema = None, cortex_service_name = None) -> dict:
-        if not self.root or not self.session:
-            return ["Something unexpected happened. Contact customer support."]
+    @contextmanager
+    def _session_scope(self):
+        """Yields (session, root) for one unit of work."""
+        if self.connector is None:
+            yield self.session, self.root
+            return
+        with self.connector.lease() as session:
+            yield session, self.connector.root_for(session)
+
+    def _service(self, root, database, schema, service_name):
+        key = (database, schema, service_name)
+        with _service_handles_lock:
+            handle = _service_handles.setdefault(root, {}).get(key)
+        if handle is None:
+            with self.tracer.span("service_handle", service=f"{database}.{schema}.{service_name}"):
+                handle = (
+                    root.databases[database]
+                    .schemas[schema]
+                    .cortex_search_services[service_name]
+                )
+            with _service_handles_lock:
+                handle = _service_handles.setdefault(root, {}).setdefault(key, handle)
+        return handle
+
+    def _service_published_at(self, database, schema, service_name):
+        """Epoch seconds of the service's last refresh, as Snowflake reports it to every container."""
+        with self._session_scope() as (session, _):
+            rows = session.sql(
+                f"SHOW CORTEX SEARCH SERVICES LIKE '{service_name}' IN SCHEMA {database}.{schema}"
+            ).collect()
+        for row in rows:
+            for column in ("data_timestamp", "created_on"):
+                try:
+                    value = row[column]
+                except (KeyError, IndexError, TypeError, ValueError):
+                    continue
+                if hasattr(value, "timestamp"):
+                    return value.timestamp()
+        return 0.0
+
+    def _published_at(self, database, schema, service_name):
+        shared = (database, schema, service_name) == (self._database, self._schema, self._service_name)
+        if shared and self.retrieval_backend is not None:
+            # A local index is versioned on disk; there is no service to poll.
+            return published_at(service_name)
+        return published_at(
+            service_name,
+            poll=lambda: self._service_published_at(database, schema, service_name),
+            key=f"{database}.{schema}.{service_name}",
+            interval=float(get_secret("PUBLISH_POLL_INTERVAL") or PUBLISH_POLL_INTERVAL),
+        )
 
-        if not user_data:
-            # Accessing the Snowflake Cortex search service
-            my_service = (
-                self.root.databases[get_secret("SNOWFLAKE_DATABASE")]
-                .schemas[get_secret("SNOWFLAKE_SCHEMA")]
-                .cortex_search_services[get_secret("SNOWFLAKE_CORTEX_SEARCH_SERVICE")]
+    def _search(self, query, database, schema, service_name, column, filter=None):
+        service_id = f"{database}.{schema}.{service_name}"
+        filter_key = json.dumps(filter, sort_keys=True) if filter else None
+        key = (normalize_query(query), service_id, self._limit_to_retirve, filter_key)
+        with self.tracer.span("search", service=service_id, filtered=bool(filter)) as span:
+            cached = retrieval_cache.get(key, not_before=self._published_at(database, schema, service_name))
+            span.set(cache_hit=cached is not None)
+            if cached is not None:
+                return list(cached)
+            results = self._search_uncached(query, database, schema, service_name, column, filter)
+            span.set(results=len(results))
+        if results:
+            retrieval_cache.set(key, tuple(results))
+        return results
+
+    def _search_uncached(self, query, database, schema, service_name, column, filter):
+        shared = (database, schema, service_name) == (self._database, self._schema, self._service_name)
+
+        filter_args = {"filter": filter} if filter else {}
+
+        def dense_search(limit):
+            if shared and self.retrieval_backend is not None:
+                return self.retrieval_backend.search(query=query, columns=[column], limit=limit, **filter_args).results
+            with self._session_scope() as (_, root):
+                return self._service(root, database, schema, service_name).search(
+                    query=query, columns=[column], limit=limit, **filter_args
+                ).results
+
+        if shared and self.hybrid is not None:
+            resp = self.hybrid.search(query, [column], self._limit_to_retirve, filter=filter, dense_search=dense_search)
+            self.last_retrieval_stats = resp.stats
+            self.tracer.current().set(**{f"hybrid_{name}": value for name, value in resp.stats.items()})
+            return [curr[column] for curr in resp.results]
+        return [curr[column] for curr in dense_search(self._limit_to_retirve)]
+
+    def _search_shared(self, query):
+        """
+        Searches the shared service. When the company index detects companies in `query`, the
+        searches restricted to each of them are fused with the search over the whole corpus, so
+        a wrongly detected company can't crowd out the relevant chunks.
+        """
+        companies = self.company_index.detect(query) if self.company_index is not None else []
+        self.last_companies = companies
+        self.tracer.current().set(companies=",".join(companies) or None)
+        everything = self._search(query, self._database, self._schema, self._service_name, "DATA")
+        if not companies:
+            return everything
+        return self._merge(*[
+            self._search(query, self._database, self._schema, self._service_name, "DATA", company_filter(company))
+            for company in companies
+        ], everything)
+
+    async def _asearch(self, label, search, *search_args):
+        try:
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(
+                # The copied context keeps the search span under the current trace.
+                loop.run_in_executor(_io_executor, contextvars.copy_context().run, search, *search_args),
+                self.retrieval_timeout,
             )
-            # Searching and building context
-            resp = my_service.search(query=query, columns=["DATA"], limit=self._limit_to_retirve)
+        except asyncio.TimeoutError:
+            print(f"Search in the {label} service timed out after {self.retrieval_timeout}s")
+        except Exception as err:
+            print(f"Search in the {label} service failed: {err}")
+        return []
 
-            if resp.results:
-                return [curr["DATA"] for curr in resp.results]
-            else:
-                return ["No relevent text found"]
-        else:
-            user_service = (
-                self.root.databases[get_secret("USER_DATABASE")]
-                .schemas[user_schema]
-                .cortex_search_services[cortex_service_name]
+    def _merge(self, *result_lists):
+        # Interleave the lists so every service is represented, dropping repeated chunks.
+        merged, seen = [], set()
+        for rank in range(max((len(results) for results in result_lists), default=0)):
+            for results in result_lists:
+                if rank < len(results):
+                    key = " ".join(results[rank].split()).lower()
+                    if key not in seen:
+                        seen.add(key)
+                        merged.append(results[rank])
+        return merged[:self._limit_to_retirve]
+
+    async def aretrieve_context(self, query: str, user_schema = None, cortex_service_name = None) -> list:
+        """
+        Searches the shared service and, if given, the user's service concurrently.
+
+        Each search gets `retrieval_timeout` seconds; a slow or failing service only
+        drops its own results. User results come first when the two are merged.
+        """
+        if not self._is_connected():
+            return ["Something unexpected happened. Contact customer support."]
+
+        searches = []
+        if user_schema and cortex_service_name:
+            searches.append(
+                self._asearch("user", self._search, query, self._user_database, user_schema, cortex_service_name, "CHUNKS")
             )
+        searches.append(self._asearch("shared", self._search_shared, query))
+        merged = self._merge(*await asyncio.gather(*searches))
+        return merged or [NO_CONTEXT]
 
-            resp = user_service.search(query=query, columns=["CHUNKS"], limit=self._limit_to_retirve)
+    def retrieve_context(self, query: str, user_data: bool, user_schema = None, cortex_service_name = None) -> dict:
+        if not self._is_connected():
+            return ["Something unexpected happened. Contact customer support."]
 
-            if resp.results:
-                return [curr["CHUNKS"] for curr in resp.results]
+        with self.tracer.span("retrieve", user_data=bool(user_data)):
+            if not user_data:
+                # Searching the shared Snowflake Cortex search service
+                results = self._search_shared(query)
+                return results or [NO_CONTEXT]
             else:
-                return ["No relevent text found"]
+                return asyncio.run(self.aretrieve_context(query, user_schema, cortex_service_name))
 
 
     def create_prompt(self, query:str, context_str: list)-> str:
-        prompt = f"""
-        You are an expert assistant for interpreting privacy policies and terms and conditions.Your name is Termify Provide clear, factual, and detailed answers based only on the following inputs:
-        - **Context:** Relevant information for the current conversation.
-        - **Previous Context:** Relevant information from the previous conversation if available.
-        If the answer is not in the context, say you don’t have the information. Do not reference or explain the context. Respond courteously to casual greetings.
-        Context: {context_str}
-        Previous Context: {self.data}
-        Question: {query}
-        Answer:
-        """
+        with self.tracer.span("prompt") as span:
+            prompt, self.last_prompt_stats = self.prompt_builder.build(query, context_str, self.data)
+            span.set(**self.last_prompt_stats)
         return prompt
 
-    def generate_completion(self, query: str, context_str: list) -> str:
-        prompt = self.create_prompt(query, context_str)
-        cmd = """select snowflake.cortex.complete(?, ?) as response"""
-        model = 'mistral-large2'
-        temprature = 0.2
-        top_p = 0.3
-        result = self.session.sql(cmd, params=[model, prompt, temprature, top_p]).collect()
+    def _complete_stream(self, prompt: str):
+        """Yields the completion of `prompt` chunk by chunk as Cortex produces it."""
+        with self.tracer.span("complete", model=MODEL) as span:
+            started = time.perf_counter()
+            chars = 0
+            with self._session_scope() as (session, _):
+                if self.completion_fn is not None:
+                    tokens = self.completion_fn(prompt, session)
+                else:
+                    from snowflake.cortex import Complete, CompleteOptions
+
+                    options = CompleteOptions(temperature=0.2, top_p=0.3, max_tokens=self.prompt_builder.answer_tokens)
+                    tokens = Complete(MODEL, prompt, options=options, session=session, stream=True)
+                for token in tokens:
+                    if not chars:
+                        span.set(first_token_seconds=time.perf_counter() - started)
+                    chars += len(token)
+                    yield token
+            # Estimated like the prompt, ~4 characters per token.
+            span.set(prompt_tokens=estimate_tokens(prompt), completion_tokens=-(-chars // 4))
+
+    def _bounded(self, text: str, tokens: int) -> str:
+        # Keeps the most recent part of `text` within roughly `tokens` tokens.
+        max_chars = tokens * 4
+        return text if len(text) <= max_chars else text[-max_chars:]
+
+    def _summarize_turn(self, previous_future, query: str, response: str) -> str:
+        history = self.data
+        if previous_future is not None:
+            history = self._result_or(previous_future, history)
+        # Half of the budget for the running summary, half for the latest turn.
+        half = self.history_token_budget // 2
+        text = self._bounded(history, half) + "\n" + self._bounded(query + "\n" + response, half)
+        with self.tracer.span("summarize", input_tokens=estimate_tokens(text)):
+            with self._session_scope() as (session, _):
+                summary = self.summarize_fn(text, session)
+        return self._bounded(summary, self.history_token_budget)
+
+    @staticmethod
+    def _result_or(future, fallback: str) -> str:
         try:
-            return result[0]['RESPONSE']
-        finally:
-            temp = self.data + query + result[0]['RESPONSE']
-            self.data = Summarize(temp, self.session)
+            return future.result()
+        except Exception as err:
+            print(f"Could not summarize the conversation: {err}")
+            return fallback
+
+    def _schedule_summary(self, query: str, response: str):
+        # Each summary builds on the previous one, so chain them in submission order.
+        self._summary_future = _summary_executor.submit(
+            contextvars.copy_context().run, self._summarize_turn, self._summary_future, query, response
+        )
+
+    def wait_for_history(self) -> str:
+        """Blocks until the summary of the previous turn is ready and returns it."""
+        future, self._summary_future = self._summary_future, None
+        if future is not None:
+            with self.tracer.span("wait_history", ready=future.done()):
+                self.data = self._result_or(future, self.data)
+        return self.data
+
+    def stream_completion(self, query: str, context_str: list):
+        self.wait_for_history()
+        # Cached answers don't account for conversation history, so only use the cache on a fresh conversation.
+        use_cache = self.answer_cache is not None and not self.data
+        cached = None
+        if use_cache:
+            with self.tracer.span("answer_cache") as span:
+                cached = self.answer_cache.lookup(query, context_str)
+                span.set(cache_hit=cached is not None)
+        if cached is not None:
+            response = cached
+            yield cached
+        else:
+            parts = []
+            for token in self._complete_stream(self.create_prompt(query, context_str)):
+                parts.append(token)
+                yield token
+            response = "".join(parts)
+            if use_cache:
+                self.answer_cache.store(query, context_str, response)
 
+        self._schedule_summary(query, response)
+
+    def generate_completion(self, query: str, context_str: list) -> str:
+        return "".join(self.stream_completion(query, context_str))
+
+    def stream_query(self, query: str, user_data: bool, user_schema = None, cortexServiceName = None):
+        """Like `query`, but yields the answer token by token as it is generated."""
+        with self.tracer.trace("rag.query", user_data=bool(user_data)) as trace:
+            self.last_request_id = trace.trace_id
+            context_str = self.retrieve_context(query, user_data, user_schema, cortexServiceName)
+            yield from self.stream_completion(query, context_str)
 
     def query(self, query: str, user_data: bool, user_schema = None, cortexServiceName = None) -> str:
-        context_str = self.retrieve_context(query, user_data, user_schema, cortexServiceName)
-        return self.generate_completion(query, context_str)
+        return "".join(self.stream_query(query, user_data, user_schema, cortexServiceName))
+
+    async def aquery(self, query: str, user_schema = None, cortexServiceName = None) -> str:
+        """Async `query`: concurrent retrieval across services, then generation within `generation_timeout`."""
+        with self.tracer.trace("rag.aquery", user_data=bool(user_schema)) as trace:
+            self.last_request_id = trace.trace_id
+            with self.tracer.span("retrieve", user_data=bool(user_schema)):
+                context_str = await self.aretrieve_context(query, user_schema, cortexServiceName)
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(
+                loop.run_in_executor(
+                    _io_executor, contextvars.copy_context().run, self.generate_completion, query, context_str
+                ),
+                self.generation_timeout,
+            )
 
 
 __all__ = ["RAG"]
@@ -1,50 +1,69 @@
 import os
 import sys
+import argparse
 import numpy as np
-from tqdm import tqdm
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from snowflake.core._root import Root
 from snowflake.main import RAG
 from snowflake.cortex import Complete, CompleteOptions
-from utils.secret_loader import get_secret
+from utils.secret_loader import get_settings
 from trulens.providers.cortex import Cortex
 from utils.sessions import SnowflakeConnector
+from utils.evaluation import EvalRunner, load_queries, summarize, write_results
 from trulens.core import TruSession, Feedback, Select
 from trulens.apps.custom import instrument, TruCustomApp
 from trulens.dashboard import run_dashboard
 
+"""
+TruLens evaluation
+
+Runs the query set through the RAG app and scores every answer with TruLens feedback functions
+(context relevance, answer relevance, coherence). Queries run concurrently on pooled sessions,
+bounded by `--concurrency` and `--rate`. Finished queries are checkpointed, so an interrupted run
+can be continued with `--resume`. The answers, scores and a summary are written to `--results`
+as JSON.
+
+Usage:
+    python snowflake/trulens_eval.py --headless --queries snowflake/eval_queries.jsonl --concurrency 8
+"""
+
+DEFAULT_QUERIES = os.path.join(os.path.dirname(__file__), "eval_queries.jsonl")
+
 
 class RAG(RAG):
-    def __init__(self, root, session, limit_to_retirve=5):
-        self.root = root
-        self.session = session
+    def __init__(self, connector, limit_to_retirve=5):
+        self.root = None
+        self.session = None
+        # Every call leases its own pooled session, so queries can be evaluated concurrently.
+        self.connector = connector
         self._limit_to_retirve = limit_to_retirve
 
     @instrument
     def retrieve_context(self, query: str) -> dict:
-        if not self.root or not self.session:
+        if self.connector is None:
             return {
                 "input": query,
                 "response": "Something unexpected happened. Contact customer support.",
             }
 
         # Accessing the Snowflake Cortex search service
-        my_service = (
-            self.root.databases[get_secret("SNOWFLAKE_DATABASE")]
-            .schemas[get_secret("SNOWFLAKE_SCHEMA")]
-            .cortex_search_services[get_secret("SNOWFLAKE_CORTEX_SEARCH_SERVICE")]
-        )
+        settings = get_settings()
+        with self._session_scope() as (_, root):
+            my_service = (
+                root.databases[settings.snowflake_database]
+                .schemas[settings.snowflake_schema]
+                .cortex_search_services[settings.snowflake_cortex_search_service]
+            )
 
-        # Searching and building context
-        resp = my_service.search(query=query, columns=["DATA"], limit=self._limit_to_retirve)
+            # Searching and building context
+            resp = my_service.search(query=query, columns=["DATA"], limit=self._limit_to_retirve)
 
         if resp.results:
             return [curr["DATA"] for curr in resp.results]
         else:
             return ["No relevent Information found"]
-    
+
     @instrument
     def create_prompt(self, query:str, context_str: list)-> str:
         prompt = f"""
@@ -64,7 +83,8 @@ class RAG(RAG):
             temperature=0.2,       # Add some randomness for creativity
             top_p=0.3             # Limit the token set to the top 90% cumulative probability
         )
-        return Complete("mistral-large2", prompt, options=options)
+        with self._session_scope() as (session, _):
+            return Complete("mistral-large2", prompt, options=options, session=session)
 
     @instrument
     def ask_query(self, query: str) -> str:
@@ -72,62 +92,29 @@ class RAG(RAG):
         return self.generate_completion(query, context_str)
 
 
-Ask = input("should I start evaluating with the given sets of question? ('y' or 'n'): ")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the RAG app with TruLens feedback functions.")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="JSONL or CSV query set (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Queries evaluated at the same time")
+    parser.add_argument("--rate", type=float, default=None, help="Maximum queries started per second")
+    parser.add_argument("--results", default="eval_results.json", help="JSON file for the answers, scores and summary")
+    parser.add_argument("--checkpoint", default=None, help="JSONL checkpoint (default: <results>.checkpoint.jsonl)")
+    parser.add_argument("--resume", action="store_true", help="Skip queries that already succeeded in the checkpoint")
+    parser.add_argument("--feedback-timeout", type=float, default=300, help="Seconds to wait for each feedback score")
+    parser.add_argument("--headless", action="store_true", help="Don't ask for confirmation or start the dashboard")
+    parser.add_argument("--dashboard", action="store_true", help="Start the TruLens dashboard when done")
+    return parser.parse_args(argv)
 
 
-if Ask not in ['Y', 'y', 'yes', 'Yes', 'YES']:
-    print("No query provided. Exiting...")
-    sys.exit(0)
-else:
-    sfConnect = SnowflakeConnector()
-    session = sfConnect.get_session()
-    root = Root(session)
-    rag = RAG(root, session)
-    sess_Tru = TruSession()
+def build_app(connector):
+    """Returns the instrumented RAG app and its TruLens recorder."""
+    rag = RAG(connector)
 
     provider = Cortex(
-        session,
+        connector.get_session(),
         model_engine="mistral-large2",
     )
 
-    queries = [
-        "How does Facebook use my data when I log in with my account?",
-        "What happens to my data when I delete my Instagram profile?",
-        "Does Amazon track what I browse even if I don't make a purchase?",
-        "How does Google use my location data when I use Google Maps?",
-        "Can I stop Netflix from recommending shows based on my watch history?",
-        "Why does Twitter ask for my phone number and what do they do with it?",
-        "Does Apple sell my data to other companies or use it for advertising?",
-        "How can I opt out of personalized ads on YouTube?",
-        "Does Microsoft store my voice recordings from Cortana, and for how long?",
-        "Why does Uber require my GPS location even when I am not in a ride?",
-        "What is TikTok doing with the data it collects from my device?",
-        "Does Spotify listen to what I say outside of the app for improving recommendations?",
-        "Can Snapchat access my photos without me sending them to someone?",
-        "What are my rights to request a copy of my data from Google?",
-        "How does Amazon Alexa know what I’m saying even when I haven’t activated it?",
-        "Does Facebook share my posts with advertisers even if I don't allow targeted ads?",
-        "What does Instagram do with my phone number after I enter it to verify my account?",
-        "Why does Amazon ask for my address when I only want to browse items?",
-        "If I use Google search, does it track what I search for even if I don't have a Google account?",
-        "Can Netflix see what shows I watch and use that to recommend others, even if I don't share my viewing history?",
-        "Why does Twitter keep sending me notifications about people I don’t follow?",
-        "Does Apple track my location even when I'm not using any apps?",
-        "If I don’t want personalized ads, how can I stop YouTube from showing them?",
-        "Does Microsoft collect my voice data when I use Windows, even when I don’t ask Cortana anything?",
-        "Why does Uber need my location when I’m not actively using the app?",
-        "Why does TikTok ask for access to my contacts and photos? What do they do with them?",
-        "Is Spotify listening to my voice or tracking what I say outside the app to make recommendations?",
-        "Can Snapchat see my location and pictures even if I haven’t shared anything with anyone?",
-        "How do I know what personal data Google is storing about me, and how can I delete it?",
-        "Why does Amazon Alexa sometimes record my conversations, even when I haven’t activated it?",
-        "Do my browsing habits on Chrome get shared with Google for targeted ads?",
-        "Can Facebook access my private messages and photos even if they’re not shared publicly?",
-        "What happens to my data when I unsubscribe from email newsletters from a company?",
-        "If I delete my account on Twitter, how long do they keep my data?",
-        "Does my activity on apps like Instagram and Facebook get sold to other companies?",
-    ]
-
     # Feedback: Context Relevance
     f_context_relevance = (
         Feedback(provider.context_relevance, name="Context Relevance")
@@ -156,9 +143,56 @@ else:
         app_version="v1.2.1",
         feedbacks=[f_answer_relevance, f_context_relevance, f_coherence],
     )
+    return rag, tru_rag
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.headless:
+        Ask = input("should I start evaluating with the given sets of question? ('y' or 'n'): ")
+        if Ask not in ['Y', 'y', 'yes', 'Yes', 'YES']:
+            print("No query provided. Exiting...")
+            return 0
+
+    queries = load_queries(args.queries)
+    # One pooled session per concurrent query, plus the one the feedback provider holds.
+    sfConnect = SnowflakeConnector(max_size=args.concurrency + 1)
+    sess_Tru = TruSession()
+    rag, tru_rag = build_app(sfConnect)
+
+    def evaluate(item):
+        # Each call records separately, so concurrent queries don't share a recording.
+        response, record = tru_rag.with_record(rag.ask_query, item["query"], record_metadata={"query_id": item["id"]})
+        feedback = record.wait_for_feedback_results(feedback_timeout=args.feedback_timeout)
+        return {
+            "response": response,
+            "record_id": record.record_id,
+            "scores": {result.name: result.result for result in feedback.values()},
+        }
+
+    runner = EvalRunner(
+        evaluate,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        checkpoint_path=args.checkpoint or f"{args.results}.checkpoint.jsonl",
+    )
+    try:
+        results = runner.run(queries, resume=args.resume)
+    finally:
+        sfConnect.close_connection()
+    summary = summarize(results, runner.wall_seconds)
+    write_results(args.results, results, summary)
+    print(
+        f"Evaluated {summary['succeeded']} of {summary['queries']} queries in {summary['wall_seconds']:.1f}s "
+        f"({summary['errors']} failed). Results written to {args.results}"
+    )
+    for name, score in summary["scores"].items():
+        print(f"  {name}: {score:.3f}")
+
+    if args.dashboard or not args.headless:
+        run_dashboard(session=sess_Tru, port=8080, _watch_changes=True)
+    return 1 if summary["errors"] else 0
 
-    with tru_rag as recording:
-        for query in tqdm(queries, desc="Questions", ascii=True):
-            response = rag.ask_query(query)
 
-    run_dashboard(session=sess_Tru, port=8080, _watch_changes=True)
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,18 +3,21 @@ from dataclasses import dataclass
 import sys
 import os
 import uuid
+import tempfile
 import time
-import asyncio
 from typing import Literal
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'snowflake')))
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'utils')))
 
 import streamlit as st
-from snowflake.core._root import Root
-from utils.sessions import SnowflakeConnector
+from utils.sessions import get_connector
 from snowflake.main import RAG
-from utils.Custom_cortex import customCortex
+from utils.answer_cache import get_answer_cache
+from utils.service_pool import get_service_pool
+from utils.retrieval import get_local_index
+from utils.companies import get_company_index
+from utils.hybrid import get_hybrid_retriever
 # page configuration
 st.set_page_config(
     page_title="Termify",
@@ -29,17 +32,32 @@ st.set_page_config(
 )
 
 
-def initialize_session_state():
-    # session state for better user experience
-    if "session" not in st.session_state:
-        sfConnect = SnowflakeConnector()
-        st.session_state.session = sfConnect.get_session()
+def get_user_cortex():
+    # the upload stack is only imported once this session works with its own document
+    if "user_cortex" not in st.session_state:
+        from utils.Custom_cortex import customCortex
+
+        st.session_state.user_cortex = customCortex(
+            session=None, root=None, schema=st.session_state.custom_cortex_details["schema"],service_name=st.session_state.custom_cortex_details["cortexServiceName"],
+            connector=get_connector(), service_pool=get_service_pool(get_connector())
+        )
+    return st.session_state.user_cortex
 
-    if "root" not in st.session_state:
-        st.session_state.root = Root(st.session_state.session)
 
+def initialize_session_state():
+    # session state for better user experience
+    # Only per-user state lives here: the conversation, upload progress and the user's own
+    # search service. The connector, session pool, service handles, caches, indexes and prompt
+    # builder are process-wide shared resources (utils.resources), built once for all users.
     if "sfChatApp" not in st.session_state:
-        st.session_state.sfChatApp = RAG(st.session_state.root, st.session_state.session)
+        st.session_state.sfChatApp = RAG(
+            None, None, answer_cache=get_answer_cache(), connector=get_connector(),
+            retrieval_backend=get_local_index(), hybrid=get_hybrid_retriever(), company_index=get_company_index(),
+        )
+    else:
+        # indexes and the company list are rebuilt by re-ingestion; every rerun picks up the current ones
+        chat = st.session_state.sfChatApp
+        chat.retrieval_backend, chat.hybrid, chat.company_index = get_local_index(), get_hybrid_retriever(), get_company_index()
 
     if "messages" not in st.session_state:
         st.session_state.messages = []
@@ -50,6 +68,14 @@ def initialize_session_state():
     if "parse_status" not in st.session_state:
         st.session_state.parse_status = None
 
+    # large uploads spill here; the directory is removed when the session is garbage collected
+    if "upload_dir" not in st.session_state:
+        st.session_state.upload_dir = tempfile.TemporaryDirectory(prefix="termify_upload_")
+
+    # id of this session's background upload job
+    if "upload_job" not in st.session_state:
+        st.session_state.upload_job = None
+
     if "custom_cortex_details" not in st.session_state:
         st.session_state.custom_cortex_details = {
             "schema": f"db_{uuid.uuid4().hex}_{int(time.time())}",
@@ -57,14 +83,16 @@ def initialize_session_state():
             "using_custom_cortex": False
         }
 
-    if "user_cortex" not in st.session_state:
-        st.session_state.user_cortex = customCortex(
-            session=st.session_state.session, root=st.session_state.root, schema=st.session_state.custom_cortex_details["schema"],service_name=st.session_state.custom_cortex_details["cortexServiceName"]
-        )
-
     if 'initialized' not in st.session_state:
+        # start pre-warming search services before the first upload
+        get_service_pool(get_connector())
         st.session_state.initialized = True
 
+    # every rerun keeps the leased search service alive; an expired lease was recycled
+    if st.session_state.custom_cortex_details["using_custom_cortex"] and not get_user_cortex().has_service():
+        st.session_state.custom_cortex_details["using_custom_cortex"] = False
+        st.warning("Your uploaded document expired after a period of inactivity. Please upload it again.")
+
 
 
 initialize_session_state()
@@ -81,7 +109,8 @@ def clearChat():
     st.session_state.parse_status = None
 
 def on_session_end():
-    st.session_state.user_cortex.delete_schema()
+    if "user_cortex" in st.session_state:
+        st.session_state.user_cortex.delete_schema()
 
 if not st.session_state.initialized:
     on_session_end()
@@ -89,27 +118,60 @@ if not st.session_state.initialized:
 
 @st.dialog("Use your Own file")
 def file_uploade_feature():
-    st.warning("Do not close this dialog or click other buttons once the operation starts, as it may interrupt the process and corrupt your data.")
+    from utils.Custom_cortex import get_upload_queue
+    from utils.doc_utils import spool_upload
+
     uploaded_file = st.file_uploader("Upload your File", type="pdf", help="Do not upload any confidential informations")
 
-    # temporarely store document into local_disk for better convinience while parsing
+    # one upload per session at a time: uploads share the session's schema and search service
+    job = get_upload_queue().status(st.session_state.upload_job) if st.session_state.upload_job else None
+    busy = job is not None and job["state"] in ("queued", "running")
+    if busy:
+        st.info(f"{job['name']} is still being processed, please wait for it to finish.")
+
     if uploaded_file is not None:
-        temp_file_path = f"temp_{uploaded_file.name}"
-        with open(temp_file_path, "wb") as temp_file:
-            temp_file.write(uploaded_file.read())
-
-        # parse user documents into snowflake db
-        if st.button("parse Document"):
-            with st.status("Uploading... This might take a few minutes. ⏳", expanded=True) as status:
-                asyncio.run(
-                    st.session_state.user_cortex.Create_service(temp_file_path)
-                )
-                st.session_state.custom_cortex_details["using_custom_cortex"] = True
-                os.remove(temp_file_path)
-
-                # Update session state
-                st.session_state.parse_status = "successfully parsed data!"
-                status.update(label=st.session_state.parse_status, state="complete", expanded=False)
+        # parse user documents into snowflake db on a background worker; progress shows in the sidebar
+        if st.button("parse Document", disabled=busy):
+            st.session_state.upload_job = get_upload_queue().submit(
+                owner=st.session_state.custom_cortex_details["schema"],
+                name=uploaded_file.name,
+                # parsed straight from memory; only large files are spooled to the session's tempdir
+                payload={
+                    "cortex": get_user_cortex(),
+                    "source": spool_upload(uploaded_file, st.session_state.upload_dir.name),
+                    "spool_dir": st.session_state.upload_dir.name,
+                },
+            )
+            st.session_state.parse_status = None
+            st.rerun()
+
+
+@st.fragment(run_every=2)
+def upload_status():
+    from utils.Custom_cortex import get_upload_queue
+
+    job = get_upload_queue().status(st.session_state.upload_job)
+    if job is None:
+        return
+    if job["state"] == "succeeded":
+        if st.session_state.parse_status is None:
+            # a pre-warmed slot may have replaced the schema and service names
+            st.session_state.custom_cortex_details["schema"] = job["result"]["schema"]
+            st.session_state.custom_cortex_details["cortexServiceName"] = job["result"]["service_name"]
+            st.session_state.custom_cortex_details["using_custom_cortex"] = True
+            st.session_state.parse_status = "successfully parsed data!"
+        st.success(f"{job['name']}: {st.session_state.parse_status}")
+        return
+
+    last_message = job["messages"][-1] if job["messages"] else "Waiting for a free worker..."
+    st.progress(job["progress"], text=f"{job['name']}: {last_message}")
+    if job["state"] in ("queued", "running"):
+        if st.button("Cancel upload"):
+            get_upload_queue().cancel(job["id"])
+    else:
+        st.warning(job["error"] or f"Upload {job['state']}")
+        if job["resumable"] and st.button("Resume upload"):
+            get_upload_queue().resume(job["id"])
 
 icons = {"assistant": "❄️", "user": "👤"}
 
@@ -120,12 +182,6 @@ if st.session_state.first_load:
     st.divider()
     st.session_state.first_load = False
 
-# animated response stream
-def stream_output(response):
-    for word in response.split(" "):
-        yield word + " "
-        time.sleep(0.06)
-
 # showing all messages
 for chat in st.session_state.messages:
     if chat.origin == "user":
@@ -141,17 +197,17 @@ if query := st.chat_input("Hello Termify!"):
         st.markdown(query)
         st.session_state.messages.append(message("user", query))
 
-    with st.spinner("Let me figure that out for you..."):
-        user_data = st.session_state.custom_cortex_details["using_custom_cortex"]
-        if user_data:
-            schema = st.session_state.custom_cortex_details["schema"]
-            cortex_service_name = st.session_state.custom_cortex_details["cortexServiceName"]
-            response = st.session_state.sfChatApp.query(query,user_data,schema, cortex_service_name)
-        else:
-            response = st.session_state.sfChatApp.query(query, user_data)
+    user_data = st.session_state.custom_cortex_details["using_custom_cortex"]
+    if user_data:
+        schema = st.session_state.custom_cortex_details["schema"]
+        cortex_service_name = st.session_state.custom_cortex_details["cortexServiceName"]
+        response_stream = st.session_state.sfChatApp.stream_query(query, user_data, schema, cortex_service_name)
+    else:
+        response_stream = st.session_state.sfChatApp.stream_query(query, user_data)
 
+    # tokens are rendered as soon as the model produces them
     with st.chat_message("assistant", avatar=icons["assistant"]):
-        st.write_stream(stream_output(response))
+        response = st.write_stream(response_stream)
     st.session_state.messages.append(message("ai", response))
 
 
@@ -160,3 +216,5 @@ with st.sidebar:
     if "own_doc" not in st.session_state:
         if st.button("Upload Your File"):
             file_uploade_feature()
+    if st.session_state.upload_job:
+        upload_status()
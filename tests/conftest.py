@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import `utils` the same way the app does, from the project root.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,34 @@
+import time
+
+from utils import cache
+from utils.cache import TTLCache, published_at
+
+
+def test_poll_runs_at_most_once_per_interval():
+    calls = []
+
+    def poll():
+        calls.append(time.time())
+        return 100.0
+
+    key = f"test-{time.time_ns()}"
+    assert published_at("missing-service", poll, key=key, interval=60) == 100.0
+    assert published_at("missing-service", poll, key=key, interval=60) == 100.0
+    assert len(calls) == 1
+
+
+def test_failed_poll_keeps_the_last_known_time():
+    key = f"test-{time.time_ns()}"
+    cache._polled[key] = (0.0, 100.0)
+
+    def poll():
+        raise RuntimeError("warehouse suspended")
+
+    assert published_at("missing-service", poll, key=key, interval=60) == 100.0
+
+
+def test_entries_cached_before_a_republish_are_misses():
+    ttl_cache = TTLCache()
+    ttl_cache.set("q", ["chunk"])
+    assert ttl_cache.get("q", not_before=time.time() - 60) == ["chunk"]
+    assert ttl_cache.get("q", not_before=time.time() + 1) is None
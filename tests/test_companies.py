@@ -0,0 +1,129 @@
+import uuid
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("dotenv")
+
+from utils.companies import CompanyIndex, company_filter
+from utils.retrieval import SearchResponse
+
+COMPANIES = ["Spotify", "Netflix", "Target", "Zoom", "Square", "Meta", "Bank_of_America", "Acme Inc"]
+
+
+@pytest.fixture
+def index():
+    return CompanyIndex(COMPANIES, aliases={"Facebook": "Meta", "FB": "Meta", "zoom video": "Zoom"})
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("Does Spotify sell my data?", ["Spotify"]),
+        ("does netflix share my viewing history", ["Netflix"]),
+        ("Compare netflix and spotify", ["Netflix", "Spotify"]),
+        ("what does bank of america keep", ["Bank_of_America"]),
+        ("Is Acme allowed to do this?", ["Acme Inc"]),
+        ("What about you tube?", []),
+    ],
+)
+def test_detects_named_companies(index, query, expected):
+    assert index.detect(query) == expected
+
+
+def test_aliases_map_to_the_company(index):
+    assert index.detect("what does facebook collect") == ["Meta"]
+    assert index.detect("Does FB sell data") == ["Meta"]
+    assert index.detect("can zoom video record me") == ["Zoom"]
+
+
+def test_fuzzy_matches_typos(index):
+    assert index.detect("does spotfy sell my data") == ["Spotify"]
+    assert index.detect("netflx retention") == ["Netflix"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "share data with the target audience",
+        "how do i zoom in",
+        "what does a square mean",
+        "what does the privacy policy say about my data",
+    ],
+)
+def test_everyday_words_are_not_companies(index, query):
+    assert index.detect(query) == []
+
+
+def test_capitalised_everyday_word_is_a_company(index):
+    assert index.detect("Does Target sell my data?") == ["Target"]
+    assert index.detect("can Zoom record my meetings") == ["Zoom"]
+
+
+def test_everyday_words_are_never_fuzzy_matched(index):
+    assert index.detect("Does Targt sell my data?") == []
+
+
+def test_ambiguous_names_are_configurable():
+    index = CompanyIndex(["Spotify", "Target"], ambiguous=["Spotify"])
+    assert index.detect("does spotify sell my data") == []
+    assert index.detect("share with the target audience") == ["Target"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = tmp_path / "companies.json"
+    CompanyIndex.save(path, ["Netflix", "Spotify", "Netflix"])
+    assert CompanyIndex.load(path).companies == ["Netflix", "Spotify"]
+
+
+class FilteredBackend:
+    """Backend returning one chunk per company for filtered searches and generic chunks otherwise."""
+
+    def __init__(self):
+        self.filters = []
+
+    def search(self, query, columns, limit, filter=None):
+        self.filters.append(filter)
+        if filter:
+            company = filter["@contains"]["NAMES"]
+            return SearchResponse([{"DATA": f"{company} clause {i}"} for i in range(limit)])
+        return SearchResponse([{"DATA": f"general clause {i}"} for i in range(limit)])
+
+
+def test_company_search_is_fused_with_the_global_search(index):
+    from snowflake.main import RAG
+
+    backend = FilteredBackend()
+    rag = RAG(None, None, retrieval_backend=backend, company_index=index)
+    # A fresh query each run, so the process-wide retrieval cache can't answer it.
+    results = rag.retrieve_context(f"Does Target sell my data {uuid.uuid4().hex}", user_data=False)
+    assert backend.filters == [None, company_filter("Target")]
+    assert results == ["Target clause 0", "general clause 0", "Target clause 1", "general clause 1", "Target clause 2"]
+
+    backend.filters.clear()
+    results = rag.retrieve_context(f"share data with the target audience {uuid.uuid4().hex}", user_data=False)
+    assert backend.filters == [None]
+    assert results[0] == "general clause 0"
+
+
+def test_shared_index_follows_the_company_list(tmp_path, monkeypatch):
+    import os
+    from utils.companies import get_company_index
+    from utils.secret_loader import reload_settings
+
+    path = tmp_path / "companies.json"
+    monkeypatch.setenv("COMPANY_INDEX_PATH", str(path))
+    reload_settings()
+    try:
+        # Not ingested yet: nothing is cached, so the list is picked up once it is written.
+        assert get_company_index() is None
+        CompanyIndex.save(path, ["Spotify"])
+        assert get_company_index().companies == ["Spotify"]
+
+        CompanyIndex.save(path, ["Netflix", "Spotify"])
+        os.utime(path, ns=(1, 1))
+        assert get_company_index().companies == ["Netflix", "Spotify"]
+    finally:
+        get_company_index.clear()
+        monkeypatch.delenv("COMPANY_INDEX_PATH")
+        reload_settings()
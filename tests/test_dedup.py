@@ -0,0 +1,84 @@
+import pytest
+
+from utils.dedup import DedupWriter, DedupIndex, chunk_id
+
+CLAUSE = (
+    "{company} may share your personal information with advertising partners "
+    "for the purpose of measuring campaign performance across services."
+)
+
+
+class Rows:
+    def __init__(self):
+        self.rows = []
+
+    def writerow(self, row):
+        self.rows.append(row)
+
+
+def write(rows, **kwargs):
+    stored, names = Rows(), Rows()
+    deduped = DedupWriter(stored, names_writer=names, **kwargs)
+    deduped.writerows(rows)
+    return stored.rows, names.rows, deduped.stats()
+
+
+def test_chunk_id_ignores_case_and_whitespace():
+    assert chunk_id("Data  is\nShared") == chunk_id("data is shared")
+    assert chunk_id("data is shared") != chunk_id("data is not shared")
+
+
+def test_exact_duplicates_are_stored_once_and_mapped_to_every_company():
+    text = "We retain logs for ninety days."
+    stored, names, stats = write([
+        {"name": "Acme", "data": text, "source": "Acme/a.json", "page": 0},
+        {"name": "Beta", "data": "We retain  logs for NINETY days.", "source": "Beta/b.json", "page": 0},
+        {"name": "Acme", "data": text, "source": "Acme/a.json", "page": 1},
+    ])
+    assert [row["name"] for row in stored] == ["Acme"]
+    assert stored[0]["chunk_id"] == chunk_id(text)
+    assert names == [
+        {"chunk_id": chunk_id(text), "name": "Acme", "source": "Acme/a.json"},
+        {"chunk_id": chunk_id(text), "name": "Beta", "source": "Beta/b.json"},
+    ]
+    assert stats["unique"] == 1 and stats["exact_duplicates"] == 2
+    assert stats["dedup_ratio"] == pytest.approx(2 / 3)
+
+
+def test_negated_clause_is_kept_by_default():
+    allowed = CLAUSE.format(company="Acme")
+    denied = allowed.replace("may share", "may not share")
+    stored, names, stats = write([
+        {"name": "Acme", "data": allowed, "source": "Acme/a.json", "page": 0},
+        {"name": "Beta", "data": denied, "source": "Beta/b.json", "page": 0},
+    ])
+    assert [row["data"] for row in stored] == [allowed, denied]
+    # Each company maps to its own text.
+    assert {(row["name"], row["chunk_id"]) for row in names} == {
+        ("Acme", chunk_id(allowed)),
+        ("Beta", chunk_id(denied)),
+    }
+    assert stats["near_duplicates"] == 0
+
+
+def test_seeded_chunks_count_as_stored():
+    index = DedupIndex()
+    index.seed(chunk_id("already stored"))
+    stored, names, stats = write([{"name": "Acme", "data": "Already  stored", "source": "a", "page": 0}], index=index)
+    assert stored == []
+    assert names == [{"chunk_id": chunk_id("already stored"), "name": "Acme", "source": "a"}]
+
+
+def test_near_duplicates_are_dropped_only_when_enabled():
+    pytest.importorskip("numpy")
+    rows = [
+        {"name": company, "data": CLAUSE.format(company=company), "source": f"{company}/t.json", "page": 0}
+        for company in ("Acme", "Globex")
+    ]
+    stored, _, _ = write(rows)
+    assert len(stored) == 2
+
+    stored, names, stats = write(rows, near_duplicates=True)
+    assert [row["name"] for row in stored] == ["Acme"]
+    assert stats["near_duplicates"] == 1
+    assert {row["name"] for row in names if row["chunk_id"] == stored[0]["chunk_id"]} == {"Acme", "Globex"}
@@ -0,0 +1,52 @@
+import io
+
+import pytest
+
+from utils.doc_utils import DocumentProcessor, spool_upload
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 4 + b"%%EOF\n"
+
+
+@pytest.mark.parametrize("wrap", [bytearray, memoryview, lambda data: memoryview(bytearray(data))])
+def test_buffers_are_read_in_place(wrap):
+    buffer = wrap(PDF)
+    stream = DocumentProcessor._open_source(buffer)
+    assert stream.read(8) == PDF[:8]
+    assert stream.seek(-6, io.SEEK_END) == len(PDF) - 6
+    assert stream.read() == b"%%EOF\n"
+    stream.seek(0)
+    assert stream.read() == PDF
+
+    if not (isinstance(buffer, memoryview) and buffer.readonly):
+        # A change to the buffer shows through the stream, so it was not copied.
+        buffer[1] = ord("X")
+        stream.seek(0)
+        assert stream.read(4) == b"%XDF"
+
+
+def test_bytes_and_file_handles():
+    assert DocumentProcessor._open_source(PDF).read() == PDF
+    handle = io.BytesIO(PDF)
+    assert DocumentProcessor._open_source(handle) is handle
+    assert DocumentProcessor._open_source("policy.pdf") == "policy.pdf"
+
+
+def test_non_contiguous_views_are_copied():
+    view = memoryview(PDF)[::2]
+    assert DocumentProcessor._open_source(view).read() == PDF[::2]
+
+
+def test_readinto_and_tell():
+    stream = DocumentProcessor._open_source(bytearray(PDF))
+    target = bytearray(5)
+    assert stream.readinto(target) == 5 and bytes(target) == PDF[:5]
+    assert stream.tell() == 5
+    stream.seek(len(PDF) + 10)
+    assert stream.read(3) == b"" and stream.readinto(target) == 0
+
+
+def test_spool_upload_keeps_small_uploads_in_memory(tmp_path):
+    assert spool_upload(io.BytesIO(PDF), tmp_path) == PDF
+    path = spool_upload(io.BytesIO(PDF), tmp_path, max_memory=10)
+    with open(path, "rb") as f:
+        assert f.read() == PDF
@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("tqdm")
+
+from utils.evaluation import EvalRunner, RateLimiter, load_queries, query_id, summarize
+
+
+def test_load_queries_from_jsonl_and_csv(tmp_path):
+    jsonl = tmp_path / "queries.jsonl"
+    jsonl.write_text('{"id": "q1", "query": "Does Acme sell data?"}\n"  Is my data shared?  "\n\n{"query": ""}\n')
+    assert load_queries(str(jsonl)) == [
+        {"id": "q1", "query": "Does Acme sell data?"},
+        {"id": query_id("Is my data shared?"), "query": "Is my data shared?"},
+    ]
+
+    csv_path = tmp_path / "queries.csv"
+    csv_path.write_text("id,query\nq1,Does Acme sell data?\n,Is my data shared?\n")
+    assert [item["id"] for item in load_queries(str(csv_path))] == ["q1", query_id("Is my data shared?")]
+
+
+def test_duplicate_ids_are_rejected(tmp_path):
+    path = tmp_path / "queries.jsonl"
+    path.write_text('{"id": "q1", "query": "a"}\n{"id": "q1", "query": "b"}\n')
+    with pytest.raises(ValueError):
+        load_queries(str(path))
+
+
+def items(*queries):
+    return [{"id": f"q{i}", "query": query} for i, query in enumerate(queries)]
+
+
+def test_concurrency_is_bounded_and_results_keep_query_order():
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def evaluate(item):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return {"response": item["query"].upper()}
+
+    results = EvalRunner(evaluate, concurrency=3).run(items(*"abcdefghij"))
+    assert [result["response"] for result in results] == list("ABCDEFGHIJ")
+    assert 1 < peak[0] <= 3
+
+
+def test_resume_reruns_only_failed_queries(tmp_path):
+    checkpoint = str(tmp_path / "eval.checkpoint.jsonl")
+    calls = []
+
+    def flaky(item):
+        calls.append(item["id"])
+        if item["query"] == "b":
+            raise RuntimeError("rate limited")
+        return {"scores": {"Coherence": 1.0}}
+
+    first = EvalRunner(flaky, concurrency=2, checkpoint_path=checkpoint).run(items("a", "b", "c"))
+    assert [result["status"] for result in first] == ["ok", "error", "ok"]
+    assert first[1]["error"] == "rate limited"
+
+    calls.clear()
+    with open(checkpoint, "a", encoding="utf-8") as f:
+        f.write('{"id": "q0", "status": "ok", "cut short')
+    second = EvalRunner(lambda item: calls.append(item["id"]) or {}, checkpoint_path=checkpoint).run(
+        items("a", "b", "c"), resume=True
+    )
+    assert calls == ["q1"]
+    assert [result["status"] for result in second] == ["ok", "ok", "ok"]
+    assert [bool(result.get("resumed")) for result in second] == [True, False, True]
+
+    summary = summarize(second)
+    assert summary["queries"] == 3 and summary["resumed"] == 2 and summary["errors"] == 0
+    assert summary["scores"] == {"Coherence": 1.0}
+
+
+def test_checkpoint_is_rewritten_without_resume(tmp_path):
+    checkpoint = tmp_path / "eval.checkpoint.jsonl"
+    EvalRunner(lambda item: {}, checkpoint_path=str(checkpoint)).run(items("a", "b"))
+    EvalRunner(lambda item: {}, checkpoint_path=str(checkpoint)).run(items("a"))
+    assert [json.loads(line)["id"] for line in checkpoint.read_text().splitlines()] == ["q0"]
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(rate=50)
+    started = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - started >= 5 / 50 * 0.9
+    unlimited = RateLimiter()
+    assert unlimited.interval == 0.0
+
+
+def test_summarize_ignores_failures_and_resumed_latency():
+    results = [
+        {"id": "a", "status": "ok", "seconds": 1.0, "scores": {"Relevance": 0.5, "note": "n/a"}},
+        {"id": "b", "status": "ok", "seconds": 9.0, "resumed": True, "scores": {"Relevance": 1.0}},
+        {"id": "c", "status": "error", "seconds": 0.1},
+    ]
+    summary = summarize(results, wall_seconds=2.0)
+    assert summary["succeeded"] == 2 and summary["errors"] == 1
+    assert summary["latency_p50"] == 1.0 and summary["latency_p95"] == 1.0
+    assert summary["scores"] == {"Relevance": 0.75}
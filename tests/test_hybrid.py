@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("streamlit")
+pytest.importorskip("dotenv")
+
+from utils.hybrid import BM25Index, HybridRetriever
+
+ROWS = [
+    {"DATA": "Clause 14.2 sets the termination fee", "NAME": "Acme", "NAMES": ["Acme"]},
+    {"DATA": "Cookies are used for analytics", "NAME": "Acme", "NAMES": ["Acme"]},
+    {"DATA": "Viewing history is kept for two years", "NAME": "Netflix", "NAMES": ["Netflix"]},
+]
+
+
+def dense(*texts):
+    return lambda limit: [{"DATA": text} for text in texts[:limit]]
+
+
+def test_fuses_lexical_and_dense_results():
+    hybrid = HybridRetriever(BM25Index(ROWS))
+    response = hybrid.search("clause 14.2", ["DATA"], 3, dense_search=dense("Only the dense search finds this"))
+    texts = [result["DATA"] for result in response.results]
+    assert "Clause 14.2 sets the termination fee" in texts
+    assert "Only the dense search finds this" in texts
+
+
+def test_stats_belong_to_each_search():
+    hybrid = HybridRetriever(BM25Index(ROWS))
+    first = hybrid.search("cookies", ["DATA"], 2, dense_search=dense("a", "b"))
+    second = hybrid.search("history", ["DATA"], 2, dense_search=dense())
+    assert first.stats["fused_candidates"] == 3
+    assert second.stats["fused_candidates"] == 1
+    assert not hasattr(hybrid, "last_stats")
+
+
+def test_slow_dense_search_is_left_out():
+    def slow(limit):
+        time.sleep(0.5)
+        return [{"DATA": "too late"}]
+
+    hybrid = HybridRetriever(BM25Index(ROWS), dense_budget=0.05)
+    response = hybrid.search("cookies", ["DATA"], 2, dense_search=slow)
+    assert [result["DATA"] for result in response.results] == ["Cookies are used for analytics"]
+    assert response.stats["dense_seconds"] is None
+
+
+def test_lexical_search_honours_company_filter():
+    index = BM25Index(ROWS)
+    results = index.search("kept history cookies", ["DATA"], 5, {"@eq": {"NAME": "Netflix"}}).results
+    assert [result["DATA"] for result in results] == ["Viewing history is kept for two years"]
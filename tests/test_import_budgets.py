@@ -0,0 +1,22 @@
+import importlib.util
+
+import pytest
+
+from benchmarks.bench_imports import IMPORT_SETS, check_imports
+
+# Each set is imported in a fresh interpreter under `-X importtime`; it fails when it loads a
+# heavy module or goes over its budget. IMPORT_BUDGET_SCALE scales the budgets on slow machines.
+
+
+@pytest.mark.parametrize("set_name", ["app", "upload", "run"])
+def test_import_budget(set_name):
+    for name in IMPORT_SETS[set_name]["prelude"]:
+        if importlib.util.find_spec(name) is None:
+            pytest.skip(f"{name} is not installed")
+    try:
+        check_imports(set_name)
+    except RuntimeError as e:
+        # The set could not be imported at all, e.g. a dependency is not installed here.
+        if "ModuleNotFoundError" in str(e):
+            pytest.skip(str(e))
+        raise
@@ -0,0 +1,128 @@
+import time
+import threading
+
+import pytest
+
+from utils.jobs import JobQueue, JobCancelled, InMemoryJobStore, Job, SUCCEEDED, FAILED
+
+
+def wait_finished(queue, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status["state"] in ("succeeded", "failed", "cancelled"):
+            return status
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+@pytest.fixture
+def make_queue():
+    queues = []
+
+    def make(handler, **kwargs):
+        queue = JobQueue(handler, workers=1, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.close(wait=True)
+
+
+def test_succeeded_job_drops_its_payload(make_queue):
+    queue = make_queue(lambda job: len(job.payload["source"]))
+    job_id = queue.submit("owner", "doc.pdf", payload={"source": b"x" * 1024})
+    status = wait_finished(queue, job_id)
+    assert status["state"] == "succeeded" and status["result"] == 1024
+    assert queue.store.get(job_id).payload is None
+
+
+def test_failed_job_keeps_only_the_resume_payload(make_queue):
+    calls = []
+
+    def handler(job):
+        calls.append(job.payload)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        return "done"
+
+    queue = make_queue(handler, resume_payload=lambda job: {"path": "/tmp/doc.pdf"})
+    job_id = queue.submit("owner", "doc.pdf", payload={"source": b"x" * 1024, "path": "/tmp/doc.pdf"})
+    status = wait_finished(queue, job_id)
+    assert status["state"] == "failed" and status["resumable"]
+    assert queue.store.get(job_id).payload == {"path": "/tmp/doc.pdf"}
+
+    assert queue.resume(job_id)
+    assert wait_finished(queue, job_id)["state"] == "succeeded"
+    assert calls[1] == {"path": "/tmp/doc.pdf"}
+
+
+def test_job_without_resume_payload_cannot_be_resumed(make_queue):
+    queue = make_queue(lambda job: 1 / 0, resume_payload=lambda job: None)
+    job_id = queue.submit("owner", "doc.pdf", payload={"source": b"x"})
+    status = wait_finished(queue, job_id)
+    assert status["state"] == "failed" and not status["resumable"]
+    assert not queue.resume(job_id)
+
+
+def test_cancelled_queued_job_releases_its_payload(make_queue):
+    started, release = threading.Event(), threading.Event()
+
+    def handler(job):
+        started.set()
+        release.wait(5)
+
+    queue = make_queue(handler, resume_payload=lambda job: {"small": True})
+    first = queue.submit("owner", "first", payload={})
+    started.wait(5)
+    second = queue.submit("owner", "second", payload={"source": b"x" * 1024})
+    assert queue.cancel(second)
+    assert queue.store.get(second).payload == {"small": True}
+    release.set()
+    wait_finished(queue, first)
+
+
+def test_cancel_raises_at_next_report(make_queue):
+    started = threading.Event()
+
+    def handler(job):
+        started.set()
+        while True:
+            job.report("working")
+            time.sleep(0.01)
+
+    queue = make_queue(handler)
+    job_id = queue.submit("owner", "doc.pdf")
+    started.wait(5)
+    queue.cancel(job_id)
+    assert wait_finished(queue, job_id)["state"] == "cancelled"
+    with pytest.raises(JobCancelled):
+        queue.store.get(job_id).report("again")
+
+
+def finished_job(state, age, payload="payload"):
+    job = Job("owner", "doc.pdf", payload)
+    job.state = state
+    job.finished_at = time.time() - age
+    return job
+
+
+def test_store_evicts_finished_jobs_by_count_and_drops_their_payload():
+    store = InMemoryJobStore(max_finished=2, max_age=3600)
+    jobs = [finished_job(SUCCEEDED, age) for age in (30, 20, 10)]
+    for job in jobs:
+        store.put(job)
+    assert store.get(jobs[0].id) is None
+    assert jobs[0].payload is None and not jobs[0].resumable
+    assert store.get(jobs[1].id) is jobs[1] and store.get(jobs[2].id) is jobs[2]
+
+
+def test_store_evicts_finished_jobs_by_age_but_keeps_queued_ones():
+    store = InMemoryJobStore(max_finished=1000, max_age=60)
+    old, recent = finished_job(FAILED, 120), finished_job(FAILED, 10)
+    queued = Job("owner", "doc.pdf", "payload")
+    for job in (old, recent, queued):
+        store.put(job)
+    assert [job.id for job in store.list()] == [recent.id, queued.id]
+    assert old.payload is None
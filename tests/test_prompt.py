@@ -0,0 +1,70 @@
+from utils.prompt import PromptBuilder, NO_CONTEXT, estimate_tokens
+
+# Two neighbouring chunks as the splitter produces them: the last 50 characters of the first
+# are the first 50 of the second.
+OVERLAP = "so the retention period may be extended by law here"
+PREVIOUS = "We keep your account data for as long as the account is open, " + OVERLAP
+NEXT = OVERLAP + ", after which it is deleted within thirty days."
+
+
+def context_lines(prompt):
+    section = prompt.split("Context:\n", 1)[1].split("\nPrevious Context:", 1)[0]
+    return [line for line in section.splitlines() if line]
+
+
+def test_trims_overlap_with_the_previous_chunk():
+    prompt, stats = PromptBuilder().build("how long?", [PREVIOUS, NEXT])
+    assert context_lines(prompt) == [f"[1] {PREVIOUS}", "[2] , after which it is deleted within thirty days."]
+    assert stats["overlap_chars_removed"] == len(OVERLAP)
+
+
+def test_trims_overlap_with_the_next_chunk():
+    prompt, stats = PromptBuilder().build("how long?", [NEXT, PREVIOUS])
+    assert context_lines(prompt) == [
+        f"[1] {NEXT}",
+        "[2] We keep your account data for as long as the account is open,",
+    ]
+    assert stats["overlap_chars_removed"] == len(OVERLAP)
+
+
+def test_drops_contained_chunks_and_the_no_context_placeholder():
+    prompt, stats = PromptBuilder().build("q", [PREVIOUS, "the account is open", NO_CONTEXT, "  "])
+    assert context_lines(prompt) == [f"[1] {PREVIOUS}"]
+    assert stats["contexts_used"] == 1
+
+
+def test_no_context_placeholder_alone_packs_nothing():
+    prompt, stats = PromptBuilder().build("q", [NO_CONTEXT])
+    assert context_lines(prompt) == []
+    assert NO_CONTEXT not in prompt
+
+
+def test_packs_contexts_greedily_within_the_budget():
+    builder = PromptBuilder(budget_tokens=0, answer_tokens=0, history_tokens=0)
+    fixed = estimate_tokens(builder.template.format(context="", history="", query="q"))
+    big, small = "x" * 400, "small chunk"
+    # Room for the small chunk and one big one, but not two big ones.
+    builder.budget_tokens = fixed + 2 * (estimate_tokens(f"[1] {big}") + 1) - 1
+    prompt, stats = builder.build("q", [big, "y" * 400, small])
+    assert context_lines(prompt) == [f"[1] {big}", f"[2] {small}"]
+    assert stats["contexts_used"] == 2 and stats["contexts_dropped"] == 1
+    assert stats["prompt_tokens"] <= builder.budget_tokens
+
+
+def test_history_keeps_the_most_recent_part_within_its_budget():
+    history = " ".join(f"turn{i}" for i in range(200))
+    prompt, stats = PromptBuilder(history_tokens=20).build("q", [], history)
+    kept = prompt.split("Previous Context: ", 1)[1].split("\nQuestion:", 1)[0]
+    assert history.endswith(kept) and kept.endswith("turn199")
+    assert stats["history_tokens"] <= 20
+
+
+def test_history_uses_the_builders_token_counter():
+    def count_words(text):
+        return len(text.split())
+
+    history = " ".join(f"w{i}" for i in range(100))
+    prompt, stats = PromptBuilder(history_tokens=10, count_tokens=count_words).build("q", [], history)
+    kept = prompt.split("Previous Context: ", 1)[1].split("\nQuestion:", 1)[0]
+    assert kept.split() == [f"w{i}" for i in range(90, 100)]
+    assert stats["history_tokens"] == 10
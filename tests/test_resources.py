@@ -0,0 +1,91 @@
+import pytest
+
+from utils.resources import shared_resource, teardown_resources, resource_stats, file_version
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    yield
+    teardown_resources()
+
+
+class Resource:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+
+def test_builds_once_per_arguments():
+    built = []
+
+    @shared_resource()
+    def get_resource(name):
+        built.append(name)
+        return Resource(name)
+
+    assert get_resource("a") is get_resource("a")
+    assert get_resource("b") is not get_resource("a")
+    assert built == ["a", "b"]
+    assert get_resource.peek("a").name == "a" and get_resource.peek("c") is None
+
+
+def test_none_is_not_cached():
+    state = {"configured": False}
+
+    @shared_resource()
+    def get_resource():
+        return Resource("x") if state["configured"] else None
+
+    assert get_resource() is None
+    state["configured"] = True
+    resource = get_resource()
+    assert resource is not None and get_resource() is resource
+
+
+def test_changed_version_closes_and_rebuilds():
+    state = {"version": 1}
+
+    @shared_resource(close=lambda resource: setattr(resource, "closed", True), version=lambda: state["version"])
+    def get_resource():
+        return Resource(state["version"])
+
+    first = get_resource()
+    assert get_resource() is first
+    state["version"] = 2
+    second = get_resource()
+    assert second is not first and second.name == 2
+    assert first.closed and not second.closed
+
+
+def test_teardown_closes_newest_first():
+    closed = []
+
+    @shared_resource(close=lambda resource: closed.append(resource.name))
+    def get_resource(name):
+        return Resource(name)
+
+    get_resource("old")
+    get_resource("new")
+    assert sum(name.endswith("get_resource") for name in resource_stats()) == 2
+    teardown_resources()
+    assert closed == ["new", "old"]
+    assert get_resource.peek("old") is None
+
+
+def test_clear_rebuilds_on_next_call():
+    @shared_resource()
+    def get_resource():
+        return Resource("x")
+
+    first = get_resource()
+    get_resource.clear()
+    assert get_resource() is not first
+
+
+def test_file_version_follows_the_file(tmp_path):
+    path = tmp_path / "companies.json"
+    assert file_version(str(path)) == (str(path), None)
+    path.write_text("{}")
+    created = file_version(str(path))
+    assert created[1] is not None
+    assert file_version(None) == (None, None)
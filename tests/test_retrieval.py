@@ -0,0 +1,91 @@
+import csv
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("streamlit")
+pytest.importorskip("dotenv")
+
+from utils.retrieval import LocalIndexWriter, LocalVectorIndex, RetrievalBackend, index_version
+
+ROWS = [
+    {"name": "Acme", "data": "Cookies are used for analytics and advertising", "chunk_id": "c1"},
+    {"name": "Acme", "data": "You can close your account at any time", "chunk_id": "c2"},
+    {"name": "Netflix", "data": "Viewing history is kept for two years", "chunk_id": "c3"},
+    {"name": "Netflix", "data": "Analytics cookies can be turned off in settings", "chunk_id": "c4"},
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    with LocalIndexWriter(tmp_path, batch_size=2) as writer:
+        writer.writerows(ROWS)
+        # c1 is shared with Globex after deduplication.
+        writer.names_writer.writerow({"chunk_id": "c1", "name": "Acme"})
+        writer.names_writer.writerow({"chunk_id": "c1", "name": "Globex"})
+    return LocalVectorIndex.open(tmp_path)
+
+
+def texts(response):
+    return [result["DATA"] for result in response.results]
+
+
+def test_backend_requires_search():
+    with pytest.raises(TypeError):
+        RetrievalBackend()
+
+
+def test_top_k_is_ordered_by_score(index):
+    response = index.search("analytics cookies", ["DATA"], 2)
+    assert sorted(texts(response)) == sorted([ROWS[0]["data"], ROWS[3]["data"]])
+    scores = [result["@score"] for result in response.results]
+    assert scores == sorted(scores, reverse=True)
+    assert len(index.search("analytics cookies", ["DATA"], 10).results) == len(ROWS)
+
+
+def test_top_k_across_blocks_matches_a_single_block(index):
+    expected = texts(index.search("cookies account history", ["DATA"], 3))
+    index.block_size = 1
+    assert texts(index.search("cookies account history", ["DATA"], 3)) == expected
+
+
+def test_filters_restrict_to_the_company(index):
+    assert texts(index.search("analytics cookies", ["DATA"], 5, {"@eq": {"NAME": "Netflix"}})) == [
+        ROWS[3]["data"],
+        ROWS[2]["data"],
+    ]
+    assert texts(index.search("cookies", ["DATA"], 5, {"@contains": {"NAMES": "Globex"}})) == [ROWS[0]["data"]]
+    assert index.search("cookies", ["DATA"], 5, {"@eq": {"NAME": "Nobody"}}).results == []
+    with pytest.raises(ValueError):
+        index.search("cookies", ["DATA"], 5, {"@eq": {"SOURCE": "x"}})
+
+
+def test_writer_hides_the_index_until_closed(tmp_path, index):
+    path = tmp_path / "rebuilt"
+    writer = LocalIndexWriter(path)
+    assert index_version(str(path))[1] is None
+    writer.close()
+    assert index_version(str(path))[1] is not None
+
+
+def test_build_from_csv(tmp_path):
+    pytest.importorskip("tqdm")
+    from utils.datasets import CSV_FIELDS
+    from utils.dedup import NAME_FIELDS
+
+    csv_path = tmp_path / "chunks.csv"
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        for row in ROWS:
+            writer.writerow({**row, "source": f"{row['name']}/policy.json", "page": 0, "simhash": 0})
+    with open(f"{csv_path}.names.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=NAME_FIELDS)
+        writer.writerow({"chunk_id": "c3", "name": "Netflix", "source": "Netflix/policy.json"})
+        writer.writerow({"chunk_id": "c3", "name": "Hulu", "source": "Hulu/policy.json"})
+
+    index = LocalVectorIndex.build_from_csv(str(csv_path), str(tmp_path / "index"))
+    assert len(index.rows) == len(ROWS)
+    assert index.rows[2]["NAMES"] == ["Hulu", "Netflix"]
+    assert index.rows[0]["NAMES"] == ["Acme"]
+    assert texts(index.search("viewing history", ["DATA"], 1, {"@contains": {"NAMES": "Hulu"}})) == [ROWS[2]["data"]]
+    assert index.search("viewing history", ["SOURCE"], 1).results[0]["SOURCE"] == "Netflix/policy.json"
@@ -0,0 +1,116 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("dotenv")
+
+from utils.service_pool import ServicePool, HEARTBEAT_PREFIX
+
+
+def slot_name(instance, char="A"):
+    return f"POOL_SLOT_{instance}_{char * 32}"
+
+
+class FakeSession:
+    def __init__(self, connector):
+        self.connector = connector
+        self._last = None
+
+    def sql(self, statement):
+        self._last = " ".join(statement.split())
+        self.connector.statements.append(self._last)
+        return self
+
+    def collect(self):
+        if self._last.startswith("SHOW SCHEMAS"):
+            return list(self.connector.schemas)
+        return []
+
+
+class FakeConnector:
+    def __init__(self, schemas=()):
+        self.schemas = list(schemas)
+        self.statements = []
+
+    @contextmanager
+    def lease(self):
+        yield FakeSession(self)
+
+    def dropped(self):
+        prefix = "DROP SCHEMA IF EXISTS DB."
+        return {s[len(prefix):] for s in self.statements if s.startswith(prefix)}
+
+
+def started_pool(connector, **kwargs):
+    """A pool whose provisioner ran its start-up pass and stopped, so tests drive it by hand."""
+    pool = ServicePool(connector, "DB", "WH", target_ready=0, interval=60, instance="host-1", **kwargs)
+    deadline = time.time() + 5
+    while not pool._last_heartbeat and time.time() < deadline:
+        time.sleep(0.01)
+    pool._closed = True
+    pool._wakeup.set()
+    pool._thread.join(5)
+    return pool
+
+
+def row(name, comment=None, created_on=None):
+    return {"name": name, "comment": comment, "created_on": created_on}
+
+
+def test_drops_own_leftover_and_stale_slots_of_any_instance():
+    now = time.time()
+    schemas = [
+        row(slot_name("HOST_1", "A"), f"{HEARTBEAT_PREFIX}{int(now)}"),
+        row(slot_name("HOST_2", "B"), f"{HEARTBEAT_PREFIX}{int(now)}"),
+        row(slot_name("HOST_3", "C"), f"{HEARTBEAT_PREFIX}{int(now - 2 * 86400)}"),
+        row(slot_name("HOST_4", "D"), created_on=datetime.fromtimestamp(now - 2 * 86400, timezone.utc)),
+        row(slot_name("HOST_5", "E"), created_on=datetime.fromtimestamp(now, timezone.utc)),
+        row("POOL_SLOT_NOT_A_SLOT", f"{HEARTBEAT_PREFIX}0"),
+        # Instance "HOST_1_X" starts with this instance's prefix but is another instance.
+        row(slot_name("HOST_1_X", "F"), f"{HEARTBEAT_PREFIX}{int(now)}"),
+    ]
+    connector = FakeConnector(schemas)
+    started_pool(connector)
+    assert connector.dropped() == {slot_name("HOST_1", "A"), slot_name("HOST_3", "C"), slot_name("HOST_4", "D")}
+
+
+def test_heartbeat_stamps_every_slot_of_this_instance():
+    connector = FakeConnector()
+    pool = started_pool(connector)
+    slot = pool._create_slot()
+    pool._ready.append(slot)
+    assert any(s.startswith(f"CREATE SCHEMA IF NOT EXISTS DB.{slot.schema} COMMENT = '{HEARTBEAT_PREFIX}") for s in connector.statements)
+
+    connector.statements.clear()
+    pool.heartbeat_slots()
+    assert len(connector.statements) == 1
+    assert connector.statements[0].startswith(f"ALTER SCHEMA IF EXISTS DB.{slot.schema} SET COMMENT = '{HEARTBEAT_PREFIX}")
+
+    # A live slot of this instance is never dropped as stale.
+    connector.schemas = [row(slot.schema, f"{HEARTBEAT_PREFIX}0")]
+    connector.statements.clear()
+    pool.drop_stale_slots()
+    assert connector.dropped() == set()
+
+
+def test_stale_after_stays_above_heartbeat_interval():
+    pool = started_pool(FakeConnector(), heartbeat_interval=600, stale_after=60)
+    assert pool.stale_after == 1800
+
+
+def test_expired_lease_cannot_touch_the_recycled_slot():
+    connector = FakeConnector()
+    pool = started_pool(connector, lease_ttl=0, max_ready=2)
+    pool._ready.append(pool._create_slot())
+
+    first = pool.lease()
+    pool._expire_leases()
+    pool._recycle_dirty()
+    second = pool.lease()
+    assert second.slot is first.slot
+    assert not pool.heartbeat(first) and not pool.is_leased(first)
+    pool.release(first)
+    assert pool.is_leased(second)
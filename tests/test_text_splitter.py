@@ -0,0 +1,72 @@
+import random
+import pytest
+from utils.text_splitter import TextSplitter, clean_chunk
+
+"""
+Parity of `utils.text_splitter.TextSplitter` with LangChain's `RecursiveCharacterTextSplitter`,
+which it replaces. Skipped when LangChain's splitter is not installed.
+"""
+
+try:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+except ImportError:
+    RecursiveCharacterTextSplitter = pytest.importorskip("langchain.text_splitter").RecursiveCharacterTextSplitter
+
+
+def _policy_text():
+    clause = (
+        "We collect information you provide directly to us, such as when you create an account, "
+        "fill out a form, or communicate with us. This may include your name, e-mail address and "
+        "payment details (card number, expiry date)."
+    )
+    sections = []
+    for number in range(1, 9):
+        paragraphs = [f"{number}.{i} {clause}" for i in range(1, number % 4 + 2)]
+        sections.append(f"Section {number}: Terms\n" + "\n".join(paragraphs))
+    return "\n\n".join(sections)
+
+
+def _random_text(seed, length=5000):
+    rng = random.Random(seed)
+    alphabet = ["a", "b", "c", "Z", "9", "é", "-", ".", " ", " ", " ", "\n", "\n\n", "\t", "  "]
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+TEXTS = {
+    "empty": "",
+    "whitespace": " \n\n \t \n ",
+    "short": "Termify explains terms and conditions.",
+    "policy": _policy_text(),
+    "no_separators": "x" * 2500,
+    "long_words": " ".join(["supercalifragilistic" * 8] * 30),
+    "newlines_only": "line of text\n" * 300,
+    "blank_line_runs": "para one\n\n\n\n\npara two\n\n\n" * 80,
+    "unicode": "Datenschutzerklärung für Nutzer — “Privatsphäre” 数据保护 " * 60,
+    "random_1": _random_text(1),
+    "random_2": _random_text(2, 12000),
+}
+
+SIZES = [(700, 50), (1000, 200), (100, 20), (50, 0), (20, 10), (10, 10)]
+
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", SIZES)
+@pytest.mark.parametrize("name", sorted(TEXTS))
+def test_split_text_matches_langchain(name, chunk_size, chunk_overlap):
+    text = TEXTS[name]
+    expected = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_text(text)
+    assert TextSplitter(chunk_size, chunk_overlap).split_text(text) == expected
+
+
+@pytest.mark.parametrize("name", ["policy", "random_1", "unicode"])
+def test_split_and_clean_matches_langchain(name):
+    text = TEXTS[name]
+    expected = [
+        clean_chunk(chunk)
+        for chunk in RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=50).split_text(text)
+    ]
+    assert list(TextSplitter(700, 50).split_and_clean(text)) == expected
+
+
+def test_overlap_larger_than_chunk_size_is_rejected():
+    with pytest.raises(ValueError):
+        TextSplitter(chunk_size=10, chunk_overlap=20)
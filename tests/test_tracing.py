@@ -0,0 +1,139 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("dotenv")
+
+from utils.tracing import NOOP_SPAN, OTelJSONExporter, PrometheusExporter, Span, Tracer
+
+
+class Collector:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+def finished(name, seconds, status="ok", **attributes):
+    span = Span(None, name, attributes=attributes)
+    span.start_ns, span.end_ns = 1_000_000_000, 1_000_000_000 + int(seconds * 1e9)
+    span.status = status
+    if status == "error":
+        span.error = "TimeoutError: search timed out"
+    return span
+
+
+def metrics(text):
+    """{'name{labels}': value} for the sample lines of a Prometheus text exposition."""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            key, value = line.rsplit(" ", 1)
+            samples[key] = float(value)
+    return samples
+
+
+def test_prometheus_render():
+    exporter = PrometheusExporter(namespace="t")
+    exporter.export(finished("search", 0.02, cache_hit=True))
+    exporter.export(finished("search", 0.3, cache_hit=False))
+    exporter.export(finished("search", 100.0, status="error"))
+    exporter.export(finished("complete", 1.5, prompt_tokens=120, completion_tokens=30))
+    exporter.export(finished("complete", 0.7, prompt_tokens=80, completion_tokens=0))
+
+    text = exporter.render()
+    assert "# TYPE t_stage_seconds histogram" in text
+    samples = metrics(text)
+    # Buckets are cumulative and +Inf counts every span, also those above the last bound.
+    assert samples['t_stage_seconds_bucket{stage="search",le="0.01"}'] == 0
+    assert samples['t_stage_seconds_bucket{stage="search",le="0.025"}'] == 1
+    assert samples['t_stage_seconds_bucket{stage="search",le="0.5"}'] == 2
+    assert samples['t_stage_seconds_bucket{stage="search",le="60.0"}'] == 2
+    assert samples['t_stage_seconds_bucket{stage="search",le="+Inf"}'] == 3
+    assert samples['t_stage_seconds_count{stage="search"}'] == 3
+    assert samples['t_stage_seconds_sum{stage="search"}'] == pytest.approx(100.32)
+    assert samples['t_stage_errors_total{stage="search"}'] == 1
+    assert samples['t_tokens_total{stage="complete",kind="prompt"}'] == 200
+    assert samples['t_tokens_total{stage="complete",kind="completion"}'] == 30
+    assert samples['t_cache_lookups_total{stage="search",result="hit"}'] == 1
+    assert samples['t_cache_lookups_total{stage="search",result="miss"}'] == 1
+    assert 't_stage_errors_total{stage="complete"}' not in samples
+
+
+def test_otlp_mapping(tmp_path):
+    parent = finished("rag.query", 2.0)
+    child = Span(None, "search", parent=parent, attributes={
+        "service": "DB.SC.SVC", "cache_hit": False, "results": 5, "score": 0.5, "filtered": None,
+    })
+    child.start_ns, child.end_ns = 1_000_000_000, 1_250_000_000
+    exporter = OTelJSONExporter(str(tmp_path / "traces.jsonl"), service_name="svc")
+    try:
+        document = exporter.to_otlp(child)
+        error = exporter.to_otlp(finished("complete", 1.0, status="error"))["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    finally:
+        exporter.close()
+
+    resource_spans = document["resourceSpans"][0]
+    assert resource_spans["resource"]["attributes"] == [{"key": "service.name", "value": {"stringValue": "svc"}}]
+    span = resource_spans["scopeSpans"][0]["spans"][0]
+    assert span["traceId"] == parent.trace_id and len(span["traceId"]) == 32
+    assert span["spanId"] == child.span_id and len(span["spanId"]) == 16
+    assert span["parentSpanId"] == parent.span_id
+    assert span["startTimeUnixNano"] == "1000000000" and span["endTimeUnixNano"] == "1250000000"
+    assert span["attributes"] == [
+        {"key": "service", "value": {"stringValue": "DB.SC.SVC"}},
+        {"key": "cache_hit", "value": {"boolValue": False}},
+        {"key": "results", "value": {"intValue": "5"}},
+        {"key": "score", "value": {"doubleValue": 0.5}},
+    ]
+    assert span["status"] == {"code": 1}
+    assert error["parentSpanId"] == ""
+    assert error["status"] == {"code": 2, "message": "TimeoutError: search timed out"}
+
+
+def test_otel_exporter_writes_one_document_per_line(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer([OTelJSONExporter(str(path))])
+    with tracer.trace("rag.query"):
+        with tracer.span("search"):
+            pass
+    tracer.close()
+    assert len(path.read_text().splitlines()) == 2
+
+
+def test_spans_keep_their_parent_across_copied_contexts():
+    collector = Collector()
+    tracer = Tracer([collector])
+
+    def stage(name):
+        with tracer.span(name):
+            pass
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        with tracer.trace("rag.query", request_id="a" * 32) as root:
+            executor.submit(contextvars.copy_context().run, stage, "search").result()
+            # Without the copied context the worker thread starts a trace of its own.
+            executor.submit(stage, "orphan").result()
+
+    spans = {span.name: span for span in collector.spans}
+    assert len(collector.spans) == 3
+    assert spans["search"].trace_id == root.trace_id == "a" * 32
+    assert spans["search"].parent_id == root.span_id
+    assert spans["orphan"].parent_id is None and spans["orphan"].trace_id != root.trace_id
+    assert tracer.current() is NOOP_SPAN
+
+
+def test_errors_are_recorded_and_disabled_tracer_is_a_noop():
+    collector = Collector()
+    tracer = Tracer([collector])
+    with pytest.raises(RuntimeError):
+        with tracer.span("complete"):
+            raise RuntimeError("boom")
+    assert collector.spans[0].status == "error" and collector.spans[0].error == "RuntimeError: boom"
+
+    disabled = Tracer([collector], enabled=False)
+    assert disabled.span("search") is NOOP_SPAN and disabled.trace("rag.query") is NOOP_SPAN
+    assert Tracer().span("search") is NOOP_SPAN
@@ -1,50 +1,93 @@
-from snowflake.core.schema import Schema
-from snowflake.core._common import DeleteMode
 import streamlit as st
-from utils.doc_utils import DocumentProcessor
-from utils.secret_loader import get_secret
+import os
+import io
+import threading
+from contextlib import contextmanager
+from utils.doc_utils import DocumentProcessor, spool_upload
+from utils.secret_loader import get_settings
+from utils.bulk_loader import StageLoader
+from utils.cache import retrieval_cache
+from utils.jobs import JobQueue, JobCancelled
+from utils.resources import shared_resource
 
 class customCortex(DocumentProcessor):
-    def __init__(self, session, root, schema, service_name,chunk_size=700, overlap=50):
+    def __init__(self, session, root, schema, service_name,chunk_size=700, overlap=50, connector=None, service_pool=None):
         super().__init__(chunk_size=chunk_size, overlap=overlap)
         self.session = session
+        # With a connector, each operation leases a pooled session for its duration.
+        self.connector = connector
         self.table_name = "DATA"
         self.root = root
         self.schema = schema
-        self.database = get_secret("USER_DATABASE")
+        settings = get_settings()
+        self.database = settings.user_database
         self.cortex_service_name = service_name
-        self.WAREHOUSE = get_secret("SNOWFLAKE_WAREHOUSE")
+        # Names of the session's own schema and service, used again once a pooled lease is lost.
+        self._own_names = (self.database, schema, service_name)
+        self.WAREHOUSE = settings.snowflake_warehouse
+        # Pre-created schemas and services; a leased slot replaces schema and service_name.
+        self.service_pool = service_pool
+        self.lease = None
+        # One upload at a time: uploads share the schema, the service and the lease.
+        self._upload_lock = threading.Lock()
 
-    def _create_schema(self):
+    @contextmanager
+    def _leased(self):
+        """Yields (session, root): the instance's own, or a pooled session leased for the duration."""
+        if self.connector is None:
+            yield self.session, self.root
+            return
+        with self.connector.lease() as session:
+            yield session, self.connector.root_for(session)
+
+    @staticmethod
+    def _reporter(progress=None):
+        # Progress goes to the job callback when one is set, otherwise straight to the page.
+        if progress is not None:
+            return progress
+        return lambda message, fraction=None: st.write(message)
+
+    def _create_schema(self, session, report):
         try:
-            st.write("Creating Your personal Schema")
-            self.session.sql(f"USE DATABASE {self.database}").collect()
-            self.session.sql(f"CREATE SCHEMA IF NOT EXISTS {self.schema}").collect()
-            st.success("Schema created successfully")
+            report("Creating Your personal Schema", 0.05)
+            session.sql(f"USE DATABASE {self.database}").collect()
+            session.sql(f"CREATE SCHEMA IF NOT EXISTS {self.schema}").collect()
+            report("Schema created successfully", 0.1)
             return True
+        except JobCancelled:
+            # Raised by the progress callback; the job queue handles it.
+            raise
         except Exception as err:
-            st.warning(f"Some unExpected Error occured...{err}")
+            report(f"Some unExpected Error occured...{err}")
             return False
 
 
-    async def _upload_data(self, pdf_path):
-        st.write("Loading pdf...")
-        raw_texts = await self.pdfLoader(pdf_path)
-        st.write("Cleaning texts and DataFrame...")
-        return self.chunkCreator(raw_texts)
+    def _bulk_loader(self, session):
+        return StageLoader(
+            session,
+            f"{self.database}.{self.schema}.{self.table_name}",
+            {"CHUNKS": "VARCHAR", "PAGE": "NUMBER"},
+        )
 
-    def _store_data(self, df):
-        st.write("Creating dataframe...")
-        resultsdf = self.session.create_dataframe(df)
-        st.write("saving in snowflake table...")
-        resultsdf.write.save_as_table(self.table_name, mode="append")
+    async def _store_data(self, session, pdf_path, report, report_every=500):
+        report("Loading pdf and saving chunks in snowflake table...", 0.15)
+        # Nothing reaches the table unless the loader closes cleanly, so a cancelled or
+        # failed load can simply be run again.
+        with self._bulk_loader(session) as loader:
+            count = 0
+            async for chunk in self.iter_chunks(pdf_path):
+                loader.writerow(chunk)
+                count += 1
+                if count % report_every == 0:
+                    report(f"Processed {count} chunks")
+        report(f"Saved {loader.rows_written} chunks", 0.8)
 
-    def _createCortexService(self):
+    def _createCortexService(self, session, report):
         try:
-            self.session.sql(f"USE DATABASE {self.database}").collect()
-            self.session.sql(f"USE SCHEMA {self.schema}").collect()
+            session.sql(f"USE DATABASE {self.database}").collect()
+            session.sql(f"USE SCHEMA {self.schema}").collect()
             cmd =f"""
-            CREATE CORTEX SEARCH SERVICE {self.cortex_service_name}
+            CREATE CORTEX SEARCH SERVICE IF NOT EXISTS {self.cortex_service_name}
               ON CHUNKS
               WAREHOUSE = {self.WAREHOUSE}
               TARGET_LAG = '1 days'
@@ -55,26 +98,138 @@ class customCortex(DocumentProcessor):
               FROM {self.table_name}
             );
             """
-            self.session.sql(cmd).collect()
+            session.sql(cmd).collect()
+            service_id = f"{self.database}.{self.schema}.{self.cortex_service_name}"
+            retrieval_cache.invalidate(lambda key: key[1] == service_id)
 
-            st.success("Successfully create CortexSearchService")
-        except:
-            st.warning("Something went Wrong while Creating CortexSearchService")
+            report("Successfully create CortexSearchService", 1.0)
+            return True
+        except JobCancelled:
+            raise
+        except Exception:
+            report("Something went Wrong while Creating CortexSearchService")
+            return False
+
+    def has_service(self):
+        """False once a leased slot expired and was recycled for someone else."""
+        if self.lease is None:
+            return True
+        if self.service_pool.heartbeat(self.lease):
+            return True
+        self._drop_lease()
+        return False
+
+    def _use_slot(self):
+        lease = self.service_pool.lease() if self.service_pool else None
+        if lease is None:
+            return False
+        self.lease = lease
+        self.database, self.schema = lease.slot.database, lease.slot.schema
+        self.cortex_service_name = lease.slot.service_name
+        return True
+
+    def _drop_lease(self):
+        # The slot may already belong to someone else; never touch it again.
+        self.lease = None
+        self.database, self.schema, self.cortex_service_name = self._own_names
 
     def delete_schema(self):
+        if self.lease is not None:
+            # Pooled slots are emptied and reused rather than dropped.
+            self.service_pool.release(self.lease)
+            self.lease = None
+            return
         try:
-            schema_res = self.root.databases[self.database].schemas[self.schema]
-            schema_res.drop()
+            with self._leased() as (_, root):
+                schema_res = root.databases[self.database].schemas[self.schema]
+                schema_res.drop()
 
         except:
             print("Some unExpected error occured during deletion of schema")
 
-    async def Create_service(self, file_path):
-        created_schema = self._create_schema()
-        if created_schema:
-            df = await self._upload_data(file_path)
-            self._store_data(df)
-            self._createCortexService()
+    async def Create_service(self, file_path, progress=None, checkpoint=None):
+        """
+        Chunks the document into the user's table and makes it searchable. Returns True on success.
+
+        progress: optional callable(message, fraction) used instead of writing to the page.
+        checkpoint: optional dict of finished steps; a retried upload skips those steps
+            (chunks are only skipped if they went into the same schema).
+
+        Returns False at once while another upload of this session is still running.
+        """
+        checkpoint = {} if checkpoint is None else checkpoint
+        report = self._reporter(progress)
+        if not self._upload_lock.acquire(blocking=False):
+            report("Another upload is still being processed, please wait for it to finish")
+            return False
+        try:
+            if self.lease is not None and not self.service_pool.is_leased(self.lease):
+                self._drop_lease()
+            if self.lease is not None or self._use_slot():
+                if checkpoint.get("stored") != self.schema:
+                    with self._leased() as (session, _):
+                        # Checked again right before truncating: an expired lease's slot may
+                        # already hold another user's document.
+                        if not self.service_pool.heartbeat(self.lease):
+                            self._drop_lease()
+                            report("Your search service expired, please upload again")
+                            return False
+                        # The slot's table and service already exist; only the chunks are new.
+                        session.sql(f"TRUNCATE TABLE IF EXISTS {self.lease.slot.qualified_table}").collect()
+                        await self._store_data(session, file_path, report)
+                    checkpoint["stored"] = self.schema
+                report("Refreshing your search service...", 0.9)
+                self.service_pool.refresh(self.lease.slot)
+                report("Successfully create CortexSearchService", 1.0)
+                return True
+            with self._leased() as (session, _):
+                if not checkpoint.get("schema") and not self._create_schema(session, report):
+                    return False
+                checkpoint["schema"] = True
+                if checkpoint.get("stored") != self.schema:
+                    await self._store_data(session, file_path, report)
+                    checkpoint["stored"] = self.schema
+                return self._createCortexService(session, report)
+        finally:
+            self._upload_lock.release()
+
+
+async def ingest_upload(job):
+    """
+    JobQueue handler: payload holds the session's `cortex` and the upload `source`, either the
+    document's bytes or the path it was spooled to (see `spool_upload`), and optionally the
+    `spool_dir` a failed upload's bytes are moved to.
+    """
+    cortex, source = job.payload["cortex"], job.payload["source"]
+    if not await cortex.Create_service(source, progress=job.report, checkpoint=job.checkpoint):
+        raise RuntimeError(job.messages[-1] if job.messages else "Upload failed")
+    if isinstance(source, str) and os.path.exists(source):
+        os.remove(source)
+    return {"schema": cortex.schema, "service_name": cortex.cortex_service_name}
+
+
+def upload_resume_payload(job):
+    """
+    What a failed or cancelled upload keeps to be resumed: the session's `cortex` and the path of
+    the document. A document held in memory is spooled to the payload's `spool_dir` first; without
+    one the upload can't be resumed.
+    """
+    source = job.payload["source"]
+    if not isinstance(source, str):
+        spool_dir = job.payload.get("spool_dir")
+        if not spool_dir or not os.path.isdir(spool_dir):
+            return None
+        document = io.BytesIO(source)
+        document.name = job.name
+        source = spool_upload(document, spool_dir, max_memory=-1)
+    return {"cortex": job.payload["cortex"], "source": source, "spool_dir": job.payload.get("spool_dir")}
+
+
+@shared_resource(close=lambda queue: queue.close())
+def get_upload_queue():
+    """Returns the process-wide queue that ingests uploads for every Streamlit session."""
+    workers = int(get_settings().get("UPLOAD_WORKERS", 4))
+    return JobQueue(ingest_upload, workers=workers, resume_payload=upload_resume_payload)
 
 
-__all__ = ["customCortex"]
+__all__ = ["customCortex", "ingest_upload", "upload_resume_payload", "get_upload_queue"]
@@ -0,0 +1,229 @@
+import re
+import math
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from utils.secret_loader import get_settings
+from utils.resources import shared_resource
+
+"""
+AnswerCache Class:
+
+Opt-in cache for `RAG.generate_completion`. An answer is stored under the fingerprint of the
+retrieved contexts it was generated from, and served again for a later question that retrieved
+the same contexts and whose wording is similar enough (cosine similarity of character trigrams
+at or above `threshold`). Comparing only within one context fingerprint keeps the candidate
+set tiny and guarantees the cached answer was grounded in the same text.
+
+Backends:
+    InMemoryAnswerBackend: per-process store, shared by every session of the app.
+    SqliteAnswerBackend: a SQLite file that several app replicas on the same host or volume
+        can share.
+
+Both evict by `eviction` ("lru", "lfu" or "fifo") once `max_entries` is exceeded and drop
+entries older than `ttl` seconds.
+
+Configuration (see `get_answer_cache`):
+    ANSWER_CACHE            "memory" or "sqlite"; unset disables the cache.
+    ANSWER_CACHE_PATH       SQLite file for the "sqlite" backend.
+    ANSWER_CACHE_THRESHOLD  Similarity threshold, defaults to 0.9.
+"""
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def _normalize(text):
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def _trigrams(text):
+    padded = f"  {_normalize(text)} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def query_similarity(a, b):
+    """Cosine similarity of the character trigram counts of two questions."""
+    va, vb = _trigrams(a), _trigrams(b)
+    dot = sum(count * vb[gram] for gram, count in va.items())
+    norm = math.sqrt(sum(c * c for c in va.values())) * math.sqrt(sum(c * c for c in vb.values()))
+    return dot / norm if norm else 0.0
+
+
+def context_fingerprint(contexts):
+    digest = hashlib.sha256()
+    for context in contexts:
+        digest.update(str(context).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class InMemoryAnswerBackend:
+    def __init__(self, max_entries=2048, ttl=86400, eviction="lru"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.eviction = eviction
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def candidates(self, fingerprint):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            return [
+                (entry_id, entry["query"], entry["answer"])
+                for entry_id, entry in self._entries.items()
+                if entry["fingerprint"] == fingerprint and entry["created_at"] >= cutoff
+            ]
+
+    def touch(self, entry_id):
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is not None:
+                entry["hits"] += 1
+                if self.eviction == "lru":
+                    self._entries.move_to_end(entry_id)
+
+    def put(self, fingerprint, query, answer):
+        with self._lock:
+            self._next_id += 1
+            self._entries[self._next_id] = {
+                "fingerprint": fingerprint,
+                "query": query,
+                "answer": answer,
+                "created_at": time.time(),
+                "hits": 0,
+            }
+            self._evict()
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        for entry_id in [i for i, e in self._entries.items() if e["created_at"] < cutoff]:
+            del self._entries[entry_id]
+        while len(self._entries) > self.max_entries:
+            if self.eviction == "lfu":
+                victim = min(self._entries, key=lambda i: self._entries[i]["hits"])
+                del self._entries[victim]
+            else:
+                # Oldest insertion for fifo, least recently used for lru.
+                self._entries.popitem(last=False)
+
+
+class SqliteAnswerBackend:
+    _ORDER_BY = {"lru": "last_used", "lfu": "hits, last_used", "fifo": "created_at"}
+
+    def __init__(self, path, max_entries=20000, ttl=86400, eviction="lru"):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.eviction = eviction
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    fingerprint TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_fingerprint ON answers (fingerprint)")
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads; keep one per thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def candidates(self, fingerprint):
+        rows = self._connection().execute(
+            "SELECT id, query, answer FROM answers WHERE fingerprint = ? AND created_at >= ?",
+            (fingerprint, time.time() - self.ttl),
+        )
+        return rows.fetchall()
+
+    def touch(self, entry_id):
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE answers SET hits = hits + 1, last_used = ? WHERE id = ?",
+                (time.time(), entry_id),
+            )
+
+    def put(self, fingerprint, query, answer):
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO answers (fingerprint, query, answer, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (fingerprint, query, answer, now, now),
+            )
+            conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                f"""
+                DELETE FROM answers WHERE id IN (
+                    SELECT id FROM answers ORDER BY {self._ORDER_BY[self.eviction]}
+                    LIMIT MAX((SELECT COUNT(*) FROM answers) - ?, 0)
+                )
+                """,
+                (self.max_entries,),
+            )
+
+
+class AnswerCache:
+    def __init__(self, backend, threshold=0.9):
+        self.backend = backend
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, query, contexts):
+        """Returns a cached answer for a similar question over the same contexts, or None."""
+        best_id, best_answer, best_score = None, None, self.threshold
+        for entry_id, cached_query, answer in self.backend.candidates(context_fingerprint(contexts)):
+            score = query_similarity(query, cached_query)
+            if score >= best_score:
+                best_id, best_answer, best_score = entry_id, answer, score
+        if best_id is None:
+            self.misses += 1
+            return None
+        self.backend.touch(best_id)
+        self.hits += 1
+        return best_answer
+
+    def store(self, query, contexts, answer):
+        self.backend.put(context_fingerprint(contexts), query, answer)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+@shared_resource()
+def get_answer_cache():
+    """Returns the process-wide AnswerCache configured by ANSWER_CACHE, or None when it is disabled."""
+    settings = get_settings()
+    kind = settings.get("ANSWER_CACHE")
+    threshold = float(settings.get("ANSWER_CACHE_THRESHOLD", 0.9))
+    if kind == "memory":
+        return AnswerCache(InMemoryAnswerBackend(), threshold)
+    if kind == "sqlite":
+        path = settings.get("ANSWER_CACHE_PATH", "answer_cache.sqlite3")
+        return AnswerCache(SqliteAnswerBackend(path), threshold)
+    return None
+
+
+__all__ = [
+    "AnswerCache",
+    "InMemoryAnswerBackend",
+    "SqliteAnswerBackend",
+    "get_answer_cache",
+    "query_similarity",
+    "context_fingerprint",
+]
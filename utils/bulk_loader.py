@@ -0,0 +1,172 @@
+import os
+import time
+import uuid
+import shutil
+import tempfile
+
+"""
+StageLoader Class:
+
+Bulk-loads rows into a Snowflake table through a stage instead of pushing a pandas DataFrame
+through `session.create_dataframe(...).write.save_as_table`.
+
+Rows are buffered column by column and every `batch_size` rows are written to a compressed
+Parquet file, PUT to a temporary stage and deleted locally. `close()` then runs one
+`COPY INTO` for everything staged by this loader. PUT and COPY are retried with exponential
+backoff.
+
+It mirrors the `writerow` interface of `csv.DictWriter`, so it can be handed to
+`FileProcessor.process` (or filled from `DocumentProcessor.iter_chunks`) in place of the CSV
+writer. Row keys are matched to the table columns case-insensitively.
+
+With `local_stage_dir` set, batches are copied into that directory instead of a Snowflake
+stage and no SQL is run, which is enough to exercise the batching without a connection.
+
+Usage:
+    with StageLoader(session, "DB.SCHEMA.TABLE", {"NAME": "VARCHAR", "DATA": "VARCHAR"}) as loader:
+        for row in rows:
+            loader.writerow(row)
+"""
+
+_ARROW_TYPES = {
+    "VARCHAR": "string",
+    "STRING": "string",
+    "NUMBER": "int64",
+    "INTEGER": "int64",
+    "FLOAT": "float64",
+}
+
+
+class StageLoader:
+    def __init__(
+        self,
+        session,
+        table_name,
+        columns,
+        stage_name=None,
+        batch_size=50000,
+        retries=3,
+        compression="zstd",
+        local_stage_dir=None,
+    ):
+        self.session = session
+        self.table_name = table_name
+        self.columns = {name.upper(): sql_type.upper() for name, sql_type in columns.items()}
+        self.stage_name = stage_name or f"{table_name}_STAGE"
+        self.batch_size = batch_size
+        self.retries = retries
+        self.compression = compression
+        self.local_stage_dir = local_stage_dir
+        self.rows_written = 0
+        self.files_staged = 0
+
+        self._prefix = f"load_{uuid.uuid4().hex}"
+        self._buffer = {name: [] for name in self.columns}
+        self._buffered = 0
+        self._tmp_dir = None
+        self._prepared = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._cleanup()
+        return False
+
+    def _with_retries(self, action, what):
+        for attempt in range(1, self.retries + 1):
+            try:
+                return action()
+            except Exception as err:
+                if attempt == self.retries:
+                    raise RuntimeError(f"{what} failed after {attempt} attempts: {err}") from err
+                delay = 2 ** (attempt - 1)
+                print(f"{what} failed ({err}), retrying in {delay}s...")
+                time.sleep(delay)
+
+    def _prepare(self):
+        if self._prepared:
+            return
+        self._tmp_dir = tempfile.mkdtemp(prefix="termify_stage_")
+        if self.local_stage_dir:
+            os.makedirs(os.path.join(self.local_stage_dir, self._prefix), exist_ok=True)
+        else:
+            column_defs = ", ".join(f"{name} {sql_type}" for name, sql_type in self.columns.items())
+            self.session.sql(f"CREATE TABLE IF NOT EXISTS {self.table_name} ({column_defs})").collect()
+            self.session.sql(f"CREATE TEMPORARY STAGE IF NOT EXISTS {self.stage_name}").collect()
+        self._prepared = True
+
+    def writerow(self, row):
+        row = {key.upper(): value for key, value in row.items()}
+        for name, values in self._buffer.items():
+            values.append(row.get(name))
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def _arrow_table(self):
+        import pyarrow as pa
+
+        schema = pa.schema(
+            [(name, _ARROW_TYPES.get(sql_type.split("(")[0], "string")) for name, sql_type in self.columns.items()]
+        )
+        return pa.Table.from_pydict(self._buffer, schema=schema)
+
+    def flush(self):
+        """Writes the buffered rows to one Parquet file and stages it."""
+        if not self._buffered:
+            return
+        import pyarrow.parquet as pq
+
+        self._prepare()
+        file_name = f"part_{self.files_staged:05d}.parquet"
+        local_path = os.path.join(self._tmp_dir, file_name)
+        pq.write_table(self._arrow_table(), local_path, compression=self.compression)
+
+        if self.local_stage_dir:
+            shutil.move(local_path, os.path.join(self.local_stage_dir, self._prefix, file_name))
+        else:
+            self._with_retries(
+                lambda: self.session.file.put(
+                    local_path, f"@{self.stage_name}/{self._prefix}", auto_compress=False, overwrite=True
+                ),
+                f"PUT {file_name}",
+            )
+            os.remove(local_path)
+
+        self.rows_written += self._buffered
+        self.files_staged += 1
+        self._buffer = {name: [] for name in self.columns}
+        self._buffered = 0
+
+    def close(self):
+        """Flushes the last batch and copies every staged file into the table."""
+        try:
+            self.flush()
+            if self.files_staged and not self.local_stage_dir:
+                cmd = f"""
+                COPY INTO {self.table_name}
+                FROM @{self.stage_name}/{self._prefix}/
+                FILE_FORMAT = (TYPE = PARQUET)
+                MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
+                PURGE = TRUE
+                """
+                self._with_retries(lambda: self.session.sql(cmd).collect(), f"COPY INTO {self.table_name}")
+            return {"rows": self.rows_written, "files": self.files_staged}
+        finally:
+            self._cleanup()
+
+    def _cleanup(self):
+        if self._tmp_dir:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+
+__all__ = ["StageLoader"]
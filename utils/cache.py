@@ -0,0 +1,156 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+"""
+TTLCache Class:
+
+A small thread-safe LRU cache whose entries also expire after `ttl` seconds. Instances created
+at module level are shared by every Streamlit session running in the same process.
+
+Entries can be invalidated in-process with `invalidate`, or across processes through publish
+times: readers pass `not_before=published_at(service, poll)` so anything cached before the
+service was last republished is treated as a miss. Two sources feed it:
+
+- Marker files: the ingestion job calls `mark_published(service)` after it republishes a Cortex
+  search service. Markers live in `<repo>/.termify_cache`, so they only reach processes on the
+  same filesystem (or with that directory on a shared volume).
+- `poll`: a callable returning the publish time as the service itself reports it, e.g. from
+  `SHOW CORTEX SEARCH SERVICES`, which every container sees. It is called at most every
+  `PUBLISH_POLL_INTERVAL` seconds per service, so another container's republish is noticed
+  within that interval.
+
+Attributes:
+    hits (int): Number of lookups served from the cache.
+    misses (int): Number of lookups that were missing, expired or stale.
+
+Usage:
+    cache = TTLCache(maxsize=1024, ttl=600)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value)
+"""
+
+PUBLISH_MARKER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".termify_cache"))
+PUBLISH_POLL_INTERVAL = 60
+
+# Last polled publish time per service: key -> (polled_at, published_at).
+_polled = {}
+_polled_lock = threading.Lock()
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """Lower-cases the query, collapses whitespace and drops trailing punctuation."""
+    return _WHITESPACE.sub(" ", query).strip().lower().rstrip("?!. ")
+
+
+def _marker_path(name):
+    return os.path.join(PUBLISH_MARKER_DIR, f"{name}.published")
+
+
+def mark_published(name):
+    """Records that `name` (e.g. a Cortex search service) was republished."""
+    os.makedirs(PUBLISH_MARKER_DIR, exist_ok=True)
+    with open(_marker_path(name), "w", encoding="utf-8") as marker:
+        marker.write(str(time.time()))
+
+
+def _polled_at(key, poll, interval):
+    now = time.time()
+    with _polled_lock:
+        entry = _polled.get(key)
+    if entry is not None and now - entry[0] < interval:
+        return entry[1]
+    try:
+        value = poll() or 0.0
+    except Exception as e:
+        print(f"Could not poll when {key} was published: {e}")
+        # Keep the last known time; retry after the next interval.
+        value = entry[1] if entry is not None else 0.0
+    with _polled_lock:
+        _polled[key] = (now, value)
+    return value
+
+
+def published_at(name, poll=None, key=None, interval=PUBLISH_POLL_INTERVAL):
+    """
+    Returns when `name` was last republished, or 0 if it never was.
+
+    Combines the local marker with `poll()` (epoch seconds), which is called at most every
+    `interval` seconds per `key` (default `name`).
+    """
+    try:
+        marker = os.stat(_marker_path(name)).st_mtime
+    except OSError:
+        marker = 0.0
+    if poll is None:
+        return marker
+    return max(marker, _polled_at(key or name, poll, interval))
+
+
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, not_before=0.0):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.ttl and created_at >= not_before:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, predicate=None):
+        """Drops every entry, or only those whose key matches `predicate`."""
+        with self._lock:
+            if predicate is None:
+                self._data.clear()
+                return
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Cortex search results keyed on (normalized query, service, limit). Shared by every RAG
+# instance, and so by every Streamlit session, in this process.
+retrieval_cache = TTLCache(maxsize=1024, ttl=900)
+
+
+__all__ = [
+    "TTLCache", "retrieval_cache", "normalize_query", "mark_published", "published_at", "PUBLISH_POLL_INTERVAL",
+]
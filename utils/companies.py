@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import difflib
+from utils.secret_loader import get_settings
+from utils.resources import shared_resource, file_version
+
+"""
+Company detection
+
+`FileProcessor` writes the names of the company folders it ingested to a small JSON file
+(`{"companies": [...]}`). `CompanyIndex` loads it and finds the companies a question is about, so
+`RAG` can restrict the shared search service to their chunks through the `NAMES` attribute.
+
+Matching works on normalized word n-grams of the question (lower case, punctuation dropped,
+corporate suffixes such as "Inc" or "LLC" removed):
+
+- exact: the n-gram, or the n-gram with its spaces removed ("you tube" -> "youtube"), is a company
+  name or an alias.
+- fuzzy: otherwise, n-grams of at least `min_fuzzy_length` characters are compared with the names
+  of the same word count and first letter using `difflib`, so typos like "spotfy" still match.
+
+Longer matches win, and n-grams made only of common words ("the", "data", "policy") are skipped.
+Aliases map alternative names to a folder name, e.g. `{"Meta": ["Facebook", "FB"]}`. They come
+from the JSON file at COMPANY_ALIASES_PATH, as `{name: [aliases]}` or `{alias: name}`.
+
+Some company names are everyday words ("the target audience", "how do I zoom in"). A one-word
+name listed in `ambiguous` (a built-in list of such names, extended by the comma-separated
+COMPANY_AMBIGUOUS_NAMES) only matches when it is capitalised in the question ("Target") or
+through an alias, and never fuzzily.
+
+Usage:
+    index = CompanyIndex.load("snowflake_data.csv.companies.json")
+    index.detect("Does spotfy sell my data?")  # -> ["Spotify"]
+"""
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+_SUFFIXES = {"inc", "llc", "ltd", "limited", "corp", "corporation", "co", "company", "plc", "gmbh", "ag", "sa"}
+
+# One-word company names that are also everyday words.
+_AMBIGUOUS_NAMES = {
+    "apple", "amazon", "box", "chase", "discord", "dropbox", "gap", "line", "match", "medium", "nest",
+    "notion", "oracle", "ring", "shell", "signal", "slack", "snap", "square", "stripe", "target",
+    "ticket", "twitter", "visa", "wish", "zoom",
+}
+
+_COMMON_WORDS = {
+    "a", "about", "account", "all", "an", "and", "any", "app", "are", "can", "cookies", "data", "delete",
+    "do", "does", "for", "how", "i", "if", "in", "information", "is", "it", "me", "my", "of", "on", "or",
+    "personal", "policy", "privacy", "s", "sell", "service", "services", "share", "terms", "the", "their",
+    "this", "to", "use", "user", "what", "when", "where", "who", "why", "will", "with", "you", "your",
+}
+
+
+def _words(text):
+    return _WORD.findall(str(text).lower().replace("_", " "))
+
+
+def _original_words(text):
+    # The words of `_words`, with their case kept.
+    return re.findall(r"[A-Za-z0-9]+", str(text).replace("_", " "))
+
+
+def _normalize(name):
+    words = _words(name)
+    while len(words) > 1 and words[-1] in _SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+class CompanyIndex:
+    def __init__(self, companies, aliases=None, max_ngram=3, cutoff=0.85, min_fuzzy_length=5, ambiguous=None):
+        self.companies = sorted(set(companies))
+        self.max_ngram = max_ngram
+        self.cutoff = cutoff
+        self.min_fuzzy_length = min_fuzzy_length
+        ambiguous = _AMBIGUOUS_NAMES if ambiguous is None else {_normalize(name) for name in ambiguous}
+        # normalized name or alias -> company
+        self._keys = {}
+        for company in self.companies:
+            self._add_key(company, company)
+        # Company names that are everyday words; aliases are explicit and always match.
+        self._ambiguous = {key for key in self._keys if key in ambiguous}
+        for alias, company in (aliases or {}).items():
+            if company in self.companies:
+                self._add_key(alias, company)
+                self._ambiguous.discard(_normalize(alias))
+            else:
+                print(f"Ignoring alias '{alias}' for unknown company '{company}'")
+        # (word count, first letter) -> normalized keys, the candidates for fuzzy matching
+        self._fuzzy = {}
+        for key in self._keys:
+            if key not in self._ambiguous:
+                self._fuzzy.setdefault((key.count(" ") + 1, key[0]), []).append(key)
+
+    def _add_key(self, name, company):
+        key = _normalize(name)
+        if key:
+            self._keys.setdefault(key, company)
+            self._keys.setdefault(key.replace(" ", ""), company)
+
+    @staticmethod
+    def _read_aliases(path):
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+        aliases = {}
+        for key, value in raw.items():
+            if isinstance(value, list):
+                aliases.update({alias: key for alias in value})
+            else:
+                aliases[key] = value
+        return aliases
+
+    @classmethod
+    def load(cls, path, aliases_path=None, **params):
+        with open(path, encoding="utf-8") as f:
+            companies = json.load(f).get("companies", [])
+        aliases = cls._read_aliases(aliases_path) if aliases_path else None
+        return cls(companies, aliases, **params)
+
+    @staticmethod
+    def save(path, companies):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"companies": sorted(set(companies))}, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _match(self, words, original):
+        phrase = " ".join(words)
+        key = phrase if phrase in self._keys else phrase.replace(" ", "")
+        company = self._keys.get(key)
+        if company and key in self._ambiguous:
+            # An everyday word only names the company when it is written like a name.
+            return company if any(word[:1].isupper() for word in original) else None
+        if company or len(phrase) < self.min_fuzzy_length:
+            return company
+        candidates = self._fuzzy.get((len(words), phrase[0]), ())
+        close = difflib.get_close_matches(phrase, candidates, n=1, cutoff=self.cutoff)
+        return self._keys[close[0]] if close else None
+
+    def detect(self, query):
+        """Returns the companies mentioned in `query`, in the order they appear."""
+        words = _words(query)
+        original = _original_words(query)
+        if len(original) != len(words):
+            original = words
+        found, taken = [], set()
+        for size in range(min(self.max_ngram, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                span = range(start, start + size)
+                window = words[start:start + size]
+                if taken.intersection(span) or all(word in _COMMON_WORDS for word in window):
+                    continue
+                company = self._match(window, original[start:start + size])
+                if company:
+                    taken.update(span)
+                    found.append((start, company))
+        ordered = []
+        for _, company in sorted(found):
+            if company not in ordered:
+                ordered.append(company)
+        return ordered
+
+
+def company_filter(company):
+    """Cortex Search filter for the chunks of `company`, including chunks shared after dedup."""
+    return {"@contains": {"NAMES": company}}
+
+
+def _company_index_path(settings):
+    candidates = [settings.get("COMPANY_INDEX_PATH")]
+    if settings.get("USER_DATASET_FOLDER_OUTPUT"):
+        candidates.append(f"{settings.get('USER_DATASET_FOLDER_OUTPUT')}.companies.json")
+    if settings.get("LOCAL_INDEX_PATH"):
+        candidates.append(os.path.join(settings.get("LOCAL_INDEX_PATH"), "companies.json"))
+    return next((path for path in candidates if path and os.path.exists(path)), None)
+
+
+def _company_index_version():
+    settings = get_settings()
+    return (
+        file_version(_company_index_path(settings)),
+        file_version(settings.get("COMPANY_ALIASES_PATH")),
+        settings.get("COMPANY_AMBIGUOUS_NAMES"),
+    )
+
+
+@shared_resource(version=_company_index_version)
+def get_company_index():
+    """
+    Returns the process-wide CompanyIndex, or None when no company list is found.
+
+    The list is read from COMPANY_INDEX_PATH, else from the file written next to
+    USER_DATASET_FOLDER_OUTPUT or into LOCAL_INDEX_PATH. It is loaded again once an ingestion
+    run rewrites the list.
+    """
+    settings = get_settings()
+    path = _company_index_path(settings)
+    ambiguous = {name.strip() for name in (settings.get("COMPANY_AMBIGUOUS_NAMES") or "").split(",") if name.strip()}
+    if path:
+        try:
+            return CompanyIndex.load(
+                path, settings.get("COMPANY_ALIASES_PATH"), ambiguous=_AMBIGUOUS_NAMES | {_normalize(name) for name in ambiguous}
+            )
+        except (OSError, ValueError) as e:
+            print(f"Company detection disabled, could not load {path}: {e}")
+    return None
+
+
+__all__ = ["CompanyIndex", "company_filter", "get_company_index"]
@@ -2,33 +2,68 @@ import os
 import csv
 import json
 import re
+import time
+import asyncio
+import hashlib
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
 from utils.doc_utils import DocumentProcessor
+from utils.dedup import DedupWriter, NAME_FIELDS
+from utils.companies import CompanyIndex
 from tqdm import tqdm
 
+# Column order of the output CSV; the Snowflake table uses the upper-cased names.
+CSV_FIELDS = ["name", "data", "source", "page", "chunk_id", "simhash"]
+
 
 class FileProcessor(DocumentProcessor):
     """
     Processes JSON and PDF files in a folder, extracts content, chunks it,
-    and writes the results to a CSV.
+    and writes the results to a CSV or any other row writer.
 
     Attributes:
         folder_path (str): Path to the folder with files.
         output_csv_path (str): Path to the output CSV.
         chunk_size (int): Size of each chunk.
         chunk_overlap (int): Overlap between chunks.
+        workers (int): Number of worker processes used for parsing and chunking.
+            With 1 worker everything runs in the current process.
+        manifest_path (str): Path to the JSON manifest of per-file content hashes.
+        incremental (bool): Only re-chunk files that are new or changed since
+            the manifest was last saved.
+        dedup (bool): Write each chunk text once and send the chunk -> name/source mapping
+            to a names writer.
+        near_dedup (bool): With `dedup`, also drop near-duplicate chunks and map them to
+            the similar chunk that was kept (see utils.dedup for the risks).
+        companies_path (str): Path to the JSON list of company folder names used for
+            query-time company detection (see utils.companies).
 
     Methods:
         clean_json: Cleans JSON content.
+        plan: Works out which files are new or changed.
         process: Processes JSON and PDF files in
+        save_manifest: Persists the manifest and company list once the results are stored.
     """
 
-    def __init__(self, folder_path, output_csv_path, chunksize=None, overlap=None):
+    def __init__(self, folder_path, output_csv_path, chunksize=None, overlap=None, workers=1,
+                 manifest_path=None, incremental=False, dedup=False, companies_path=None,
+                 near_dedup=False):
         chunk_size = chunksize if chunksize is not None else self.chunk_size
         overlap = overlap if overlap is not None else self.overlap
 
-        super().__init__(chunk_size=chunk_size, overlap=overlap) 
+        super().__init__(chunk_size=chunk_size, overlap=overlap)
         self.folder_path = folder_path
         self.output_csv_path = output_csv_path
+        self.workers = max(1, workers or 1)
+        self.manifest_path = manifest_path
+        self.incremental = incremental
+        self.dedup = dedup
+        self.near_dedup = near_dedup
+        self.companies_path = companies_path
+        self._pending_manifest = None
+        self._current_plan = None
+        self._planned_files = None
 
     async def clean_json(self, json_content):
         if isinstance(json_content, dict):
@@ -40,49 +75,278 @@ class FileProcessor(DocumentProcessor):
         else:
             return json_content
 
-    async def process(self):
+    def _collect_files(self):
+        """Returns (folder_name, file_path) pairs sorted by company folder and file name."""
+        jobs = []
+        for folder_name in sorted(os.listdir(self.folder_path)):
+            folder_full_path = os.path.join(self.folder_path, folder_name)
+
+            if os.path.isdir(folder_full_path):
+                for file_name in sorted(os.listdir(folder_full_path)):
+                    if file_name.endswith((".json", ".pdf")):
+                        jobs.append((folder_name, os.path.join(folder_full_path, file_name)))
+        return jobs
+
+    def _source_key(self, file_full_path):
+        return os.path.relpath(file_full_path, self.folder_path).replace(os.sep, "/")
+
+    @staticmethod
+    def _file_hash(file_full_path):
+        digest = hashlib.sha256()
+        with open(file_full_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def load_manifest(self):
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable manifest {self.manifest_path}: {e}")
+            return None
+
+    def save_manifest(self):
+        """
+        Writes the manifest built by the last `process` call, and the company list of every
+        ingested folder. Call it only after the chunks are stored.
+
+        Only files whose chunks were written get their hash recorded. Files that failed are
+        listed under `failed`, so the next incremental run deletes their rows and retries them.
+        """
+        if self._pending_manifest is None:
+            return
+        if self.companies_path:
+            CompanyIndex.save(
+                self.companies_path, [file["name"] for file in self._pending_manifest["files"].values()]
+            )
+        if not self.manifest_path:
+            return
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._pending_manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _plan(self, jobs):
+        """
+        Compares the current files against the manifest.
+
+        Returns the jobs that need to be (re)chunked, the sources whose rows are
+        stale in the table, and whether this is a full rebuild.
+        """
+        files = {}
+        for folder_name, file_full_path in jobs:
+            files[self._source_key(file_full_path)] = {
+                "name": folder_name,
+                "sha256": self._file_hash(file_full_path),
+            }
+        # Recorded in the manifest by `process`, once each file's chunks are written.
+        self._planned_files = files
+
+        previous = self.load_manifest() if self.incremental else None
+        if (
+            previous is None
+            or previous.get("columns") != CSV_FIELDS
+            or previous.get("chunk_size") != self.chunk_size
+            or previous.get("overlap") != self.overlap
+        ):
+            return jobs, [], True
+
+        old_files = previous.get("files", {})
+        # Files that failed last time have no hash, so they are re-chunked, and their partly
+        # written rows are deleted first.
+        failed = set(previous.get("failed", []))
+        changed = [
+            job for job in jobs
+            if old_files.get(self._source_key(job[1]), {}).get("sha256")
+            != files[self._source_key(job[1])]["sha256"]
+        ]
+        removed = [source for source in set(old_files) | failed if source not in files]
+        stale = [
+            self._source_key(path) for _, path in changed
+            if self._source_key(path) in old_files or self._source_key(path) in failed
+        ]
+        return changed, sorted(stale + removed), False
+
+    def _build_manifest(self, failed_sources):
+        self._pending_manifest = {
+            "columns": CSV_FIELDS,
+            "chunk_size": self.chunk_size,
+            "overlap": self.overlap,
+            "files": {
+                source: entry for source, entry in self._planned_files.items() if source not in failed_sources
+            },
+            "failed": sorted(failed_sources),
+        }
+
+    async def _file_chunks(self, file_full_path):
+        """Parses a single JSON or PDF file and yields its cleaned chunks with their page number."""
+        if file_full_path.endswith(".json"):
+            with open(file_full_path, "r", encoding="utf-8") as json_file:
+                content = json.load(json_file)
+            cleaned_json = await self.clean_json(content)
+            cleaned_json_str = json.dumps(cleaned_json)
+            for chunk in self.iter_text_chunks(cleaned_json_str):
+                yield chunk
+            return
+
+        found_text = False
+        async for chunk in self.iter_chunks(file_full_path):
+            found_text = True
+            yield chunk
+        if not found_text:
+            print(f"No extractable text found in PDF: {file_full_path}")
+
+    async def _safe_file_chunks(self, file_full_path, failures=None):
+        """Like `_file_chunks`, but a file that can't be parsed is reported and added to `failures`."""
+        try:
+            async for chunk in self._file_chunks(file_full_path):
+                yield chunk
+        except Exception as e:
+            print(f"Error processing {file_full_path}: {e}")
+            if failures is not None:
+                failures.append(file_full_path)
+
+    def plan(self):
+        """
+        Works out which files need chunking before anything is written.
+
+        Returns a dict with the pending `jobs`, the `stale_sources` whose rows must be
+        removed from the table, and whether this is a `full_rebuild`. `process` reuses it.
+        """
+        jobs, stale_sources, full_rebuild = self._plan(self._collect_files())
+        self._current_plan = {
+            "jobs": jobs,
+            "stale_sources": stale_sources,
+            "full_rebuild": full_rebuild,
+        }
+        return self._current_plan
+
+    async def process(self, writer=None, names_writer=None, dedup_index=None):
+        """
+        Chunks the planned files and passes one row per chunk to `writer.writerow`.
+
+        Without a `writer` the rows go to `output_csv_path`. Any object with a
+        `writerow(dict)` method works, e.g. `utils.bulk_loader.StageLoader`.
+
+        With `dedup`, duplicate chunks are dropped and the (chunk_id, name, source)
+        mapping goes to `names_writer`, or to `<output_csv_path>.names.csv` when
+        writing the CSV. `dedup_index` can carry chunks that are already stored.
+        """
         print("Started processing...")
-        with open(
-            self.output_csv_path, mode="w", newline="", encoding="utf-8"
-        ) as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=["name", "data"])
-            files_processed = 0
-            for folder_name in tqdm(os.listdir(self.folder_path),desc="Folders"):
-                folder_full_path = os.path.join(self.folder_path, folder_name)
-
-                if os.path.isdir(folder_full_path):
-                    for file_name in tqdm(os.listdir(folder_full_path),desc=f"Files in {folder_name}", leave=False):
-                        file_full_path = os.path.join(folder_full_path, file_name)
-                        try:
-                            if file_name.endswith(".json"):
-                                with open(
-                                    file_full_path, "r", encoding="utf-8"
-                                ) as json_file:
-                                    content = json.load(json_file)
-                                cleaned_json = await self.clean_json(content)
-                                cleaned_json_str = json.dumps(cleaned_json)
-                                chunks_df = self.chunkCreator(cleaned_json_str)
-                                for chunk in chunks_df["CHUNKS"]:
-                                    writer.writerow(
-                                        {"name": folder_name, "data": chunk}
-                                    )
-                            elif file_name.endswith(".pdf"):
-                                pdf_text = await self.pdfLoader(file_full_path)
-
-                                if pdf_text:
-                                    chunks_df = self.chunkCreator(pdf_text)
-                                    for chunk in chunks_df["CHUNKS"]:
-                                        writer.writerow(
-                                            {"name": folder_name, "data": chunk}
-                                        )
-                                else:
-                                    print(
-                                        f"No extractable text found in PDF: {file_full_path}"
-                                    )
-                        except Exception as e:
-                            print(f"Error processing {file_full_path}: {e}")
-                        files_processed += 1
-            print(f"Done processing {files_processed} files.")
-
-
-__all__ = ["FileProcessor"]
+        started = time.perf_counter()
+        plan = self._current_plan or self.plan()
+        self._current_plan = None
+        jobs, stale_sources, full_rebuild = plan["jobs"], plan["stale_sources"], plan["full_rebuild"]
+        if not full_rebuild:
+            print(f"Incremental run: {len(jobs)} new or changed file(s), {len(stale_sources)} stale source(s).")
+
+        deduped = None
+        failures = []
+        if writer is not None:
+            if self.dedup:
+                writer = deduped = DedupWriter(writer, names_writer, index=dedup_index, near_duplicates=self.near_dedup)
+            counts = await self._write_rows(jobs, writer, failures)
+        else:
+            with ExitStack() as files:
+                csvfile = files.enter_context(
+                    open(self.output_csv_path, mode="w", newline="", encoding="utf-8")
+                )
+                writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDS)
+                if self.dedup:
+                    namesfile = files.enter_context(
+                        open(f"{self.output_csv_path}.names.csv", mode="w", newline="", encoding="utf-8")
+                    )
+                    names_csv = csv.DictWriter(namesfile, fieldnames=NAME_FIELDS)
+                    writer = deduped = DedupWriter(writer, names_csv, index=dedup_index, near_duplicates=self.near_dedup)
+                counts = await self._write_rows(jobs, writer, failures)
+        files_processed, chunks_written = counts
+        failed_sources = {self._source_key(path) for path in failures}
+        self._build_manifest(failed_sources)
+        dedup_stats = deduped.stats() if deduped else None
+
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(
+            f"Done processing {files_processed} files ({chunks_written} chunks) "
+            f"in {elapsed:.2f}s with {self.workers} worker(s): "
+            f"{files_processed / elapsed:.2f} files/s, {chunks_written / elapsed:.2f} chunks/s."
+        )
+        if failed_sources:
+            print(f"{len(failed_sources)} file(s) failed and will be retried by the next incremental run.")
+        if dedup_stats:
+            print(
+                f"Dedup: {dedup_stats['unique']} unique of {dedup_stats['rows']} chunks "
+                f"({dedup_stats['exact_duplicates']} exact, {dedup_stats['near_duplicates']} near duplicates, "
+                f"ratio {dedup_stats['dedup_ratio']:.1%})."
+            )
+        return {
+            "files": files_processed,
+            "chunks": chunks_written,
+            "seconds": elapsed,
+            "full_rebuild": full_rebuild,
+            "stale_sources": stale_sources,
+            "failed_sources": sorted(failed_sources),
+            "dedup": dedup_stats,
+        }
+
+    async def _write_rows(self, jobs, writer, failures):
+        files_processed = 0
+        chunks_written = 0
+
+        if self.workers > 1:
+            # At most 2 files per worker are in flight, so the parent never holds the chunks of
+            # more than that. Results are written in submission order as soon as the oldest one
+            # is done, so the output stays deterministic and grouped per company folder.
+            window = self.workers * 2
+            pending = deque()
+            remaining = iter(jobs)
+            with ProcessPoolExecutor(max_workers=self.workers) as executor, tqdm(total=len(jobs), desc="Files") as progress:
+                while True:
+                    for folder_name, file_full_path in remaining:
+                        future = executor.submit(_chunk_file_worker, (self.chunk_size, self.overlap, file_full_path))
+                        pending.append((folder_name, file_full_path, future))
+                        if len(pending) >= window:
+                            break
+                    if not pending:
+                        break
+                    folder_name, file_full_path, future = pending.popleft()
+                    chunks, failed = future.result()
+                    if failed:
+                        failures.append(file_full_path)
+                    source = self._source_key(file_full_path)
+                    for chunk, page in chunks:
+                        writer.writerow({"name": folder_name, "data": chunk, "source": source, "page": page})
+                    chunks_written += len(chunks)
+                    files_processed += 1
+                    progress.update(1)
+        else:
+            for folder_name, file_full_path in tqdm(jobs, desc="Files"):
+                # Rows are written as they are produced, one page at a time.
+                source = self._source_key(file_full_path)
+                async for chunk in self._safe_file_chunks(file_full_path, failures):
+                    writer.writerow({"name": folder_name, "data": chunk["CHUNKS"], "source": source, "page": chunk["PAGE"]})
+                    chunks_written += 1
+                files_processed += 1
+
+        return files_processed, chunks_written
+
+
+def _chunk_file_worker(job):
+    """Process pool entry point: parses and chunks one file in a worker process; returns (chunks, failed)."""
+    chunk_size, overlap, file_full_path = job
+    processor = FileProcessor(None, None, chunksize=chunk_size, overlap=overlap)
+    failures = []
+
+    async def collect():
+        return [
+            (chunk["CHUNKS"], chunk["PAGE"])
+            async for chunk in processor._safe_file_chunks(file_full_path, failures)
+        ]
+
+    chunks = asyncio.run(collect())
+    return chunks, bool(failures)
+
+
+__all__ = ["FileProcessor", "CSV_FIELDS"]
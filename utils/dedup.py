@@ -0,0 +1,161 @@
+import re
+import hashlib
+from functools import lru_cache
+
+"""
+Chunk deduplication
+
+Many companies share boilerplate clauses, so the same chunk text shows up under many `NAME`s.
+`DedupWriter` sits between `FileProcessor.process` and the real row writer and writes each chunk
+only once:
+
+- Exact duplicates are caught by the chunk id, a hash of the text with case and whitespace
+  normalized.
+- Near-duplicates (a changed company name, date or punctuation) are only dropped with
+  `near_duplicates=True`. In legal terms a one-word edit is often "may" -> "may not", and a
+  dropped variant's company would be mapped to the other company's text, so by default every
+  text that differs is stored. They are caught by a 64-bit simhash over word 3-shingles. A
+  one-word edit in a typical chunk flips about 2-7 bits, while unrelated chunks differ in 18 or
+  more. The fingerprint is split into `bands` bands that act as LSH buckets, and only chunks
+  sharing a bucket are compared. With 4 bands, pairs within 3 bits always share one, and most
+  pairs within `max_distance` (6) do.
+
+Every occurrence, the first included, produces a `(chunk_id, name, source)` row for the
+`names_writer`. That table maps each stored chunk to all the companies and files it came from.
+
+`stats()` reports the number of rows seen, the unique chunks written and the dedup ratio
+(the share of rows that were dropped).
+
+Usage:
+    deduped = DedupWriter(csv_writer, names_writer=names_csv_writer)
+    for row in rows:
+        deduped.writerow(row)
+    deduped.stats()
+"""
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+NAME_FIELDS = ["chunk_id", "name", "source"]
+
+
+def chunk_id(text):
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+@lru_cache(maxsize=1 << 18)
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text):
+    """64-bit simhash of the word 3-shingles of `text`."""
+    import numpy as np
+
+    def rotl(values, bits):
+        return (values << np.uint64(bits)) | (values >> np.uint64(64 - bits))
+
+    tokens = np.fromiter((_token_hash(t) for t in _TOKEN.findall(text.lower())), dtype=np.uint64)
+    if not len(tokens):
+        return 0
+    # Shingle hashes combine the (cached) token hashes, rotated by position within the shingle.
+    shingles = rotl(tokens[:-2], 2) ^ rotl(tokens[1:-1], 1) ^ tokens[2:] if len(tokens) >= 3 else tokens
+    bits = np.unpackbits(shingles.astype(">u8").view(np.uint8).reshape(-1, 8), axis=1)
+    # A bit is set when more than half of the shingle hashes have it set.
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+
+class DedupIndex:
+    def __init__(self, max_distance=6, bands=4, min_tokens=8):
+        if 64 % bands:
+            raise ValueError("bands must divide 64")
+        self.max_distance = max_distance
+        self.bands = bands
+        self.min_tokens = min_tokens
+        self._band_bits = 64 // bands
+        # chunk id -> id of the stored chunk it maps to
+        self._canonical = {}
+        self._buckets = [{} for _ in range(bands)]
+
+    def _band_keys(self, fingerprint):
+        mask = (1 << self._band_bits) - 1
+        return [(fingerprint >> (i * self._band_bits)) & mask for i in range(self.bands)]
+
+    def seed(self, existing_id, fingerprint=None):
+        """Registers a chunk that is already stored, e.g. before an incremental run."""
+        self._canonical[existing_id] = existing_id
+        if fingerprint:
+            fingerprint = int(fingerprint, 16) if isinstance(fingerprint, str) else fingerprint
+            for bucket, key in zip(self._buckets, self._band_keys(fingerprint)):
+                bucket.setdefault(key, []).append((fingerprint, existing_id))
+
+    def add(self, text, near_duplicates=True):
+        """
+        Returns (chunk_id, fingerprint, canonical_id, kind), where kind is "exact", "near" or
+        None. For duplicates, canonical_id is the id of the stored chunk they map to.
+        """
+        cid = chunk_id(text)
+        if cid in self._canonical:
+            return cid, None, self._canonical[cid], "exact"
+        self._canonical[cid] = cid
+
+        fingerprint = None
+        if near_duplicates and len(_TOKEN.findall(text.lower())) >= self.min_tokens:
+            fingerprint = simhash(text)
+            keys = self._band_keys(fingerprint)
+            for bucket, key in zip(self._buckets, keys):
+                for other, other_id in bucket.get(key, ()):
+                    if (fingerprint ^ other).bit_count() <= self.max_distance:
+                        self._canonical[cid] = other_id
+                        return cid, fingerprint, other_id, "near"
+            for bucket, key in zip(self._buckets, keys):
+                bucket.setdefault(key, []).append((fingerprint, cid))
+        return cid, fingerprint, None, None
+
+
+class DedupWriter:
+    def __init__(self, writer, names_writer=None, index=None, near_duplicates=False):
+        self.writer = writer
+        self.names_writer = names_writer
+        self.index = index or DedupIndex()
+        self.near_duplicates = near_duplicates
+        self.rows = 0
+        self.unique = 0
+        self.exact_duplicates = 0
+        self.near_duplicates_found = 0
+        self._mapped = set()
+
+    def writerow(self, row):
+        self.rows += 1
+        cid, fingerprint, canonical_id, kind = self.index.add(row["data"], self.near_duplicates)
+        if kind is None:
+            self.unique += 1
+            self.writer.writerow({**row, "chunk_id": cid, "simhash": f"{fingerprint:016x}" if fingerprint else None})
+            canonical_id = cid
+        elif kind == "exact":
+            self.exact_duplicates += 1
+        else:
+            self.near_duplicates_found += 1
+
+        mapping = (canonical_id, row.get("name"), row.get("source"))
+        if self.names_writer is not None and mapping not in self._mapped:
+            self._mapped.add(mapping)
+            self.names_writer.writerow(dict(zip(NAME_FIELDS, mapping)))
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def stats(self):
+        dropped = self.exact_duplicates + self.near_duplicates_found
+        return {
+            "rows": self.rows,
+            "unique": self.unique,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates_found,
+            "dedup_ratio": dropped / self.rows if self.rows else 0.0,
+        }
+
+
+__all__ = ["DedupWriter", "DedupIndex", "simhash", "chunk_id", "NAME_FIELDS"]
@@ -1,16 +1,27 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
-import pandas as pd
-import re
+import io
+import os
+import uuid
+import shutil
+import asyncio
+from utils.text_splitter import TextSplitter, clean_chunk
 
 """
 DocumentParser Class:
 
 This class provides functionality to parse a PDF document and divide its content into manageable chunks for further processing. 
-It uses the RecursiveCharacterTextSplitter from LangChain and the PyPDFLoader for loading and processing the PDF.
+It uses the built-in TextSplitter (same chunks as LangChain's RecursiveCharacterTextSplitter) and pypdf for loading the PDF,
+so the ingestion path does not import LangChain. pypdf and pandas are only imported when they are first needed.
+
+Documents can be given as a path, as bytes / bytearray / memoryview, or as a binary file handle
+(e.g. a Streamlit `UploadedFile`), so uploads are parsed from memory without a temp file. The
+parser reads in-memory documents in place: `bytes` through `io.BytesIO`, which shares an
+immutable buffer, and other buffers through a read-only stream over a memoryview, since BytesIO
+would copy them.
+`spool_upload` keeps small uploads in memory and copies large ones into a caller-owned
+directory, typically a per-session `tempfile.TemporaryDirectory`.
 
 Attributes:
-    path (str): Path to the PDF file to be processed.
+    path (str | bytes | memoryview | file): The PDF document to be processed.
     chunk_size (int): The size of each chunk to divide the document into.
     chunk_overlap (int): The overlap size between consecutive chunks to maintain context.
 
@@ -18,18 +29,98 @@ Methods:
     pdfLoader(path):
         Loads the content of the PDF file from the specified path and returns the combined text.
 
+    iter_pages(path):
+        Asynchronously yields the PDF one page at a time as (page_number, text).
+
     cleanText(texts):
-        Clean the texts using regex
+        Clean the texts using a single precompiled regex
+
+    iter_text_chunks(text, page):
+        Yields cleaned chunks of a single text, tagged with its page number.
+
+    iter_chunks(path):
+        Asynchronously yields cleaned chunks of a PDF page by page, so memory stays bounded
+        by the largest page and no chunk straddles a page boundary.
 
     chunkCreator():
         Divides the loaded document text into chunks based on the class's chunk size and overlap.
+        Kept as a DataFrame-returning wrapper over `iter_text_chunks`.
 
 Usage:
-    Create an instance of the class with appropriate parameters and call the `chunkCreator` method to parse and divide a PDF into chunks.
+    Create an instance of the class with appropriate parameters and call the `chunkCreator` method to parse and divide a PDF into chunks,
+    or iterate `iter_chunks` to stream them.
 
 """
 
 
+def _describe(source):
+    if isinstance(source, (str, os.PathLike)):
+        return source
+    return getattr(source, "name", f"<{type(source).__name__}>")
+
+
+def spool_upload(uploaded_file, directory, max_memory=32 * 1024 * 1024):
+    """
+    Returns the upload as bytes when it is at most `max_memory` bytes, otherwise copies it in
+    blocks to a uniquely named file in `directory` and returns that path.
+    """
+    size = getattr(uploaded_file, "size", None)
+    if size is None:
+        uploaded_file.seek(0, os.SEEK_END)
+        size = uploaded_file.tell()
+    uploaded_file.seek(0)
+    if size <= max_memory:
+        if hasattr(uploaded_file, "getvalue"):
+            return uploaded_file.getvalue()
+        return uploaded_file.read()
+    file_name = os.path.basename(getattr(uploaded_file, "name", "") or "upload.pdf")
+    path = os.path.join(directory, f"{uuid.uuid4().hex}_{file_name}")
+    with open(path, "wb") as spooled:
+        shutil.copyfileobj(uploaded_file, spooled, 1024 * 1024)
+    return path
+
+
+class _BufferStream(io.RawIOBase):
+    """Seekable, read-only stream over a buffer; reads copy only the bytes they return."""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else self._position + size
+        data = self._view[self._position:end].tobytes()
+        self._position += len(data)
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, target):
+        data = self._view[self._position:self._position + len(target)]
+        target[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
 class DocumentProcessor:
     def __init__(
         self,
@@ -38,18 +129,58 @@ class DocumentProcessor:
     ):
         self.chunk_size = chunk_size
         self.overlap = overlap
+        self._text_splitter = None
+
+    @property
+    def text_splitter(self):
+        # Built once per processor instead of on every chunkCreator call.
+        if self._text_splitter is None:
+            self._text_splitter = TextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.overlap,
+            )
+        return self._text_splitter
 
     async def pdfLoader(self, file_path):
         try:
-            loader = PyPDFLoader(file_path)
             pages = []
-            async for page in loader.alazy_load():
-                pages.append(page.page_content)
+            async for _, page_text in self._read_pages(file_path):
+                pages.append(page_text)
             pages_text = ", ".join(pages)
 
             return pages_text
         except FileNotFoundError:
-            raise FileNotFoundError(f"File not found at path: {file_path}")
+            raise FileNotFoundError(f"File not found at path: {_describe(file_path)}")
+        except Exception as e:
+            raise RuntimeError(f"An error occurred while loading the document: {e}")
+
+    @staticmethod
+    def _open_source(source):
+        if isinstance(source, bytes):
+            # BytesIO shares a bytes object's buffer instead of copying it.
+            return io.BytesIO(source)
+        if isinstance(source, (bytearray, memoryview)):
+            if isinstance(source, memoryview) and not source.c_contiguous:
+                return io.BytesIO(source.tobytes())
+            return _BufferStream(source)
+        return source
+
+    @staticmethod
+    async def _read_pages(file_path):
+        # Same extraction as LangChain's PyPDFLoader (pypdf, plain mode), with the
+        # blocking pypdf calls pushed to a worker thread.
+        from pypdf import PdfReader
+
+        reader = await asyncio.to_thread(PdfReader, DocumentProcessor._open_source(file_path))
+        for page_number, page in enumerate(reader.pages, start=1):
+            yield page_number, await asyncio.to_thread(page.extract_text, extraction_mode="plain")
+
+    async def iter_pages(self, file_path):
+        try:
+            async for page_number, page_text in self._read_pages(file_path):
+                yield page_number, page_text
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File not found at path: {_describe(file_path)}")
         except Exception as e:
             raise RuntimeError(f"An error occurred while loading the document: {e}")
 
@@ -57,29 +188,32 @@ class DocumentProcessor:
         cleaned_chunks = []
         for chunk in texts:
             try:
-                cleaned_chunk = re.sub(r"[^a-zA-Z0-9\s]", "", chunk)
-                cleaned_chunk = re.sub(r"\s+", " ", cleaned_chunk).strip()
-                cleaned_chunks.append(cleaned_chunk)
+                cleaned_chunks.append(clean_chunk(chunk))
             except Exception as e:
                 print(f"An error occurred while cleaning a chunk: {e}")
                 cleaned_chunks.append(chunk)
         return cleaned_chunks
 
+    def iter_text_chunks(self, text, page=None):
+        for chunk in self.clean_text(self.text_splitter.split_text(text)):
+            yield {"CHUNKS": chunk, "PAGE": page}
+
+    async def iter_chunks(self, file_path):
+        async for page_number, page_text in self.iter_pages(file_path):
+            if page_text:
+                for chunk in self.iter_text_chunks(page_text, page_number):
+                    yield chunk
+
     # Method to divide the PDF into chunks
     def chunkCreator(self, texts):
-        try:
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=self.chunk_size,
-                chunk_overlap=self.overlap,
-                length_function=len,
-            )
+        import pandas as pd
 
-            chunks = text_splitter.split_text(texts)
-            cleaned_chunks = self.clean_text(chunks)
+        try:
+            cleaned_chunks = [chunk["CHUNKS"] for chunk in self.iter_text_chunks(texts)]
             chunks_data_frame = pd.DataFrame(cleaned_chunks, columns=["CHUNKS"])
             return chunks_data_frame
         except Exception as e:
             raise RuntimeError(f"An error occurred while processing the document: {e}")
 
 
-__all__ = ["DocumentProcessor"]
+__all__ = ["DocumentProcessor", "spool_upload"]
@@ -0,0 +1,184 @@
+import os
+import csv
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+
+"""
+Evaluation runner
+
+Runs an evaluation function over a query set on a bounded thread pool:
+
+- `concurrency` queries are in flight at most.
+- `rate` caps how many queries start per second, to stay under Cortex rate limits. Each query
+  may make several model calls (completion plus feedback).
+- Every finished query is appended to a JSONL checkpoint. With `resume`, queries that already
+  succeeded in the checkpoint are skipped and failed ones run again.
+
+Query sets are JSONL (one `{"id": ..., "query": ...}` object or JSON string per line) or CSV with
+a `query` column and an optional `id` column. Queries without an id get a hash of their text.
+
+`evaluate(item)` receives the query dict and returns a dict of result fields, e.g.
+`{"response": ..., "scores": {"Coherence": 0.9}}`. Exceptions are recorded as failed results.
+
+Usage:
+    runner = EvalRunner(evaluate, concurrency=4, rate=2, checkpoint_path="eval.checkpoint.jsonl")
+    results = runner.run(load_queries("eval_queries.jsonl"), resume=True)
+    write_results("eval_results.json", results, summarize(results, runner.wall_seconds))
+"""
+
+
+def query_id(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def _item(raw):
+    item = {"query": raw} if isinstance(raw, str) else dict(raw)
+    item["query"] = (item.get("query") or "").strip()
+    item["id"] = str(item.get("id") or query_id(item["query"]))
+    return item
+
+
+def load_queries(path):
+    """Loads a JSONL or CSV query set as a list of dicts with `id` and `query`."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            raw_items = list(csv.DictReader(f))
+        else:
+            raw_items = [json.loads(line) for line in f if line.strip()]
+    items = [item for item in map(_item, raw_items) if item["query"]]
+    ids = [item["id"] for item in items]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Duplicate query ids in {path}")
+    return items
+
+
+class RateLimiter:
+    """Spaces `acquire` calls at least 1 / `rate` seconds apart across threads."""
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class EvalRunner:
+    def __init__(self, evaluate, concurrency=4, rate=None, checkpoint_path=None):
+        self.evaluate = evaluate
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate)
+        self.checkpoint_path = checkpoint_path
+        self.wall_seconds = 0.0
+        self._checkpoint_lock = threading.Lock()
+
+    def load_checkpoint(self):
+        """Returns the successful results of earlier runs, keyed by query id."""
+        done = {}
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return done
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interrupted run.
+                    continue
+                if result.get("status") == "ok":
+                    done[result["id"]] = result
+        return done
+
+    def _record(self, checkpoint, result):
+        if checkpoint is None:
+            return
+        with self._checkpoint_lock:
+            checkpoint.write(json.dumps(result, default=str) + "\n")
+            checkpoint.flush()
+
+    def _run_one(self, item, checkpoint):
+        self.limiter.acquire()
+        started = time.perf_counter()
+        result = {"id": item["id"], "query": item["query"]}
+        try:
+            result.update(self.evaluate(item) or {})
+            result["status"] = "ok"
+        except Exception as err:
+            print(f"Query {item['id']} failed: {err}")
+            result.update(status="error", error=str(err))
+        result["seconds"] = time.perf_counter() - started
+        self._record(checkpoint, result)
+        return result
+
+    def run(self, queries, resume=False):
+        """Evaluates `queries` and returns one result per query, in query order."""
+        started = time.perf_counter()
+        done = self.load_checkpoint() if resume else {}
+        pending = [item for item in queries if item["id"] not in done]
+        if done:
+            print(f"Resuming: {len(queries) - len(pending)} of {len(queries)} queries already evaluated.")
+
+        results = {item_id: {**result, "resumed": True} for item_id, result in done.items()}
+        checkpoint = None
+        if self.checkpoint_path:
+            checkpoint = open(self.checkpoint_path, "a" if resume else "w", encoding="utf-8")
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="eval") as executor:
+                futures = [executor.submit(self._run_one, item, checkpoint) for item in pending]
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Questions", ascii=True):
+                    result = future.result()
+                    results[result["id"]] = result
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+        self.wall_seconds = time.perf_counter() - started
+        return [results[item["id"]] for item in queries if item["id"] in results]
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summarize(results, wall_seconds=None):
+    ok = [result for result in results if result.get("status") == "ok"]
+    # Latency only for queries evaluated in this run; resumed ones keep their old timings.
+    latencies = [result["seconds"] for result in ok if not result.get("resumed")]
+    scores = {}
+    for result in ok:
+        for name, value in (result.get("scores") or {}).items():
+            if isinstance(value, (int, float)):
+                scores.setdefault(name, []).append(value)
+    return {
+        "queries": len(results),
+        "succeeded": len(ok),
+        "errors": len(results) - len(ok),
+        "resumed": sum(1 for result in results if result.get("resumed")),
+        "wall_seconds": wall_seconds,
+        "latency_p50": _percentile(latencies, 0.5),
+        "latency_p95": _percentile(latencies, 0.95),
+        "scores": {name: sum(values) / len(values) for name, values in sorted(scores.items())},
+    }
+
+
+def write_results(path, results, summary):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "results": results}, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+__all__ = ["EvalRunner", "RateLimiter", "load_queries", "query_id", "summarize", "write_results"]
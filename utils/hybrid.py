@@ -0,0 +1,267 @@
+import os
+import re
+import math
+import time
+import threading
+import contextvars
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from utils.retrieval import NameFilterMixin, SearchResponse, RetrievalBackend, LocalVectorIndex, get_local_index, index_version
+from utils.secret_loader import get_settings
+from utils.resources import shared_resource
+
+"""
+Hybrid retrieval
+
+`HybridRetriever` runs two searches over the same chunks side by side: the dense (vector) search,
+which is Cortex Search or a `LocalVectorIndex`, and a local `BM25Index`. It fuses the two ranked
+lists with reciprocal-rank fusion:
+
+    score(chunk) = sum over lists of 1 / (rrf_k + rank)
+
+It can then rerank the fused candidates with a small CPU cross-encoder, such as
+`cross-encoder/ms-marco-MiniLM-L-6-v2` from sentence-transformers when that package is installed.
+Exact keyword matches (clause numbers, product names) that embeddings miss still reach the top-k,
+so fewer chunks are needed in the prompt.
+
+Every stage has a latency budget in seconds. A dense or lexical search that misses its budget is
+left out of the fusion, and a rerank that misses its budget keeps the fused order, so a slow stage
+degrades quality but never blocks the answer. The response's `stats` hold the per-stage timings
+and which stages were used. They belong to that search, since one retriever serves every session.
+
+Usage:
+    hybrid = HybridRetriever(BM25Index.from_rows(local_index.rows), dense=local_index)
+    hybrid.search(query, columns=["DATA"], limit=5).results
+
+`dense` is only a default: `search(..., dense_search=fn)` fuses BM25 with any other dense search,
+e.g. the shared Cortex service.
+"""
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Shared by every HybridRetriever, so concurrent requests don't each spin up threads.
+_stage_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hybrid-stage")
+
+
+def _tokens(text):
+    return _TOKEN.findall(text.lower())
+
+
+def _key(text):
+    return " ".join((text or "").split()).lower()
+
+
+class BM25Index(NameFilterMixin, RetrievalBackend):
+    def __init__(self, rows, k1=1.5, b=0.75):
+        import numpy as np
+
+        self.rows = rows
+        self.k1 = k1
+        self.b = b
+        postings = {}
+        doc_lengths = np.zeros(len(rows), dtype=np.float32)
+        for doc_id, row in enumerate(rows):
+            counts = Counter(_tokens(row.get("DATA") or ""))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(doc_id)
+                postings[term][1].append(tf)
+        self._doc_lengths = doc_lengths
+        self._avg_length = float(doc_lengths.mean()) if len(rows) else 0.0
+        self._postings = {
+            term: (np.asarray(ids, dtype=np.int64), np.asarray(tfs, dtype=np.float32))
+            for term, (ids, tfs) in postings.items()
+        }
+
+    @classmethod
+    def from_rows(cls, rows, **params):
+        return cls(rows, **params)
+
+    def _idf(self, doc_freq):
+        n = len(self.rows)
+        return math.log(1 + (n - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def search(self, query, columns, limit, filter=None):
+        import numpy as np
+
+        if not self.rows or limit <= 0:
+            return SearchResponse([])
+        scores = np.zeros(len(self.rows), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self._doc_lengths / max(self._avg_length, 1e-9))
+        for term in set(_tokens(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            scores[ids] += self._idf(len(ids)) * tfs * (self.k1 + 1) / (tfs + norm[ids])
+
+        candidates = self._candidates(filter)
+        if candidates is not None:
+            mask = np.zeros(len(self.rows), dtype=bool)
+            mask[np.asarray(candidates, dtype=np.int64)] = True
+            scores[~mask] = 0
+        matched = np.flatnonzero(scores > 0)
+        if not len(matched):
+            return SearchResponse([])
+        top = matched[np.argsort(-scores[matched], kind="stable")[:limit]]
+        return SearchResponse([self._result(int(i), columns, float(scores[i])) for i in top])
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2"):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+
+                self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def rerank(self, query, texts):
+        """Returns one relevance score per text."""
+        return [float(score) for score in self._load().predict([(query, text) for text in texts])]
+
+
+class HybridRetriever:
+    def __init__(
+        self,
+        lexical,
+        dense=None,
+        reranker=None,
+        rrf_k=60,
+        candidates=20,
+        dense_budget=2.0,
+        lexical_budget=0.5,
+        rerank_budget=0.5,
+    ):
+        self.lexical = lexical
+        # Optional default dense backend; `search` also takes a callable per call.
+        self.dense = dense
+        self.reranker = reranker
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.dense_budget = dense_budget
+        self.lexical_budget = lexical_budget
+        self.rerank_budget = rerank_budget
+
+    @staticmethod
+    def _timed(fn, *args):
+        started = time.perf_counter()
+        return fn(*args), time.perf_counter() - started
+
+    def _collect(self, future, budget, stage, stats):
+        try:
+            results, elapsed = future.result(timeout=budget)
+            stats[f"{stage}_seconds"] = elapsed
+            return results
+        except FutureTimeout:
+            print(f"{stage} search missed its {budget}s budget, continuing without it")
+            stats[f"{stage}_seconds"] = None
+        except Exception as err:
+            print(f"{stage} search failed: {err}")
+            stats[f"{stage}_seconds"] = None
+        return []
+
+    def fuse(self, ranked_lists, column):
+        scores, first_seen = {}, {}
+        for results in ranked_lists:
+            for rank, result in enumerate(results, start=1):
+                key = _key(result.get(column))
+                if not key:
+                    continue
+                scores[key] = scores.get(key, 0.0) + 1.0 / (self.rrf_k + rank)
+                first_seen.setdefault(key, result)
+        order = sorted(scores, key=lambda key: -scores[key])
+        return [{**first_seen[key], "@score": scores[key]} for key in order]
+
+    def search(self, query, columns, limit, filter=None, dense_search=None):
+        """
+        `dense_search(limit)` returns the dense results as dicts; it defaults to `self.dense.search`.
+        The first of `columns` holds the chunk text used to match results across searches.
+        """
+        column = columns[0]
+        depth = max(self.candidates, limit)
+        if dense_search is None:
+            dense_search = lambda n: self.dense.search(query=query, columns=columns, limit=n, filter=filter).results
+        stats = {}
+        started = time.perf_counter()
+
+        # Stages run in the caller's context, so trace spans they open nest under the caller's span.
+        dense_future = _stage_executor.submit(contextvars.copy_context().run, self._timed, dense_search, depth)
+        lexical_future = _stage_executor.submit(
+            contextvars.copy_context().run,
+            self._timed,
+            lambda n: self.lexical.search(query, columns, n, filter).results,
+            depth,
+        )
+        # Each budget counts from the start, since both searches run at the same time.
+        lexical = self._collect(lexical_future, self.lexical_budget, "lexical", stats)
+        dense = self._collect(
+            dense_future, max(self.dense_budget - (time.perf_counter() - started), 0), "dense", stats
+        )
+        fused = self.fuse([dense, lexical], column)
+        stats["fused_candidates"] = len(fused)
+
+        stats["reranked"] = False
+        if self.reranker is not None and len(fused) > 1:
+            texts = [result[column] for result in fused]
+            rerank_future = _stage_executor.submit(
+                contextvars.copy_context().run, self._timed, self.reranker.rerank, query, texts
+            )
+            rerank_scores = self._collect(rerank_future, self.rerank_budget, "rerank", stats)
+            if rerank_scores:
+                fused = [
+                    {**result, "@score": score}
+                    for score, result in sorted(zip(rerank_scores, fused), key=lambda pair: -pair[0])
+                ]
+                stats["reranked"] = True
+
+        stats["total_seconds"] = time.perf_counter() - started
+        return SearchResponse(fused[:limit], stats)
+
+
+def _hybrid_version():
+    settings = get_settings()
+    return (
+        settings.get("RETRIEVAL_MODE"),
+        settings.get("RERANK_MODEL"),
+        index_version(settings.get("HYBRID_CORPUS_PATH")),
+        index_version(settings.get("LOCAL_INDEX_PATH")),
+    )
+
+
+@shared_resource(version=_hybrid_version)
+def get_hybrid_retriever():
+    """
+    Returns the process-wide HybridRetriever when RETRIEVAL_MODE is "hybrid", else None.
+
+    The BM25 index is built over the chunks of the local index at HYBRID_CORPUS_PATH, and
+    RERANK_MODEL optionally names a sentence-transformers cross-encoder. The dense side is not
+    fixed here: `RAG` passes its own search per call, which is the shared Cortex service unless
+    LOCAL_INDEX_PATH replaces it with an offline backend. It is built again once the corpus is
+    rebuilt or these settings change.
+    """
+    settings = get_settings()
+    if settings.get("RETRIEVAL_MODE") != "hybrid":
+        return None
+    corpus_path = settings.get("HYBRID_CORPUS_PATH")
+    if not corpus_path or not os.path.exists(os.path.join(corpus_path, "meta.json")):
+        print("RETRIEVAL_MODE=hybrid needs HYBRID_CORPUS_PATH for the BM25 corpus, using dense search only")
+        return None
+    # Reuse the offline backend when it is the same index, instead of loading its rows twice.
+    corpus = get_local_index()
+    if corpus is None or os.path.abspath(settings.get("LOCAL_INDEX_PATH")) != os.path.abspath(corpus_path):
+        corpus = LocalVectorIndex.open(corpus_path)
+    rerank_model = settings.get("RERANK_MODEL")
+    return HybridRetriever(
+        BM25Index.from_rows(corpus.rows),
+        reranker=CrossEncoderReranker(rerank_model) if rerank_model else None,
+    )
+
+
+__all__ = ["HybridRetriever", "BM25Index", "CrossEncoderReranker", "get_hybrid_retriever"]
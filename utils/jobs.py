@@ -0,0 +1,258 @@
+import time
+import uuid
+import queue
+import asyncio
+import threading
+import traceback
+
+"""
+JobQueue Class:
+
+A local background queue for long-running work such as ingesting an uploaded document. Worker
+threads take jobs off a FIFO queue, so uploads from different users run side by side instead of
+blocking each user's Streamlit script thread.
+
+A job's handler receives the `Job` and reports through it:
+
+- `job.report(message, progress=None)` appends a progress message (and, optionally, a 0..1
+  fraction). It raises `JobCancelled` when cancellation was requested, so cancelling takes
+  effect at the next report.
+- `job.checkpoint` is a dict the handler updates as steps finish. `resume(job_id)` puts a
+  failed or cancelled job back on the queue with its checkpoint, and the handler skips the
+  steps it already completed.
+
+Handlers may be plain functions or coroutine functions; coroutines run on a fresh event loop in
+the worker thread. Job state lives in a `store`. `InMemoryJobStore` is the local backend; any
+object with the same `put`/`get`/`list` methods can replace it.
+
+A payload can be large (an uploaded document), so finished jobs don't keep it: it is dropped
+when a job succeeds. A failed or cancelled job keeps only what `resume_payload(job)` returns, a
+small descriptor to resume from; when that is None the job can't be resumed. The store forgets
+finished jobs after `max_age` seconds, or sooner once more than `max_finished` have finished.
+
+Usage:
+    jobs = JobQueue(handler, workers=4)
+    job_id = jobs.submit(owner="session-id", name="policy.pdf", payload={...})
+    jobs.status(job_id)    # {"state": "running", "progress": 0.4, "messages": [...], ...}
+    jobs.cancel(job_id)
+    jobs.resume(job_id)
+"""
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, owner, name, payload):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.name = name
+        self.payload = payload
+        self.state = QUEUED
+        self.progress = 0.0
+        self.messages = []
+        self.checkpoint = {}
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        # False once the payload needed to resume the job was dropped.
+        self.resumable = True
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def report(self, message, progress=None):
+        with self._lock:
+            self.messages.append(message)
+            if progress is not None:
+                self.progress = max(0.0, min(1.0, progress))
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.name} was cancelled")
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "owner": self.owner,
+                "name": self.name,
+                "state": self.state,
+                "progress": self.progress,
+                "messages": list(self.messages),
+                "checkpoint": dict(self.checkpoint),
+                "result": self.result,
+                "error": self.error,
+                "attempts": self.attempts,
+                "resumable": self.resumable,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class InMemoryJobStore:
+    def __init__(self, max_finished=1000, max_age=3600):
+        self.max_finished = max_finished
+        self.max_age = max_age
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        # Forget finished jobs that are too old, then the oldest beyond `max_finished`; running
+        # and queued jobs are always kept.
+        finished = sorted(
+            (j for j in self._jobs.values() if j.state in FINISHED_STATES), key=lambda j: j.finished_at or 0
+        )
+        cutoff = time.time() - self.max_age
+        expired = [j for j in finished if (j.finished_at or 0) < cutoff]
+        kept = finished[len(expired):]
+        for old in expired + kept[: max(len(kept) - self.max_finished, 0)]:
+            del self._jobs[old.id]
+            old.payload = None
+            old.resumable = False
+
+    def put(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def list(self, owner=None):
+        with self._lock:
+            self._evict()
+            return [job for job in self._jobs.values() if owner is None or job.owner == owner]
+
+
+class JobQueue:
+    def __init__(self, handler, workers=4, store=None, resume_payload=None):
+        self.handler = handler
+        self.store = store or InMemoryJobStore()
+        # job -> payload kept to resume a failed or cancelled job; the full payload by default.
+        self.resume_payload = resume_payload or (lambda job: job.payload)
+        self._queue = queue.Queue()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._work_forever, name=f"job-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, owner, name, payload=None):
+        if self._closed:
+            raise RuntimeError("Job queue is closed")
+        job = Job(owner, name, payload)
+        self.store.put(job)
+        self._queue.put(job.id)
+        return job.id
+
+    def status(self, job_id):
+        job = self.store.get(job_id)
+        return job.snapshot() if job else None
+
+    def jobs_for(self, owner):
+        return [job.snapshot() for job in self.store.list(owner)]
+
+    def cancel(self, job_id):
+        """Cancels a queued job at once, or a running one at its next progress report."""
+        job = self.store.get(job_id)
+        if job is None or job.state in FINISHED_STATES:
+            return False
+        job._cancel.set()
+        with job._lock:
+            cancelled = job.state == QUEUED
+            if cancelled:
+                job.state = CANCELLED
+                job.finished_at = time.time()
+        if cancelled:
+            self._release_payload(job)
+        return True
+
+    def resume(self, job_id):
+        """Re-queues a failed or cancelled job; the handler picks up from `job.checkpoint`."""
+        job = self.store.get(job_id)
+        if job is None or job.state not in (FAILED, CANCELLED) or not job.resumable:
+            return False
+        with job._lock:
+            job._cancel.clear()
+            job.state = QUEUED
+            job.error = None
+            job.finished_at = None
+        self._queue.put(job.id)
+        return True
+
+    def _release_payload(self, job):
+        """Drops a finished job's payload, keeping only a resume descriptor for failed or cancelled jobs."""
+        if job.state == SUCCEEDED or job.payload is None:
+            job.payload = None
+            return
+        try:
+            payload = self.resume_payload(job)
+        except Exception as e:
+            print(f"Error occurred while keeping job {job.name} resumable: {e}")
+            payload = None
+        with job._lock:
+            job.payload = payload
+            job.resumable = payload is not None
+
+    def _run(self, job):
+        if asyncio.iscoroutinefunction(self.handler):
+            return asyncio.run(self.handler(job))
+        return self.handler(job)
+
+    def _work_forever(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            job = self.store.get(job_id)
+            if job is None:
+                continue
+            with job._lock:
+                if job.state != QUEUED:
+                    continue
+                job.state = RUNNING
+                job.attempts += 1
+                job.started_at = time.time()
+            try:
+                result = self._run(job)
+                state, error = SUCCEEDED, None
+            except JobCancelled:
+                result, state, error = None, CANCELLED, None
+            except Exception as e:
+                print(f"Error occurred while running job {job.name}: {e}")
+                traceback.print_exc()
+                result, state, error = None, FAILED, str(e)
+            with job._lock:
+                job.result, job.state, job.error = result, state, error
+                if state == SUCCEEDED:
+                    job.progress = 1.0
+                job.finished_at = time.time()
+            self._release_payload(job)
+            self.store.put(job)
+
+    def close(self, wait=False):
+        self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+
+__all__ = ["JobQueue", "Job", "JobCancelled", "InMemoryJobStore"]
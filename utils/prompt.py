@@ -0,0 +1,172 @@
+import math
+from utils.resources import shared_resource
+
+"""
+PromptBuilder Class:
+
+Assembles the RAG prompt within a token budget, so that prompt size (and with it completion
+latency) no longer grows with whatever retrieval and history happen to return.
+
+The budget is split in this order:
+
+1. `answer_tokens` are reserved for the model's answer (passed on as `max_tokens`).
+2. The instructions and the question are always included.
+3. The conversation history gets up to `history_tokens`. Only its most recent part is kept.
+4. Whatever is left goes to the retrieved contexts. They arrive ranked by relevance and are
+   packed greedily in that order: a chunk that doesn't fit is skipped and smaller, lower-ranked
+   chunks may still fit. Text that overlaps an already packed chunk, e.g. the splitter's
+   50-character overlap between neighbouring chunks, is trimmed first, whichever of the two
+   comes first in the document. Chunks that are contained in one already packed are dropped,
+   and so is the `NO_CONTEXT` placeholder retrieval returns when it finds nothing.
+
+Tokens are estimated at ~4 characters per token, the same estimate the history summarizer
+uses. Pass `count_tokens` to use a real tokenizer.
+
+`build` returns the prompt and a stats dict (token counts per section, contexts used / dropped,
+overlap characters removed) describing that request.
+
+A builder holds no per-request state, so one instance can serve every session and thread;
+`get_prompt_builder(...)` returns the process-wide builder for a given budget.
+
+Usage:
+    builder = PromptBuilder(budget_tokens=4096, answer_tokens=1024, history_tokens=1000)
+    prompt, stats = builder.build(query, contexts, history)
+"""
+
+TEMPLATE = """
+You are an expert assistant for interpreting privacy policies and terms and conditions.Your name is Termify Provide clear, factual, and detailed answers based only on the following inputs:
+- **Context:** Relevant information for the current conversation.
+- **Previous Context:** Relevant information from the previous conversation if available.
+If the answer is not in the context, say you don’t have the information. Do not reference or explain the context. Respond courteously to casual greetings.
+Context:
+{context}
+Previous Context: {history}
+Question: {query}
+Answer:
+"""
+
+
+# What retrieval returns when it found nothing; it is not a context.
+NO_CONTEXT = "No relevent text found"
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / 4)
+
+
+def _overlap(previous, text, min_overlap, max_overlap):
+    """Length of the longest suffix of `previous` (up to `max_overlap`) that is a prefix of `text`."""
+    longest = min(len(previous), len(text), max_overlap)
+    for size in range(longest, min_overlap - 1, -1):
+        if previous.endswith(text[:size]):
+            return size
+    return 0
+
+
+def _suffix_within(text, tokens, count_tokens):
+    """The longest suffix of `text` that `count_tokens` puts at or under `tokens`."""
+    low, high = 0, len(text)
+    while low < high:
+        start = (low + high) // 2
+        if count_tokens(text[start:]) <= tokens:
+            high = start
+        else:
+            low = start + 1
+    return text[low:]
+
+
+class PromptBuilder:
+    def __init__(
+        self,
+        budget_tokens=4096,
+        answer_tokens=1024,
+        history_tokens=1000,
+        template=TEMPLATE,
+        count_tokens=estimate_tokens,
+        min_overlap=20,
+        max_overlap=200,
+    ):
+        self.budget_tokens = budget_tokens
+        self.answer_tokens = answer_tokens
+        self.history_tokens = history_tokens
+        self.template = template
+        self.count_tokens = count_tokens
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+
+    def _trim_history(self, history, tokens):
+        if tokens <= 0 or not history:
+            return ""
+        if self.count_tokens(history) <= tokens:
+            return history
+        # Keep the most recent part, like RAG._bounded, measured with the builder's counter.
+        return _suffix_within(history, tokens, self.count_tokens)
+
+    def _dedupe(self, contexts):
+        packed, removed = [], 0
+        for context in contexts:
+            text = " ".join(str(context).split())
+            if not text or text == NO_CONTEXT:
+                continue
+            if any(text in other for other in packed):
+                removed += len(text)
+                continue
+            # Contexts come in relevance order, so a packed chunk may precede or follow this one.
+            for other in packed:
+                size = _overlap(other, text, self.min_overlap, self.max_overlap)
+                if size:
+                    text = text[size:].lstrip()
+                    removed += size
+                size = _overlap(text, other, self.min_overlap, self.max_overlap)
+                if size:
+                    text = text[:-size].rstrip()
+                    removed += size
+                if not text:
+                    break
+            if text:
+                packed.append(text)
+        return packed, removed
+
+    def build(self, query, contexts, history=""):
+        skeleton = self.template.format(context="", history="", query=query)
+        fixed_tokens = self.count_tokens(skeleton)
+        available = self.budget_tokens - self.answer_tokens - fixed_tokens
+
+        history = self._trim_history(history, min(self.history_tokens, max(available, 0)))
+        history_tokens = self.count_tokens(history) if history else 0
+        available -= history_tokens
+
+        candidates, overlap_removed = self._dedupe(contexts)
+        lines, context_tokens, dropped = [], 0, 0
+        for text in candidates:
+            line = f"[{len(lines) + 1}] {text}"
+            tokens = self.count_tokens(line) + 1
+            if context_tokens + tokens > available:
+                dropped += 1
+                continue
+            lines.append(line)
+            context_tokens += tokens
+
+        prompt = self.template.format(context="\n".join(lines), history=history, query=query)
+        stats = {
+            "prompt_tokens": self.count_tokens(prompt),
+            "fixed_tokens": fixed_tokens,
+            "history_tokens": history_tokens,
+            "context_tokens": context_tokens,
+            "answer_tokens": self.answer_tokens,
+            "budget_tokens": self.budget_tokens,
+            "contexts_in": len(contexts),
+            "contexts_used": len(lines),
+            "contexts_dropped": dropped + len(contexts) - len(candidates),
+            "overlap_chars_removed": overlap_removed,
+        }
+        return prompt, stats
+
+
+@shared_resource()
+def get_prompt_builder(budget_tokens=4096, answer_tokens=1024, history_tokens=1000):
+    """Returns the process-wide PromptBuilder with the default template for this budget."""
+    return PromptBuilder(budget_tokens=budget_tokens, answer_tokens=answer_tokens, history_tokens=history_tokens)
+
+
+__all__ = ["PromptBuilder", "estimate_tokens", "get_prompt_builder", "TEMPLATE", "NO_CONTEXT"]
@@ -0,0 +1,138 @@
+import os
+import atexit
+import threading
+import functools
+
+"""
+Shared resources
+
+Process-wide objects (the Snowflake connector, the search service pool, the upload queue,
+caches, indexes, the tracer) are built once per process and shared by every Streamlit session
+and thread, like `st.cache_resource`, but usable outside Streamlit too:
+
+    @shared_resource(close=lambda queue: queue.close())
+    def get_upload_queue():
+        return JobQueue(ingest_upload)
+
+The first call builds the resource and later calls return the same object. `None` (a feature
+that is not configured, or an index that is not built yet) is not cached, so a later call picks
+up an index built after the process started. Arguments are part of the key (they must be
+hashable), so `get_service_pool(connector)` builds one pool per connector.
+
+Resources built from files that are rebuilt while the app runs (the local index, the company
+list) pass `version`, a cheap callable taking the same arguments, e.g. the file's mtime and the
+settings it depends on. When it returns something else than when the resource was built, the
+resource is closed and built again:
+
+    @shared_resource(version=lambda: file_version(get_settings().get("COMPANY_INDEX_PATH")))
+    def get_company_index():
+        ...
+
+Lifetime: a resource lives until `teardown_resources()` runs, which happens at interpreter exit
+or when a caller (e.g. a test or a reload) invokes it. Teardown calls each resource's `close`
+in reverse order of creation, so a resource is closed before the ones it was built from.
+`get_x.clear()` tears down a single resource; the next call builds it again. `get_x.peek()`
+returns the built resource without building it.
+
+Per-user state (chat history, uploads, the user's own search service) does not belong here;
+it stays in `st.session_state`.
+"""
+
+_registry_lock = threading.Lock()
+# (resource, key) in order of creation, for teardown.
+_created = []
+
+
+class SharedResource:
+    def __init__(self, factory, close=None, version=None):
+        self.factory = factory
+        self.close = close
+        self.version = version
+        self.name = f"{factory.__module__}.{factory.__qualname__}"
+        self._values = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+        functools.update_wrapper(self, factory)
+
+    @staticmethod
+    def _key(args, kwargs):
+        return args + tuple(sorted(kwargs.items())) if kwargs else args
+
+    def __call__(self, *args, **kwargs):
+        key = self._key(args, kwargs)
+        version = self.version(*args, **kwargs) if self.version is not None else None
+        with self._lock:
+            if key in self._values and self._versions.get(key) != version:
+                self._teardown(key)
+            if key not in self._values:
+                value = self.factory(*args, **kwargs)
+                if value is None:
+                    return None
+                self._values[key] = value
+                self._versions[key] = version
+                with _registry_lock:
+                    _created.append((self, key))
+            return self._values[key]
+
+    def peek(self, *args, **kwargs):
+        with self._lock:
+            return self._values.get(self._key(args, kwargs))
+
+    def clear(self, *args, **kwargs):
+        """Closes and forgets the resource built for these arguments; without any, all of them."""
+        with self._lock:
+            keys = [self._key(args, kwargs)] if args or kwargs else list(self._values)
+            for key in keys:
+                self._teardown(key)
+
+    def _teardown(self, key):
+        with self._lock:
+            if key not in self._values:
+                return
+            value = self._values.pop(key)
+            self._versions.pop(key, None)
+        with _registry_lock:
+            if (self, key) in _created:
+                _created.remove((self, key))
+        if value is not None and self.close is not None:
+            try:
+                self.close(value)
+            except Exception as e:
+                print(f"Error occurred while closing {self.name}: {e}")
+
+
+def shared_resource(close=None, version=None):
+    """Decorator turning a factory into a process-wide, lazily built shared resource."""
+
+    def wrap(factory):
+        return SharedResource(factory, close, version)
+
+    return wrap
+
+
+def teardown_resources():
+    """Closes every shared resource, newest first."""
+    with _registry_lock:
+        created = list(reversed(_created))
+    for resource, key in created:
+        resource._teardown(key)
+
+
+def resource_stats():
+    """Returns the names of the shared resources that are currently built."""
+    with _registry_lock:
+        return [resource.name for resource, _ in _created]
+
+
+atexit.register(teardown_resources)
+
+
+def file_version(path):
+    """(path, mtime) of `path`, or (path, None) when it doesn't exist; a `version` building block."""
+    try:
+        return path, os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return path, None
+
+
+__all__ = ["SharedResource", "shared_resource", "teardown_resources", "resource_stats", "file_version"]
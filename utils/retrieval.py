@@ -0,0 +1,313 @@
+import os
+import csv
+import json
+import re
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from utils.secret_loader import get_settings
+from utils.resources import shared_resource, file_version
+
+"""
+Retrieval backends
+
+`RAG` searches through any object with the same `search` call as a Snowflake Cortex search
+service handle:
+
+    backend.search(query=..., columns=["DATA"], limit=5, filter=None).results -> [{"DATA": ...}, ...]
+
+Implementations:
+    CortexSearchBackend: wraps a Cortex search service handle.
+    LocalVectorIndex: in-process index over the rows `FileProcessor` produces. Use it offline
+        (dev, CI) or as a low-latency stand-in for the shared service.
+
+LocalVectorIndex embeds chunks with `HashingEmbedder`, which hashes word unigrams and bigrams into
+a fixed number of signed dimensions. This is CPU only, needs no model download and works in
+batches. Any object with `dim` and `embed(texts) -> float32 array` can replace it. Vectors are
+L2-normalized and stored as a raw float32 matrix that is opened with `numpy.memmap`, so an index
+larger than memory is paged in on demand. Search is exact: a blocked matrix-vector product
+followed by a top-k partial sort.
+
+Filters use the Cortex syntax for the `NAME` attribute: `{"@eq": {"NAME": "Acme"}}` or
+`{"@contains": {"NAMES": "Acme"}}`. A chunk matches a company when that company is its `NAME`
+or, after deduplication, one of its `NAMES`.
+
+Building:
+    with LocalIndexWriter("index_dir") as index:
+        await processor.process(writer=index, names_writer=index.names_writer)
+    backend = LocalVectorIndex.open("index_dir")
+
+On-disk layout: `vectors.f32` (row-major float32), `rows.jsonl` (one row per vector),
+`names.json` (chunk_id -> names) and `meta.json` (dimension, count, embedder).
+"""
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class SearchResponse:
+    def __init__(self, results, stats=None):
+        self.results = results
+        # Optional per-search details, e.g. the stage timings of a hybrid search.
+        self.stats = stats or {}
+
+
+class RetrievalBackend(ABC):
+    @abstractmethod
+    def search(self, query, columns, limit, filter=None):
+        """Returns a SearchResponse with up to `limit` rows holding `columns`."""
+
+
+class CortexSearchBackend(RetrievalBackend):
+    def __init__(self, service):
+        self.service = service
+
+    def search(self, query, columns, limit, filter=None):
+        if filter is None:
+            return self.service.search(query=query, columns=columns, limit=limit)
+        return self.service.search(query=query, columns=columns, limit=limit, filter=filter)
+
+
+@lru_cache(maxsize=1 << 18)
+def _feature(token, dim):
+    value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+    return value % dim, 1.0 if (value >> 63) & 1 else -1.0
+
+
+class HashingEmbedder:
+    name = "hashing-v1"
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+
+    def embed(self, texts):
+        import numpy as np
+
+        rows, columns, signs = [], [], []
+        for row, text in enumerate(texts):
+            tokens = _TOKEN.findall(text.lower())
+            for token in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                index, sign = _feature(token, self.dim)
+                rows.append(row)
+                columns.append(index)
+                signs.append(sign)
+        # One scatter-add for the whole batch instead of a numpy call per token.
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(vectors, (np.asarray(rows, dtype=np.intp), np.asarray(columns, dtype=np.intp)), np.asarray(signs, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+class LocalIndexWriter:
+    """Row writer that embeds chunks in batches and appends them to an index directory."""
+
+    def __init__(self, path, embedder=None, batch_size=1024):
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.names = {}
+        self.names_writer = _NamesCollector(self.names)
+        os.makedirs(path, exist_ok=True)
+        # Readers treat the index as missing until meta.json is written again by close().
+        if os.path.exists(os.path.join(path, "meta.json")):
+            os.remove(os.path.join(path, "meta.json"))
+        self._vectors = open(os.path.join(path, "vectors.f32"), "wb")
+        self._rows = open(os.path.join(path, "rows.jsonl"), "w", encoding="utf-8")
+        self._batch = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def writerow(self, row):
+        row = {key.upper(): value for key, value in row.items()}
+        if "DATA" not in row and "CHUNKS" in row:
+            row["DATA"] = row["CHUNKS"]
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self):
+        if not self._batch:
+            return
+        vectors = self.embedder.embed([row["DATA"] for row in self._batch])
+        self._vectors.write(vectors.astype("<f4").tobytes())
+        for row in self._batch:
+            self._rows.write(json.dumps(row, default=str) + "\n")
+        self.rows_written += len(self._batch)
+        self._batch = []
+
+    def close(self):
+        self.flush()
+        self._vectors.close()
+        self._rows.close()
+        with open(os.path.join(self.path, "names.json"), "w", encoding="utf-8") as f:
+            json.dump({chunk: sorted(names) for chunk, names in self.names.items()}, f)
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "count": self.rows_written,
+                    "dim": self.embedder.dim,
+                    "embedder": getattr(self.embedder, "name", type(self.embedder).__name__),
+                },
+                f,
+            )
+
+
+class _NamesCollector:
+    def __init__(self, names):
+        self.names = names
+
+    def writerow(self, row):
+        self.names.setdefault(row["chunk_id"], set()).add(row["name"])
+
+
+class NameFilterMixin:
+    """`filter` support for backends that hold the chunk rows (`self.rows`) in memory."""
+
+    _by_name = None
+    _by_name_lock = threading.Lock()
+
+    def _rows_for_name(self, name):
+        with self._by_name_lock:
+            if self._by_name is None:
+                by_name = {}
+                for i, row in enumerate(self.rows):
+                    for row_name in row.get("NAMES") or [row.get("NAME")]:
+                        by_name.setdefault(row_name, []).append(i)
+                self._by_name = by_name
+        return self._by_name.get(name, [])
+
+    def _candidates(self, filter):
+        if not filter:
+            return None
+        (op, condition), = filter.items()
+        (column, value), = condition.items()
+        if op not in ("@eq", "@contains") or column not in ("NAME", "NAMES"):
+            raise ValueError(f"Unsupported filter {filter}")
+        return self._rows_for_name(value)
+
+    def _result(self, row_id, columns, score):
+        row = self.rows[row_id]
+        result = {column: row.get(column, row.get("DATA") if column == "CHUNKS" else None) for column in columns}
+        result["@score"] = score
+        return result
+
+
+class LocalVectorIndex(NameFilterMixin, RetrievalBackend):
+    def __init__(self, vectors, rows, embedder, block_size=65536):
+        self.vectors = vectors
+        self.rows = rows
+        self.embedder = embedder
+        self.block_size = block_size
+
+    @classmethod
+    def open(cls, path, embedder=None):
+        import numpy as np
+
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        embedder = embedder or HashingEmbedder(meta["dim"])
+        if embedder.dim != meta["dim"]:
+            raise ValueError(f"Index at {path} has {meta['dim']} dimensions, the embedder {embedder.dim}")
+        vectors = (
+            np.memmap(os.path.join(path, "vectors.f32"), dtype="<f4", mode="r", shape=(meta["count"], meta["dim"]))
+            if meta["count"]
+            else np.zeros((0, meta["dim"]), dtype=np.float32)
+        )
+        names_path = os.path.join(path, "names.json")
+        names = {}
+        if os.path.exists(names_path):
+            with open(names_path, encoding="utf-8") as f:
+                names = json.load(f)
+        rows = []
+        with open(os.path.join(path, "rows.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                row["NAMES"] = names.get(row.get("CHUNK_ID"), [row.get("NAME")])
+                rows.append(row)
+        return cls(vectors, rows, embedder)
+
+    @classmethod
+    def build_from_csv(cls, csv_path, path, embedder=None, batch_size=1024):
+        """Builds an index from the CSV `FileProcessor.process` writes (and its .names.csv)."""
+        from utils.datasets import CSV_FIELDS
+        from utils.dedup import NAME_FIELDS
+
+        with LocalIndexWriter(path, embedder, batch_size) as writer:
+            with open(csv_path, newline="", encoding="utf-8") as f:
+                writer.writerows(csv.DictReader(f, fieldnames=CSV_FIELDS))
+            names_csv = f"{csv_path}.names.csv"
+            if os.path.exists(names_csv):
+                with open(names_csv, newline="", encoding="utf-8") as f:
+                    for row in csv.DictReader(f, fieldnames=NAME_FIELDS):
+                        writer.names_writer.writerow(row)
+        return cls.open(path, embedder)
+
+    def _top_k(self, query_vector, limit, candidates):
+        import numpy as np
+
+        if candidates is not None:
+            if not candidates:
+                return []
+            index = np.asarray(candidates)
+            scores = self.vectors[index] @ query_vector
+            best = np.argsort(-scores, kind="stable")[:limit]
+            return list(zip(index[best].tolist(), scores[best].tolist()))
+
+        best_ids, best_scores = [], []
+        for start in range(0, len(self.vectors), self.block_size):
+            scores = np.asarray(self.vectors[start:start + self.block_size]) @ query_vector
+            k = min(limit, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            best_ids.extend((top + start).tolist())
+            best_scores.extend(scores[top].tolist())
+        order = sorted(range(len(best_ids)), key=lambda i: (-best_scores[i], best_ids[i]))[:limit]
+        return [(best_ids[i], best_scores[i]) for i in order]
+
+    def search(self, query, columns, limit, filter=None):
+        if not len(self.vectors) or limit <= 0:
+            return SearchResponse([])
+        query_vector = self.embedder.embed([query])[0]
+        return SearchResponse(
+            [self._result(row_id, columns, score) for row_id, score in self._top_k(query_vector, limit, self._candidates(filter))]
+        )
+
+
+def index_version(path):
+    """Changes whenever the index at `path` is (re)built; meta.json is written last."""
+    return file_version(os.path.join(path, "meta.json") if path else None)
+
+
+@shared_resource(version=lambda: index_version(get_settings().get("LOCAL_INDEX_PATH")))
+def get_local_index():
+    """
+    Returns the process-wide LocalVectorIndex at LOCAL_INDEX_PATH, or None when it is not set or
+    not built yet. It is opened again once the index is rebuilt.
+    """
+    path = get_settings().get("LOCAL_INDEX_PATH")
+    if path and os.path.exists(os.path.join(path, "meta.json")):
+        return LocalVectorIndex.open(path)
+    return None
+
+
+__all__ = [
+    "RetrievalBackend",
+    "CortexSearchBackend",
+    "LocalVectorIndex",
+    "LocalIndexWriter",
+    "HashingEmbedder",
+    "SearchResponse",
+    "NameFilterMixin",
+    "get_local_index",
+    "index_version",
+]
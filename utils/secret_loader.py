@@ -1,23 +1,126 @@
 import os
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Callable, List, Mapping, Optional
 import streamlit as st
-from dotenv import load_dotenv
+from dotenv import dotenv_values
+
+"""
+Settings
+
+Configuration is read once, on first use, from three sources in this order of precedence:
+
+1. Process environment variables.
+2. The `.env` file (found the same way `load_dotenv()` finds it).
+3. Streamlit secrets (`.streamlit/secrets.toml`).
+
+The merged values are frozen into a `Settings` object. Later lookups are dictionary reads, with
+no filesystem access or env parsing on hot paths. Call `reload_settings()` after rotating
+credentials; the callbacks registered with `on_settings_reload` then get the new settings.
+
+Usage:
+- `get_settings().snowflake_database` for the typed, well-known keys.
+- `get_secret("ANY_KEY")` for everything else; it returns None for a missing key.
+- `get_settings().require("SNOWFLAKE_USER", ...)` raises ValueError naming the missing keys.
+"""
+
+
+def _read_streamlit_secrets():
+    try:
+        return {
+            key: str(value)
+            for key, value in st.secrets.items()
+            if isinstance(value, (str, int, float, bool))
+        }
+    except Exception:
+        # No secrets.toml, or not running under Streamlit.
+        return {}
 
-def get_secret(key: str):
-    load_dotenv()
-    """Fetch secret from environment variables or fallback to Streamlit secrets."""
-    secret_value = os.environ[key]
-    if secret_value:
-        return secret_value
 
-    # if not found in env
+def _read_dotenv():
     try:
-        if key in st.secrets:
-            return st.secrets[key]
-    except FileNotFoundError:
-        pass
+        return {key: value for key, value in dotenv_values().items() if value is not None}
+    except Exception as e:
+        print(f"Could not read the .env file: {e}")
+        return {}
+
+
+@dataclass(frozen=True)
+class Settings:
+    values: Mapping[str, str] = field(default_factory=dict, repr=False)
+
+    snowflake_account: Optional[str] = None
+    snowflake_user: Optional[str] = None
+    snowflake_password: Optional[str] = field(default=None, repr=False)
+    snowflake_role: Optional[str] = None
+    snowflake_warehouse: Optional[str] = None
+    snowflake_database: Optional[str] = None
+    snowflake_schema: Optional[str] = None
+    snowflake_cortex_search_service: Optional[str] = None
+    cortex_search_table_name: Optional[str] = None
+    user_database: Optional[str] = None
+
+    @classmethod
+    def load(cls):
+        merged = {}
+        # Lowest precedence first, so later sources overwrite earlier ones.
+        for source in (_read_streamlit_secrets(), _read_dotenv(), dict(os.environ)):
+            merged.update({key: value for key, value in source.items() if value != ""})
+        typed = {name: merged.get(name.upper()) for name in cls.__dataclass_fields__ if name != "values"}
+        return cls(values=MappingProxyType(merged), **typed)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def missing(self, *keys):
+        return [key for key in keys if not self.values.get(key)]
+
+    def require(self, *keys):
+        missing = self.missing(*keys)
+        if missing:
+            raise ValueError(f"missing required variable {', '.join(missing)}")
+        return self
+
+
+_settings = None
+_settings_lock = threading.Lock()
+_reload_hooks: List[Callable[[Settings], None]] = []
+
+
+def get_settings() -> Settings:
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = Settings.load()
+    return _settings
+
+
+def reload_settings() -> Settings:
+    """Re-reads every source, e.g. after credentials were rotated, and notifies the reload hooks."""
+    global _settings
+    with _settings_lock:
+        _settings = Settings.load()
+        hooks = list(_reload_hooks)
+    for hook in hooks:
+        try:
+            hook(_settings)
+        except Exception as e:
+            print(f"Error occurred in a settings reload hook: {e}")
+    return _settings
+
+
+def on_settings_reload(hook: Callable[[Settings], None]):
+    with _settings_lock:
+        _reload_hooks.append(hook)
+    return hook
+
+
+def get_secret(key: str):
+    """Fetch secret from environment variables, the .env file or Streamlit secrets."""
+    return get_settings().get(key)
 
-    return None
 
-  
 
-__all__ = ["get_secret"]
+__all__ = ["get_secret", "get_settings", "reload_settings", "on_settings_reload", "Settings"]
@@ -0,0 +1,401 @@
+import re
+import time
+import uuid
+import socket
+import threading
+from utils.cache import retrieval_cache
+from utils.secret_loader import get_settings
+from utils.resources import shared_resource
+
+"""
+ServicePool Class:
+
+Keeps a pool of pre-created user schemas, each holding an empty `DATA` table and a Cortex
+search service over it, so an upload doesn't wait for `CREATE SCHEMA`, `CREATE TABLE` and
+`CREATE CORTEX SEARCH SERVICE`. An upload leases a ready slot, inserts its chunks into the slot's
+table and calls `refresh(slot)`, which asks the service to re-index right away.
+
+A background provisioner thread:
+
+1. Creates slots until `target_ready` are ready, without going over `max_slots` in total.
+2. Recycles slots whose lease was released or expired. Recycling truncates the table,
+   refreshes the service, drops cached search results for it, and puts the slot back in the
+   ready list. Slots beyond `max_ready` ready ones are dropped instead.
+
+`lease()` returns a `ServiceLease` that the caller keeps. Its token is only valid until the lease
+ends, so a caller whose lease expired can't heartbeat, query or release the slot after it was
+recycled and leased to someone else. Streamlit has no reliable session-end hook, so a lease
+lasts `lease_ttl` seconds after the last `heartbeat(lease)`. Callers heartbeat on every
+interaction and before writing to the slot's table.
+
+Slot schemas are named `SLOT_PREFIX` + instance + suffix. The instance is USER_SERVICE_POOL_INSTANCE,
+or the host name, so replicas never share slots. On start-up, an instance drops the slots left
+over from its own earlier process, because they may still hold a previous user's document.
+
+Every `heartbeat_interval` seconds an instance stamps the time into the comment of each of its
+slot schemas. A container's host name changes on every restart, so the slots of a gone instance
+would otherwise never be dropped and keep billing. Any instance drops slots, of whichever instance,
+whose last stamp (or creation time, for unstamped ones) is older than `stale_after` seconds.
+
+Usage:
+    pool = get_service_pool(connector)
+    lease = pool.lease()         # None when no slot is ready yet
+    ... insert rows into lease.slot.table_name ...
+    pool.refresh(lease.slot)
+    pool.release(lease)
+"""
+
+SLOT_PREFIX = "POOL_SLOT_"
+# Slot schema comments hold this prefix followed by the instance's last heartbeat (epoch seconds).
+HEARTBEAT_PREFIX = "termify-pool-heartbeat:"
+
+
+class ServiceSlot:
+    def __init__(self, database, schema, service_name, table_name="DATA"):
+        self.database = database
+        self.schema = schema
+        self.service_name = service_name
+        self.table_name = table_name
+
+    @property
+    def service_id(self):
+        return f"{self.database}.{self.schema}.{self.service_name}"
+
+    @property
+    def qualified_table(self):
+        return f"{self.database}.{self.schema}.{self.table_name}"
+
+
+class ServiceLease:
+    def __init__(self, slot, expires_at):
+        self.slot = slot
+        self.token = uuid.uuid4().hex
+        self.expires_at = expires_at
+
+
+def _instance_id(name=None):
+    return re.sub(r"[^A-Z0-9]", "_", (name or socket.gethostname()).upper()) or "DEFAULT"
+
+
+def _row_value(row, key):
+    try:
+        return row[key]
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def _last_seen(row):
+    """Epoch seconds of a slot schema's last heartbeat, else of its creation; None if unknown."""
+    comment = _row_value(row, "comment") or ""
+    if comment.startswith(HEARTBEAT_PREFIX):
+        try:
+            return float(comment[len(HEARTBEAT_PREFIX):])
+        except ValueError:
+            pass
+    created_on = _row_value(row, "created_on")
+    return created_on.timestamp() if hasattr(created_on, "timestamp") else None
+
+
+class ServicePool:
+    def __init__(
+        self,
+        connector,
+        database,
+        warehouse,
+        target_ready=2,
+        max_ready=None,
+        max_slots=10,
+        lease_ttl=3600,
+        interval=15,
+        target_lag="1 days",
+        embedding_model="snowflake-arctic-embed-l-v2.0",
+        instance=None,
+        heartbeat_interval=600,
+        stale_after=24 * 3600,
+    ):
+        self.connector = connector
+        self.database = database
+        self.warehouse = warehouse
+        self.target_ready = target_ready
+        # Recycling is cheaper than provisioning, so keep some extra ready slots around.
+        self.max_ready = max_ready if max_ready is not None else 2 * target_ready
+        self.max_slots = max_slots
+        self.lease_ttl = lease_ttl
+        self.interval = interval
+        self.target_lag = target_lag
+        self.embedding_model = embedding_model
+        self.slot_prefix = f"{SLOT_PREFIX}{_instance_id(instance)}_"
+        self.heartbeat_interval = heartbeat_interval
+        # Must stay well above heartbeat_interval, or live instances lose their slots.
+        self.stale_after = max(stale_after, 3 * heartbeat_interval)
+        self._last_heartbeat = 0.0
+
+        self._ready = []
+        self._leased = {}
+        self._dirty = []
+        self._provisioning = 0
+        # Schemas of slots being created, not yet in any list.
+        self._creating = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._counters = {"provisioned": 0, "leases": 0, "misses": 0, "recycled": 0, "dropped": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._provision_forever, name="cortex-service-pool", daemon=True)
+        self._thread.start()
+
+    def _sql(self, session, *statements):
+        for statement in statements:
+            session.sql(statement).collect()
+
+    def _heartbeat_comment(self):
+        return f"{HEARTBEAT_PREFIX}{int(time.time())}"
+
+    def _create_slot(self):
+        suffix = uuid.uuid4().hex.upper()
+        slot = ServiceSlot(self.database, f"{self.slot_prefix}{suffix}", f"CSS_{suffix}")
+        with self._lock:
+            self._creating.add(slot.schema)
+        try:
+            self._create_slot_objects(slot)
+        finally:
+            with self._lock:
+                self._creating.discard(slot.schema)
+        return slot
+
+    def _create_slot_objects(self, slot):
+        with self.connector.lease() as session:
+            self._sql(
+                session,
+                f"CREATE SCHEMA IF NOT EXISTS {self.database}.{slot.schema} COMMENT = '{self._heartbeat_comment()}'",
+                f"CREATE TABLE IF NOT EXISTS {slot.qualified_table} (CHUNKS VARCHAR, PAGE NUMBER)",
+                f"""
+                CREATE CORTEX SEARCH SERVICE IF NOT EXISTS {slot.service_id}
+                  ON CHUNKS
+                  WAREHOUSE = {self.warehouse}
+                  TARGET_LAG = '{self.target_lag}'
+                  EMBEDDING_MODEL = '{self.embedding_model}'
+                AS (
+                  SELECT
+                       CHUNKS
+                  FROM {slot.qualified_table}
+                )
+                """,
+            )
+
+    def _drop_schema(self, schema):
+        with self.connector.lease() as session:
+            self._sql(session, f"DROP SCHEMA IF EXISTS {self.database}.{schema}")
+
+    def _recycle(self, slot):
+        with self.connector.lease() as session:
+            self._sql(
+                session,
+                f"TRUNCATE TABLE IF EXISTS {slot.qualified_table}",
+                f"ALTER CORTEX SEARCH SERVICE {slot.service_id} REFRESH",
+            )
+        retrieval_cache.invalidate(lambda key: key[1] == slot.service_id)
+
+    def _known_schemas(self):
+        with self._lock:
+            known = {slot.schema for slot in self._ready + self._dirty}
+            known.update(lease.slot.schema for lease in self._leased.values())
+            known.update(self._creating)
+        return known
+
+    def heartbeat_slots(self):
+        """Stamps the current time into the comment of every slot schema of this instance."""
+        comment = self._heartbeat_comment()
+        with self.connector.lease() as session:
+            for schema in self._known_schemas():
+                self._sql(session, f"ALTER SCHEMA IF EXISTS {self.database}.{schema} SET COMMENT = '{comment}'")
+        self._last_heartbeat = time.time()
+
+    def drop_stale_slots(self):
+        """
+        Drops this instance's slot schemas left behind by an earlier process, and the slots of
+        any instance that stopped heartbeating more than `stale_after` seconds ago.
+        """
+        with self.connector.lease() as session:
+            rows = session.sql(f"SHOW SCHEMAS LIKE '{SLOT_PREFIX}%' IN DATABASE {self.database}").collect()
+        known = self._known_schemas()
+        cutoff = time.time() - self.stale_after
+        for row in rows:
+            schema = row["name"]
+            if schema in known or not self._is_slot(schema):
+                continue
+            last_seen = _last_seen(row)
+            if self._is_own_slot(schema) or (last_seen is not None and last_seen < cutoff):
+                self._drop_schema(schema)
+
+    @staticmethod
+    def _is_slot(schema):
+        return re.fullmatch(rf"{SLOT_PREFIX}[A-Z0-9_]+_[0-9A-F]{{32}}", schema.upper()) is not None
+
+    def _is_own_slot(self, schema):
+        # LIKE treats "_" as a wildcard, and instance "A" is a prefix of instance "A_B", so only
+        # names of exactly this prefix followed by a slot suffix are ours.
+        schema = schema.upper()
+        return schema.startswith(self.slot_prefix) and re.fullmatch(r"[0-9A-F]{32}", schema[len(self.slot_prefix):]) is not None
+
+    def lease(self):
+        """Returns a ServiceLease on a ready slot, or None when none is ready (the caller should fall back)."""
+        with self._lock:
+            if not self._ready:
+                self._counters["misses"] += 1
+                self._wakeup.set()
+                return None
+            lease = ServiceLease(self._ready.pop(), time.time() + self.lease_ttl)
+            self._leased[lease.token] = lease
+            self._counters["leases"] += 1
+        # Start provisioning the replacement straight away.
+        self._wakeup.set()
+        return lease
+
+    def is_leased(self, lease):
+        with self._lock:
+            return self._leased.get(lease.token) is lease
+
+    def heartbeat(self, lease):
+        """Extends the lease; returns False if it already expired and the slot was recycled."""
+        with self._lock:
+            if self._leased.get(lease.token) is not lease:
+                return False
+            lease.expires_at = time.time() + self.lease_ttl
+            return True
+
+    def refresh(self, slot):
+        """Re-indexes the slot's service now instead of waiting for its target lag."""
+        with self.connector.lease() as session:
+            self._sql(session, f"ALTER CORTEX SEARCH SERVICE {slot.service_id} REFRESH")
+        retrieval_cache.invalidate(lambda key: key[1] == slot.service_id)
+
+    def release(self, lease):
+        with self._lock:
+            if self._leased.get(lease.token) is not lease:
+                return
+            del self._leased[lease.token]
+            self._dirty.append(lease.slot)
+        self._wakeup.set()
+
+    def _expire_leases(self):
+        now = time.time()
+        with self._lock:
+            for token, lease in list(self._leased.items()):
+                if lease.expires_at < now:
+                    del self._leased[token]
+                    self._dirty.append(lease.slot)
+
+    def _recycle_dirty(self):
+        while True:
+            with self._lock:
+                if not self._dirty:
+                    return
+                slot = self._dirty.pop()
+                surplus = len(self._ready) >= self.max_ready
+            try:
+                if surplus:
+                    self._drop_schema(slot.schema)
+                    with self._lock:
+                        self._counters["dropped"] += 1
+                    continue
+                self._recycle(slot)
+            except Exception as e:
+                print(f"Error occurred while recycling {slot.schema}: {e}")
+                with self._lock:
+                    self._counters["errors"] += 1
+                # A slot that couldn't be emptied must never be handed to another user.
+                try:
+                    self._drop_schema(slot.schema)
+                except Exception:
+                    pass
+                continue
+            with self._lock:
+                self._ready.insert(0, slot)
+                self._counters["recycled"] += 1
+
+    def _fill(self):
+        while True:
+            with self._lock:
+                total = len(self._ready) + len(self._leased) + len(self._dirty) + self._provisioning
+                if self._closed or len(self._ready) + self._provisioning >= self.target_ready or total >= self.max_slots:
+                    return
+                self._provisioning += 1
+            try:
+                slot = self._create_slot()
+            except Exception as e:
+                print(f"Error occurred while provisioning a Cortex search service: {e}")
+                with self._lock:
+                    self._counters["errors"] += 1
+                return
+            finally:
+                with self._lock:
+                    self._provisioning -= 1
+            with self._lock:
+                self._ready.insert(0, slot)
+                self._counters["provisioned"] += 1
+
+    def _provision_forever(self):
+        try:
+            self.drop_stale_slots()
+        except Exception as e:
+            print(f"Error occurred while dropping stale slots: {e}")
+        # New slots are stamped when created; the first heartbeat is due one interval later.
+        self._last_heartbeat = time.time()
+        while not self._closed:
+            try:
+                self._expire_leases()
+                self._recycle_dirty()
+                self._fill()
+                if time.time() - self._last_heartbeat >= self.heartbeat_interval:
+                    self.heartbeat_slots()
+                    self.drop_stale_slots()
+            except Exception as e:
+                print(f"Error occurred while maintaining the service pool: {e}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "ready": len(self._ready),
+                "leased": len(self._leased),
+                "dirty": len(self._dirty),
+                "provisioning": self._provisioning,
+                **self._counters,
+            }
+
+    def close(self, drop=False):
+        """Stops the provisioner; with `drop`, also drops the slots that are not leased."""
+        with self._lock:
+            self._closed = True
+            unleased = self._ready + self._dirty
+            self._ready, self._dirty = [], []
+        self._wakeup.set()
+        if drop:
+            for slot in unleased:
+                try:
+                    self._drop_schema(slot.schema)
+                except Exception as e:
+                    print(f"Error occurred while dropping {slot.schema}: {e}")
+
+
+# Slots left behind by close() are dropped by the next process on start-up.
+@shared_resource(close=lambda pool: pool.close())
+def get_service_pool(connector):
+    """Returns the process-wide ServicePool for `connector`, or None when USER_SERVICE_POOL_SIZE is 0."""
+    settings = get_settings()
+    target_ready = int(settings.get("USER_SERVICE_POOL_SIZE", 2))
+    if target_ready <= 0:
+        return None
+    return ServicePool(
+        connector,
+        settings.user_database,
+        settings.snowflake_warehouse,
+        target_ready=target_ready,
+        max_slots=int(settings.get("USER_SERVICE_POOL_MAX", 10)),
+        lease_ttl=int(settings.get("USER_SERVICE_LEASE_TTL", 3600)),
+        instance=settings.get("USER_SERVICE_POOL_INSTANCE"),
+    )
+
+
+__all__ = ["ServicePool", "ServiceSlot", "ServiceLease", "get_service_pool"]
@@ -1,5 +1,8 @@
-from snowflake.snowpark import Session
-from utils.secret_loader import get_secret
+import time
+import threading
+from contextlib import contextmanager
+from utils.secret_loader import get_settings, on_settings_reload
+from utils.resources import shared_resource
 
 """
 SnowflakeConnector
@@ -11,41 +14,304 @@ This module provides a class `SnowflakeConnector` for managing connections to a
 3. Automatically reconnecting if a session is not already active.
 4. Safely closing the session to release resources.
 
+Sessions come from a process-wide `SessionPool` shared by every connector with the same
+credentials, so Streamlit tabs and batch scripts reuse logged-in sessions instead of opening
+a new one each. The pool keeps between `min_size` and `max_size` sessions, health-checks idle
+sessions before handing them out, closes sessions idle for longer than `idle_timeout`, and
+replaces sessions that fail.
+
 Usage:
 - Ensure the required environment variables (`SNOWFLAKE_ACCOUNT`, `SNOWFLAKE_USER`, `SNOWFLAKE_PASSWORD`, `SNOWFLAKE_ROLE`) are set in a `.env` file.
-- Use `get_session()` to retrieve the active session or establish a new connection.
-- Use `close_connection()` to safely close the active session.
+- Use `with connector.lease() as session:` to borrow a session for one unit of work.
+- Use `get_session()` to keep one session for the lifetime of the connector (batch scripts).
+- Use `close_connection()` to hand that session back to the pool.
+- Use `metrics()` to read the pool counters.
 """
 
 
+class _PooledSession:
+    def __init__(self, session, generation=0):
+        self.session = session
+        self.generation = generation
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+        self.root = None
 
-class SnowflakeConnector:
-    def __init__(self):
-
-        # Set the variables in an .env file
-        required_env_vars = [
-            "SNOWFLAKE_ACCOUNT",
-            "SNOWFLAKE_USER",
-            "SNOWFLAKE_PASSWORD",
-            "SNOWFLAKE_ROLE",
-        ]
-
-        for var in required_env_vars:
-            if not get_secret(var):
-                raise ValueError(f"missing required variable {var}")
-
-        self.connection_parameters = {
-            "account": get_secret("SNOWFLAKE_ACCOUNT"),
-            "user": get_secret("SNOWFLAKE_USER"),
-            "password": get_secret("SNOWFLAKE_PASSWORD"),
-            "role": get_secret("SNOWFLAKE_ROLE"),
+
+class SessionPool:
+    def __init__(
+        self,
+        connection_parameters,
+        min_size=1,
+        max_size=8,
+        idle_timeout=600,
+        health_check_interval=60,
+        acquire_timeout=30,
+        connect_retries=3,
+    ):
+        self.connection_parameters = connection_parameters
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.connect_retries = connect_retries
+
+        self._idle = []
+        self._in_use = {}
+        self._creating = 0
+        self._lock = threading.Condition()
+        self._closed = False
+        self._generation = 0
+        self._counters = {
+            "created": 0,
+            "closed": 0,
+            "leases": 0,
+            "waits": 0,
+            "health_check_failures": 0,
+            "connect_failures": 0,
         }
+        self._reaper = threading.Thread(target=self._reap_forever, name="snowflake-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _connect(self):
+        for attempt in range(1, self.connect_retries + 1):
+            try:
+                with self._lock:
+                    parameters, generation = self.connection_parameters, self._generation
+                from snowflake.snowpark import Session
+
+                session = Session.builder.configs(parameters).create()
+                print("Connected Successfully")
+                with self._lock:
+                    self._counters["created"] += 1
+                return _PooledSession(session, generation)
+            except Exception as e:
+                with self._lock:
+                    self._counters["connect_failures"] += 1
+                if attempt == self.connect_retries:
+                    raise
+                print(f"Error occurred during connection: {e}, retrying...")
+                time.sleep(2 ** (attempt - 1))
+
+    def _close(self, entry):
+        try:
+            entry.session.close()
+        except Exception as e:
+            print(f"Error occurred while closing the session: {e}")
+        with self._lock:
+            self._counters["closed"] += 1
+
+    def _is_healthy(self, entry, force=False):
+        if not force and time.time() - entry.last_checked < self.health_check_interval:
+            return True
+        try:
+            entry.session.sql("SELECT 1").collect()
+            entry.last_checked = time.time()
+            return True
+        except Exception:
+            with self._lock:
+                self._counters["health_check_failures"] += 1
+            return False
+
+    def acquire(self, timeout=None):
+        """Leases a session; blocks while `max_size` sessions are in use."""
+        deadline = time.time() + (self.acquire_timeout if timeout is None else timeout)
+        while True:
+            entry = None
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Session pool is closed")
+                if self._idle:
+                    # Most recently used first, so surplus sessions go idle and get evicted.
+                    entry = self._idle.pop()
+                elif len(self._in_use) + self._creating < self.max_size:
+                    self._creating += 1
+                else:
+                    self._counters["waits"] += 1
+                    remaining = deadline - time.time()
+                    if remaining <= 0 or not self._lock.wait(remaining):
+                        raise TimeoutError(f"No Snowflake session available within the pool limit of {self.max_size}")
+                    continue
+
+            if entry is None:
+                try:
+                    entry = self._connect()
+                finally:
+                    with self._lock:
+                        self._creating -= 1
+                        self._lock.notify()
+            elif not self._is_healthy(entry):
+                # Reconnect transparently instead of handing out a dead session.
+                self._close(entry)
+                continue
+
+            with self._lock:
+                entry.last_used = time.time()
+                self._in_use[id(entry.session)] = entry
+                self._counters["leases"] += 1
+            return entry.session
+
+    def release(self, session, broken=False):
+        with self._lock:
+            entry = self._in_use.pop(id(session), None)
+        if entry is None:
+            return
+        if self._closed or entry.generation != self._generation or (broken and not self._is_healthy(entry, force=True)):
+            self._close(entry)
+        else:
+            entry.last_used = time.time()
+            with self._lock:
+                self._idle.append(entry)
+        with self._lock:
+            self._lock.notify()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        session = self.acquire(timeout)
+        broken = False
+        try:
+            yield session
+        except Exception:
+            # The error may or may not be the connection's fault; release() re-checks it.
+            broken = True
+            raise
+        finally:
+            self.release(session, broken=broken)
+
+    def root_for(self, session):
+        """Returns a `Root` bound to a pooled session, created once per session."""
+        from snowflake.core import Root
+
+        with self._lock:
+            entry = self._in_use.get(id(session))
+        if entry is None:
+            return Root(session)
+        if entry.root is None:
+            entry.root = Root(session)
+        return entry.root
+
+    def update_parameters(self, connection_parameters):
+        """Switches to new credentials: idle sessions are closed now, leased ones when released."""
+        with self._lock:
+            if connection_parameters == self.connection_parameters:
+                return
+            self.connection_parameters = connection_parameters
+            self._generation += 1
+            idle, self._idle = self._idle, []
+        for entry in idle:
+            self._close(entry)
+
+    def evict_idle(self):
+        """Closes sessions idle for longer than `idle_timeout`, keeping `min_size` sessions."""
+        now = time.time()
+        expired = []
+        with self._lock:
+            size = len(self._idle) + len(self._in_use)
+            keep = []
+            # Oldest idle sessions sit at the front of the list.
+            for entry in self._idle:
+                if now - entry.last_used > self.idle_timeout and size > self.min_size:
+                    expired.append(entry)
+                    size -= 1
+                else:
+                    keep.append(entry)
+            self._idle = keep
+        for entry in expired:
+            self._close(entry)
+
+    def fill_to_min_size(self):
+        """Opens sessions until the pool holds `min_size`, so first requests skip the login."""
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle) + len(self._in_use) + self._creating >= self.min_size:
+                    return
+                self._creating += 1
+            try:
+                entry = self._connect()
+            except Exception as e:
+                print(f"Error occurred while warming up the session pool: {e}")
+                return
+            finally:
+                with self._lock:
+                    self._creating -= 1
+            with self._lock:
+                self._idle.insert(0, entry)
+                self._lock.notify()
+
+    def _reap_forever(self):
+        while not self._closed:
+            try:
+                self.evict_idle()
+                self.fill_to_min_size()
+            except Exception as e:
+                print(f"Error occurred while maintaining the session pool: {e}")
+            time.sleep(self.health_check_interval)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "size": len(self._idle) + len(self._in_use),
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                **self._counters,
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._lock.notify_all()
+        for entry in idle:
+            self._close(entry)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(connection_parameters, **pool_options):
+    """Returns the process-wide pool for these credentials, creating it on first use."""
+    key = tuple(sorted(connection_parameters.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool._closed:
+            pool = _pools[key] = SessionPool(connection_parameters, **pool_options)
+        return pool
+
+
+# Set the variables in an .env file
+REQUIRED_ENV_VARS = [
+    "SNOWFLAKE_ACCOUNT",
+    "SNOWFLAKE_USER",
+    "SNOWFLAKE_PASSWORD",
+    "SNOWFLAKE_ROLE",
+]
+
+
+def _connection_parameters(settings):
+    settings.require(*REQUIRED_ENV_VARS)
+    return {
+        "account": settings.snowflake_account,
+        "user": settings.snowflake_user,
+        "password": settings.snowflake_password,
+        "role": settings.snowflake_role,
+    }
+
+
+class SnowflakeConnector:
+    def __init__(self, **pool_options):
+
+        self.connection_parameters = _connection_parameters(get_settings())
+        self.pool = get_pool(self.connection_parameters, **pool_options)
         self.session = None
 
     def __connect(self):
         try:
-            self.session = Session.builder.configs(self.connection_parameters).create()
-            print("Connected Successfully")
+            self.session = self.pool.acquire()
         except Exception as e:
             print(f"Error occurred during connection: {e}")
             self.session = None
@@ -55,15 +321,38 @@ class SnowflakeConnector:
             self.__connect()
         return self.session
 
+    def lease(self, timeout=None):
+        return self.pool.lease(timeout)
+
+    def root_for(self, session):
+        return self.pool.root_for(session)
+
+    def metrics(self):
+        return self.pool.metrics()
+
     def close_connection(self):
         if self.session:
-            try:
-                self.session.close()
-                print("Session closed successfully")
-            except Exception as e:
-                print(f"Error occurred while closing the session: {e}")
+            self.pool.release(self.session)
+            self.session = None
+            print("Session returned to the pool")
         else:
             print("No active sessions to close")
 
 
-__all__ = ["SnowflakeConnector"]
+@shared_resource(close=lambda connector: connector.pool.close())
+def get_connector():
+    """Returns one SnowflakeConnector for the whole process (e.g. every Streamlit session)."""
+    return SnowflakeConnector()
+
+
+@on_settings_reload
+def _rotate_shared_credentials(settings):
+    # Connectors keep their pool, so point the shared pool at the rotated credentials.
+    connector = get_connector.peek()
+    if connector is None or settings.missing(*REQUIRED_ENV_VARS):
+        return
+    connector.connection_parameters = _connection_parameters(settings)
+    connector.pool.update_parameters(connector.connection_parameters)
+
+
+__all__ = ["SnowflakeConnector", "SessionPool", "get_connector", "get_pool"]
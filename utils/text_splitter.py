@@ -0,0 +1,109 @@
+import re
+from collections import deque
+
+"""
+TextSplitter Class:
+
+A dependency-free replacement for LangChain's `RecursiveCharacterTextSplitter` as used by
+`DocumentProcessor`. It produces the same chunks for the same `chunk_size`/`chunk_overlap`
+(default separators, `keep_separator=True`, `strip_whitespace=True`, `len` as the length
+function), without importing LangChain on the ingestion path.
+
+The separators are plain strings, so splitting uses `str.split` instead of compiling a regex
+per call, and the merge step keeps its window in a deque instead of re-slicing a list.
+
+Functions:
+    clean_chunk(text):
+        Removes every character that is not a letter, digit or whitespace with one precompiled
+        regex and collapses whitespace runs with `str.split`. Equivalent to the two `re.sub`
+        calls previously made by `DocumentProcessor.clean_text`.
+"""
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ", "")
+
+_UNWANTED_CHARS = re.compile(r"[^a-zA-Z0-9\s]+")
+
+
+def clean_chunk(text):
+    # str.split() splits on the same Unicode whitespace as \s and drops the ends,
+    # so joining on one space matches re.sub(r"\s+", " ", ...).strip().
+    return " ".join(_UNWANTED_CHARS.sub("", text).split())
+
+
+class TextSplitter:
+    def __init__(self, chunk_size=700, chunk_overlap=50, separators=DEFAULT_SEPARATORS):
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"Got a larger chunk overlap ({chunk_overlap}) than chunk size ({chunk_size}), should be smaller."
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = tuple(separators)
+
+    @staticmethod
+    def _split_keeping_separator(text, separator):
+        if not separator:
+            return list(text)
+        pieces = text.split(separator)
+        # Separators stay attached to the start of the following piece.
+        splits = [pieces[0]] + [separator + piece for piece in pieces[1:]]
+        return [s for s in splits if s]
+
+    def _merge_splits(self, splits):
+        docs = []
+        current_doc = deque()
+        total = 0
+        for d in splits:
+            _len = len(d)
+            if total + _len > self.chunk_size and current_doc:
+                doc = "".join(current_doc).strip()
+                if doc:
+                    docs.append(doc)
+                while total > self.chunk_overlap or (total + _len > self.chunk_size and total > 0):
+                    total -= len(current_doc.popleft())
+            current_doc.append(d)
+            total += _len
+        doc = "".join(current_doc).strip()
+        if doc:
+            docs.append(doc)
+        return docs
+
+    def _split_text(self, text, separators):
+        final_chunks = []
+        separator = separators[-1]
+        new_separators = ()
+        for i, _s in enumerate(separators):
+            if _s == "":
+                separator = _s
+                break
+            if _s in text:
+                separator = _s
+                new_separators = separators[i + 1:]
+                break
+
+        good_splits = []
+        for s in self._split_keeping_separator(text, separator):
+            if len(s) < self.chunk_size:
+                good_splits.append(s)
+                continue
+            if good_splits:
+                final_chunks.extend(self._merge_splits(good_splits))
+                good_splits = []
+            if not new_separators:
+                final_chunks.append(s)
+            else:
+                final_chunks.extend(self._split_text(s, new_separators))
+        if good_splits:
+            final_chunks.extend(self._merge_splits(good_splits))
+        return final_chunks
+
+    def split_text(self, text):
+        return self._split_text(text, self.separators)
+
+    def split_and_clean(self, text):
+        """Splits `text` and yields each chunk cleaned with `clean_chunk`."""
+        for chunk in self._split_text(text, self.separators):
+            yield clean_chunk(chunk)
+
+
+__all__ = ["TextSplitter", "clean_chunk"]
@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from utils.secret_loader import get_settings
+from utils.resources import shared_resource
+
+"""
+Request tracing
+
+A small in-process tracer for the RAG pipeline. A chat turn is one trace with a request id, and
+each stage (service handle lookup, search, prompt build, completion, summary) is a span with its
+duration and attributes such as token counts and cache hits:
+
+    with tracer.trace("rag.query") as root:
+        with tracer.span("search", service=service_id) as span:
+            ...
+            span.set(cache_hit=False, results=5)
+
+The current span is kept in a context variable, so nested spans find their parent. Work handed to
+a thread pool keeps its parent when submitted through `contextvars.copy_context().run`.
+
+Finished spans go to an exporter:
+
+    LogExporter: one line per span on stderr.
+    PrometheusExporter: per-stage latency histograms and token / cache / error counters in the
+        Prometheus text format, from `render()` or an HTTP endpoint (`serve(port)`).
+    OTelJSONExporter: OpenTelemetry (OTLP/JSON) `resourceSpans` documents, one line per span.
+
+TRACING selects exporters, comma separated ("log", "prometheus", "otel"). It is off when unset.
+While disabled, `span` and `trace` return a shared no-op span, so instrumented code only pays
+for one attribute check. TRACING_PROMETHEUS_PORT serves the metrics over HTTP and
+TRACING_OTEL_PATH names the OTLP/JSON file (default traces.jsonl).
+"""
+
+_current_span = contextvars.ContextVar("termify_current_span", default=None)
+
+
+def _new_id(size):
+    return os.urandom(size).hex()
+
+
+class _NoopSpan:
+    trace_id = None
+    span_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else _new_id(16)
+        self.span_id = _new_id(8)
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.error = None
+        self.start_ns = None
+        self.end_ns = None
+        self._token = None
+
+    @property
+    def duration(self):
+        """Duration in seconds, once the span has ended."""
+        return (self.end_ns - self.start_ns) / 1e9 if self.end_ns else None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            self.status = "error"
+            self.error = f"{exc_type.__name__}: {exc}"
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Ended in another context, e.g. a generator closed by a different caller.
+            pass
+        self.tracer._export(self)
+        return False
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration": self.duration,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    def __init__(self, exporters=(), enabled=True):
+        self.exporters = list(exporters)
+        self.enabled = enabled and bool(self.exporters)
+
+    def trace(self, name, request_id=None, **attributes):
+        """Starts a new trace (a root span); its trace id is the request id."""
+        if not self.enabled:
+            return NOOP_SPAN
+        span = Span(self, name, attributes=attributes)
+        if request_id:
+            span.trace_id = request_id
+        return span
+
+    def span(self, name, **attributes):
+        """Starts a child of the current span, or a new trace when there is none."""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, _current_span.get(), attributes)
+
+    @staticmethod
+    def current():
+        return _current_span.get() or NOOP_SPAN
+
+    def _export(self, span):
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as err:
+                print(f"Could not export span {span.name}: {err}")
+
+    def close(self):
+        for exporter in self.exporters:
+            close = getattr(exporter, "close", None)
+            if close:
+                close()
+
+
+class LogExporter:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+        line = (
+            f"trace={span.trace_id} span={span.name} duration_ms={span.duration * 1000:.1f} "
+            f"status={span.status} {attributes}"
+        ).rstrip()
+        if span.error:
+            line += f' error="{span.error}"'
+        with self._lock:
+            print(line, file=self.stream, flush=True)
+
+
+class PrometheusExporter:
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, namespace="termify"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        # stage -> [bucket counts..., sum, count]
+        self._latency = {}
+        self._errors = {}
+        self._tokens = {}
+        self._cache = {}
+        self._server = None
+
+    def export(self, span):
+        duration = span.duration
+        with self._lock:
+            histogram = self._latency.setdefault(span.name, [0] * len(self.BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(self.BUCKETS):
+                if duration <= bound:
+                    histogram[i] += 1
+            histogram[-2] += duration
+            histogram[-1] += 1
+            if span.status == "error":
+                self._errors[span.name] = self._errors.get(span.name, 0) + 1
+            for kind in ("prompt_tokens", "completion_tokens"):
+                if span.attributes.get(kind):
+                    key = (span.name, kind.split("_")[0])
+                    self._tokens[key] = self._tokens.get(key, 0) + span.attributes[kind]
+            if "cache_hit" in span.attributes:
+                key = (span.name, "hit" if span.attributes["cache_hit"] else "miss")
+                self._cache[key] = self._cache.get(key, 0) + 1
+
+    def render(self):
+        ns = self.namespace
+        lines = [
+            f"# HELP {ns}_stage_seconds Duration of RAG pipeline stages.",
+            f"# TYPE {ns}_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._latency.items()):
+                for bound, count in zip(self.BUCKETS, histogram):
+                    lines.append(f'{ns}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{ns}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram[-1]}')
+                lines.append(f'{ns}_stage_seconds_sum{{stage="{stage}"}} {histogram[-2]}')
+                lines.append(f'{ns}_stage_seconds_count{{stage="{stage}"}} {histogram[-1]}')
+            lines += [f"# HELP {ns}_stage_errors_total Failed RAG pipeline stages.", f"# TYPE {ns}_stage_errors_total counter"]
+            lines += [f'{ns}_stage_errors_total{{stage="{stage}"}} {n}' for stage, n in sorted(self._errors.items())]
+            lines += [f"# HELP {ns}_tokens_total Estimated prompt and completion tokens.", f"# TYPE {ns}_tokens_total counter"]
+            lines += [
+                f'{ns}_tokens_total{{stage="{stage}",kind="{kind}"}} {n}' for (stage, kind), n in sorted(self._tokens.items())
+            ]
+            lines += [f"# HELP {ns}_cache_lookups_total Cache lookups by result.", f"# TYPE {ns}_cache_lookups_total counter"]
+            lines += [
+                f'{ns}_cache_lookups_total{{stage="{stage}",result="{result}"}} {n}'
+                for (stage, result), n in sorted(self._cache.items())
+            ]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="0.0.0.0"):
+        """Serves `render()` at http://host:port/metrics from a daemon thread."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="prometheus-exporter", daemon=True).start()
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+def _otel_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTelJSONExporter:
+    def __init__(self, path="traces.jsonl", service_name="termify"):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def to_otlp(self, span):
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "termify.tracing"},
+                    "spans": [{
+                        "traceId": span.trace_id,
+                        "spanId": span.span_id,
+                        "parentSpanId": span.parent_id or "",
+                        "name": span.name,
+                        "kind": 1,
+                        "startTimeUnixNano": str(span.start_ns),
+                        "endTimeUnixNano": str(span.end_ns),
+                        "attributes": [
+                            {"key": key, "value": _otel_value(value)}
+                            for key, value in span.attributes.items() if value is not None
+                        ],
+                        "status": {"code": 2, "message": span.error} if span.status == "error" else {"code": 1},
+                    }],
+                }],
+            }]
+        }
+
+    def export(self, span):
+        line = json.dumps(self.to_otlp(span))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+@shared_resource(close=lambda tracer: tracer.close())
+def get_tracer():
+    """Returns the process-wide Tracer configured by TRACING; a disabled one when it is unset."""
+    settings = get_settings()
+    exporters = []
+    for name in filter(None, (part.strip().lower() for part in (settings.get("TRACING") or "").split(","))):
+        try:
+            if name == "log":
+                exporters.append(LogExporter())
+            elif name == "prometheus":
+                exporter = PrometheusExporter()
+                port = settings.get("TRACING_PROMETHEUS_PORT")
+                if port:
+                    exporter.serve(int(port))
+                exporters.append(exporter)
+            elif name == "otel":
+                exporters.append(OTelJSONExporter(settings.get("TRACING_OTEL_PATH") or "traces.jsonl"))
+            else:
+                print(f"Unknown TRACING exporter '{name}', ignoring it")
+        except (OSError, ValueError) as e:
+            print(f"Could not start the {name} trace exporter: {e}")
+    return Tracer(exporters)
+
+
+__all__ = [
+    "Tracer",
+    "Span",
+    "NOOP_SPAN",
+    "LogExporter",
+    "PrometheusExporter",
+    "OTelJSONExporter",
+    "get_tracer",
+]